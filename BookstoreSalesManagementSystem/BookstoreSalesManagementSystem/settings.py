@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'catalog.cart_store.CartStoreMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +82,35 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookstore',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Book 读穿透缓存使用的缓存别名与过期时间（秒）；多进程部署时应指向共享缓存
+BOOK_CACHE_ALIAS = 'default'
+BOOK_CACHE_TIMEOUT = 300
+
+# 购物车库存预留的有效期（秒），过期未结算的预留会退回库存
+STOCK_RESERVATION_TTL = 30 * 60
+# 访客购物车存储后端：SessionCartStore / SignedCookieCartStore / CacheCartStore
+CART_STORE_BACKEND = 'catalog.cart_store.SignedCookieCartStore'
+# CacheCartStore 使用的缓存别名，多进程部署时应指向共享缓存（Redis、Memcached 等）
+CART_STORE_CACHE_ALIAS = 'default'
+CART_COOKIE_NAME = 'cart'
+CART_COOKIE_AGE = 14 * 24 * 3600
+# 匿名购物车超过该秒数没有新增商品即由 reap_carts 命令删除
+ANONYMOUS_CART_MAX_AGE = 7 * 24 * 3600
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -123,4 +153,16 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# 书籍全文检索（SQLite FTS5）单次查询返回的最大结果数
+BOOK_SEARCH_MAX_RESULTS = 200
+
+# 书名/作者的内存模糊与拼音检索（拼音需要安装 pypinyin）
+FUZZY_SEARCH_ENABLED = True
+# 相似度阈值：查询 n-gram 中至少有这一比例出现在书名或作者中
+FUZZY_SEARCH_MIN_SIMILARITY = 0.5
+# 每个进程的索引超过该秒数后重新从数据库加载，以包含其他进程的修改
+FUZZY_INDEX_MAX_AGE = 600
+# 搜索联想的内存前缀索引同样定期重新加载
+AUTOCOMPLETE_INDEX_MAX_AGE = 600
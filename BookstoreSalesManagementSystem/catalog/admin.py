@@ -1,8 +1,21 @@
 from django.contrib import admin
-from .models import Book, Customer, Order, OrderItem
+from .models import Book, Customer, DailyBookSales, Order, OrderItem, StockReservation
 
 # Register your models here.
-admin.site.register(Customer)
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'vip_status', 'paid_order_count', 'lifetime_spend')
+    readonly_fields = ('paid_order_count', 'lifetime_spend')
+
+    def save_model(self, request, obj, form, change):
+        # 修改时只写回有变化的字段，避免用打开页面时读到的旧累计值覆盖期间新增的订单；
+        # 主键 user 不能出现在 update_fields 中
+        if not change:
+            obj.save()
+            return
+        update_fields = [field for field in form.changed_data if field != 'user']
+        if update_fields:
+            obj.save(update_fields=update_fields)
 
 
 @admin.register(Book)
@@ -20,3 +33,15 @@ class OrderAdmin(admin.ModelAdmin):
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('order_item_id', 'book', 'count', 'order_id')
     list_filter = ('order_id',)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('reservation_id', 'book', 'quantity', 'holder_key', 'expires_at')
+    list_filter = ('expires_at',)
+
+
+@admin.register(DailyBookSales)
+class DailyBookSalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'book', 'quantity', 'revenue', 'discount')
+    list_filter = ('date',)
@@ -0,0 +1,298 @@
+# analytics.py
+# 基于 NumPy 的销售分析：把一段时间内已支付订单的销售按块读入列式数组，
+# 汇总成“书籍 × 天”的销量/销售额矩阵，再用向量化运算计算每本书的
+# 销售速度、移动平均、ABC（帕累托）分类和周环比增长，以及全目录的需求预测和补货点。
+# 数据源可以是订单项（OrderItem，逐条读取）或每日销售汇总（DailyBookSales，已按天聚合，更快）。
+from datetime import timedelta
+from itertools import islice
+from statistics import NormalDist
+
+import numpy as np
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Book, DailyBookSales, OrderItem
+
+CHUNK_SIZE = 5000
+ABC_THRESHOLDS = (0.8, 0.95)  # 累计销售额占比：前 80% 为 A 类，80%~95% 为 B 类，其余为 C 类
+SOURCES = ('items', 'rollup')
+
+
+def _item_rows(start_date, end_date):
+    """已支付订单项：(本地日期, isbn, 数量, 单价)"""
+    tz = timezone.get_current_timezone()
+    return OrderItem.objects.filter(order__status='P') \
+        .annotate(day=TruncDate('order__order_date', tzinfo=tz)) \
+        .filter(day__gte=start_date, day__lte=end_date) \
+        .values_list('day', 'book_id', 'count', 'price') \
+        .order_by()
+
+
+def _rollup_rows(start_date, end_date):
+    """每日销售汇总：(日期, isbn, 数量, 销售额)"""
+    return DailyBookSales.objects.filter(date__gte=start_date, date__lte=end_date, quantity__gt=0) \
+        .values_list('date', 'book_id', 'quantity', 'revenue') \
+        .order_by()
+
+
+def load_columns(start_date, end_date, source='items', chunk_size=CHUNK_SIZE):
+    """
+    按块读取 [start_date, end_date] 的销售，返回 (isbns, 书籍编号列, 日序号列, 数量列, 销售额列)。
+    isbns 为 ISBN 数组，书籍编号列中的值是它的下标；日序号从 start_date 起为 0。
+    """
+    if source not in SOURCES:
+        raise ValueError(f'unknown source {source!r}')
+    queryset = (_item_rows if source == 'items' else _rollup_rows)(start_date, end_date)
+    rows = queryset.iterator(chunk_size=chunk_size)
+    first_ordinal = start_date.toordinal()
+    codes = {}
+    book_parts, day_parts, quantity_parts, revenue_parts = [], [], [], []
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        days, isbns, quantities, amounts = zip(*chunk)
+        book_parts.append(np.fromiter((codes.setdefault(isbn, len(codes)) for isbn in isbns), np.int64, len(chunk)))
+        day_parts.append(np.fromiter((day.toordinal() for day in days), np.int64, len(chunk)) - first_ordinal)
+        quantity = np.fromiter(quantities, np.int64, len(chunk))
+        amount = np.fromiter(amounts, np.float64, len(chunk))
+        quantity_parts.append(quantity)
+        # 订单项给出的是单价，汇总表给出的已是销售额
+        revenue_parts.append(amount * quantity if source == 'items' else amount)
+
+    isbns = np.array(list(codes), dtype=object)
+    if not book_parts:
+        empty = np.zeros(0, np.int64)
+        return isbns, empty, empty, empty, np.zeros(0, np.float64)
+    return (isbns, np.concatenate(book_parts), np.concatenate(day_parts),
+            np.concatenate(quantity_parts), np.concatenate(revenue_parts))
+
+
+class SalesMatrix:
+    """
+    quantity / revenue 为形状 (书籍数, 天数) 的矩阵，第 j 列对应 start_date + j 天。
+    所有指标按行（每本书）向量化计算，返回与 isbns 对齐的数组。
+    """
+
+    def __init__(self, isbns, start_date, quantity, revenue):
+        self.isbns = isbns
+        self.start_date = start_date
+        self.quantity = quantity
+        self.revenue = revenue
+
+    @classmethod
+    def load(cls, start_date, end_date, source='items', chunk_size=CHUNK_SIZE):
+        isbns, books, days, quantities, revenues = load_columns(start_date, end_date, source, chunk_size)
+        n_books, n_days = len(isbns), (end_date - start_date).days + 1
+        flat = books * n_days + days
+        size = n_books * n_days
+        quantity = np.bincount(flat, weights=quantities, minlength=size).astype(np.int64).reshape(n_books, n_days)
+        revenue = np.bincount(flat, weights=revenues, minlength=size).reshape(n_books, n_days)
+        order = np.argsort(isbns, kind='stable')  # 按 ISBN 排列行，销售额相同的书籍排序结果稳定
+        return cls(isbns[order], start_date, quantity[order], revenue[order])
+
+    @property
+    def n_days(self):
+        return self.quantity.shape[1]
+
+    @property
+    def end_date(self):
+        return self.start_date + timedelta(days=self.n_days - 1)
+
+    def total_quantity(self):
+        return self.quantity.sum(axis=1)
+
+    def total_revenue(self):
+        return self.revenue.sum(axis=1)
+
+    def velocity(self, days=None):
+        """最近 days 天（默认整个区间）平均每天的销量"""
+        days = min(days or self.n_days, self.n_days)
+        return self.quantity[:, -days:].sum(axis=1) / days
+
+    def moving_average(self, window=7):
+        """每天的 window 日滑动平均销量，形状与 quantity 相同；不足 window 天的前几列按已有天数平均"""
+        cumulative = np.cumsum(self.quantity, axis=1, dtype=np.float64)
+        shifted = np.zeros_like(cumulative)
+        shifted[:, window:] = cumulative[:, :-window] if window < self.n_days else 0
+        counts = np.minimum(np.arange(1, self.n_days + 1), window)
+        return (cumulative - shifted) / counts
+
+    def abc_classes(self, thresholds=ABC_THRESHOLDS):
+        """按销售额的帕累托分类：返回 'A' / 'B' / 'C' 数组；在累计占比达到阈值之前开始的书籍归入较高的一类"""
+        revenue = self.total_revenue()
+        classes = np.full(len(revenue), 'C', dtype='<U1')
+        total = revenue.sum()
+        if total <= 0:
+            return classes
+        order = np.argsort(-revenue, kind='stable')
+        share_before = (np.cumsum(revenue[order]) - revenue[order]) / total
+        ranked = np.where(share_before < thresholds[0], 'A', np.where(share_before < thresholds[1], 'B', 'C'))
+        classes[order] = ranked
+        classes[revenue <= 0] = 'C'
+        return classes
+
+    def week_over_week(self):
+        """最近 7 天相对再往前 7 天的销量增长率；前一周没有销量时为 NaN"""
+        last_week = self.quantity[:, -7:].sum(axis=1)
+        previous_week = self.quantity[:, -14:-7].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = (last_week - previous_week) / previous_week
+        return np.where(previous_week > 0, growth, np.nan)
+
+    def summary(self, window=7, top_n=None):
+        """
+        每本书一条指标，按销售额降序；返回字典列表（含书名），可直接用于报告输出。
+        top_n 只影响返回的条数，ABC 分类始终基于全部书籍。
+        """
+        revenue = self.total_revenue()
+        quantity = self.total_quantity()
+        classes = self.abc_classes()
+        velocity = self.velocity()
+        recent_average = self.moving_average(window)[:, -1] if self.n_days else np.zeros(len(self.isbns))
+        growth = self.week_over_week()
+
+        order = np.argsort(-revenue, kind='stable')[:top_n]
+        titles = dict(Book.objects.filter(isbn__in=list(self.isbns[order])).values_list('isbn', 'title'))
+        return [
+            {
+                'isbn': self.isbns[i],
+                'title': titles.get(self.isbns[i]),
+                'abc_class': str(classes[i]),
+                'quantity': int(quantity[i]),
+                'revenue': round(float(revenue[i]), 2),
+                'velocity': round(float(velocity[i]), 3),
+                'moving_average': round(float(recent_average[i]), 3),
+                'week_over_week': None if np.isnan(growth[i]) else round(float(growth[i]), 4),
+            }
+            for i in order
+        ]
+
+
+def summarize_with_orm(start_date, end_date, window=7, top_n=None):
+    """
+    与 SalesMatrix.summary 相同的指标，只用 ORM 分组查询和 Python 计算（用于基准对比和核对结果）。
+    每个指标一条按书籍分组的查询。
+    """
+    n_days = (end_date - start_date).days + 1
+    items = OrderItem.objects.filter(order__status='P') \
+        .annotate(day=TruncDate('order__order_date', tzinfo=timezone.get_current_timezone())) \
+        .filter(day__gte=start_date, day__lte=end_date)
+
+    def grouped(queryset, **aggregates):
+        return {row['book_id']: row for row in queryset.values('book_id').annotate(**aggregates).order_by()}
+
+    totals = grouped(items, quantity=Sum('count'), revenue=Sum(F('count') * F('price')))
+    last_week = grouped(items.filter(day__gt=end_date - timedelta(days=7)), quantity=Sum('count'))
+    previous_week = grouped(items.filter(day__gt=end_date - timedelta(days=14), day__lte=end_date - timedelta(days=7)),
+                            quantity=Sum('count'))
+    recent = grouped(items.filter(day__gt=end_date - timedelta(days=window)), quantity=Sum('count'))
+
+    ranked = sorted(totals.items(), key=lambda item: (-float(item[1]['revenue']), item[0]))
+    grand_total = sum(float(row['revenue']) for _, row in ranked)
+    titles = dict(Book.objects.filter(isbn__in=[isbn for isbn, _ in ranked[:top_n]]).values_list('isbn', 'title'))
+    rows = []
+    cumulative = 0.0
+    for isbn, row in ranked:
+        revenue = float(row['revenue'])
+        share_before = cumulative / grand_total if grand_total else 1
+        cumulative += revenue
+        abc_class = 'C' if revenue <= 0 else 'A' if share_before < ABC_THRESHOLDS[0] else \
+            'B' if share_before < ABC_THRESHOLDS[1] else 'C'
+        if top_n is not None and len(rows) >= top_n:
+            continue
+        previous = previous_week.get(isbn, {}).get('quantity') or 0
+        last = last_week.get(isbn, {}).get('quantity') or 0
+        rows.append({
+            'isbn': isbn,
+            'title': titles.get(isbn),
+            'abc_class': abc_class,
+            'quantity': row['quantity'],
+            'revenue': round(revenue, 2),
+            'velocity': round(row['quantity'] / n_days, 3),
+            'moving_average': round((recent.get(isbn, {}).get('quantity') or 0) / min(window, n_days), 3),
+            'week_over_week': round((last - previous) / previous, 4) if previous else None,
+        })
+    return rows
+
+
+# --- 需求预测与补货点 ---
+
+def exponential_smoothing(series, alpha=0.3):
+    """
+    对 series（形状 (书籍数, 天数)）的每一行做简单指数平滑，所有书籍一起按天向量化迭代。
+    返回 (下一天的需求预测, 一步预测误差的标准差)，均为长度为书籍数的数组。
+    初始值取第一周的平均需求。
+    """
+    n_books, n_days = series.shape
+    if n_days == 0:
+        return np.zeros(n_books), np.zeros(n_books)
+    series = series.astype(np.float64, copy=False)
+    level = series[:, :min(7, n_days)].mean(axis=1)
+    squared_error = np.zeros(n_books)
+    for t in range(n_days):
+        error = series[:, t] - level
+        squared_error += error * error
+        level += alpha * error
+    return level, np.sqrt(squared_error / n_days)
+
+
+def load_stock(chunk_size=CHUNK_SIZE):
+    """按块读取全部书籍的库存，返回按 ISBN 排序的 (isbns, stock) 数组"""
+    isbn_parts, stock_parts = [], []
+    rows = Book.objects.values_list('isbn', 'stock').order_by().iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        isbns, stocks = zip(*chunk)
+        isbn_parts.append(np.array(isbns, dtype='U13'))
+        stock_parts.append(np.fromiter(stocks, np.int64, len(chunk)))
+    if not isbn_parts:
+        return np.zeros(0, dtype='U13'), np.zeros(0, np.int64)
+    isbns, stock = np.concatenate(isbn_parts), np.concatenate(stock_parts)
+    order = np.argsort(isbns, kind='stable')  # 与 NumPy 的字符串顺序保持一致，供 searchsorted 使用
+    return isbns[order], stock[order]
+
+
+def replenishment_plan(matrix, catalog_isbns, stock, alpha=0.3, lead_time=7, review_days=14, service_level=0.95):
+    """
+    为整个目录（catalog_isbns / stock，按 ISBN 排序）一次算出补货参数，返回与 catalog_isbns 对齐的数组字典：
+      forecast      —— 日需求预测（指数平滑）
+      demand_std    —— 日需求波动（一步预测误差的标准差）
+      safety_stock  —— z × σ × √提前期
+      reorder_point —— 提前期内的预测需求 + 安全库存，库存不高于此值时需要补货
+      order_up_to   —— 补货目标：再覆盖一个盘点周期的需求
+      suggested     —— 建议补货量（库存高于补货点时为 0）
+      days_of_cover —— 现有库存按预测还能卖多少天（无需求时为 inf）
+    没有销售记录的书籍预测为 0，不会进入补货清单。
+    """
+    z = NormalDist().inv_cdf(service_level)
+    forecast = np.zeros(len(catalog_isbns))
+    demand_std = np.zeros(len(catalog_isbns))
+    if len(matrix.isbns) and len(catalog_isbns):
+        sold_forecast, sold_std = exponential_smoothing(matrix.quantity, alpha)
+        # 把有销量的书籍对齐到目录位置；已从目录删除的书籍忽略
+        sold_isbns = matrix.isbns.astype('U13')
+        positions = np.clip(np.searchsorted(catalog_isbns, sold_isbns), 0, len(catalog_isbns) - 1)
+        found = catalog_isbns[positions] == sold_isbns
+        forecast[positions[found]] = sold_forecast[found]
+        demand_std[positions[found]] = sold_std[found]
+
+    safety_stock = z * demand_std * np.sqrt(lead_time)
+    reorder_point = forecast * lead_time + safety_stock
+    order_up_to = reorder_point + forecast * review_days
+    needs_order = (forecast > 0) & (stock <= reorder_point)
+    suggested = np.where(needs_order, np.ceil(np.maximum(order_up_to - stock, 0)), 0).astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(forecast > 0, np.maximum(stock, 0) / forecast, np.inf)
+    return {
+        'forecast': forecast,
+        'demand_std': demand_std,
+        'safety_stock': safety_stock,
+        'reorder_point': reorder_point,
+        'order_up_to': order_up_to,
+        'suggested': suggested,
+        'days_of_cover': days_of_cover,
+    }
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        # 注册模型信号（缓存失效、销售汇总等）
+        from . import search, signals  # noqa: F401
+        # 修改 Book 表结构的迁移在 SQLite 上会重建表，全文索引的触发器随之丢失，迁移后补建
+        post_migrate.connect(search.ensure_index, sender=self, dispatch_uid='catalog_ensure_search_index')
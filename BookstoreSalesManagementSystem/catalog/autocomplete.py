@@ -0,0 +1,153 @@
+# autocomplete.py
+# 搜索框联想：每个进程在内存中维护一个按键排序的数组（书名、作者、ISBN，以及书名的全拼/首字母），
+# 用 bisect 定位前缀后顺序扫描，不访问数据库。首次请求时加载，之后由 signals.py 在提交后增量更新，
+# 过期后在后台重建（见 memory_index.py）。
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .fuzzy import normalize, pinyin_forms
+from .memory_index import IndexHolder
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+DEFAULT_MAX_AGE = 600
+
+# 每次查询最多检查的候选条目数，保证热门前缀（如单个常用字）也能在固定时间内返回
+MAX_SCAN = 500
+
+
+class PrefixIndex:
+    """
+    两个平行数组：_keys 是规范化后的检索键（有序），_entries 是对应的 (类型, 显示文本, isbn)。
+    同一本书的所有条目记录在 _entries_by_isbn 中，便于更新和删除。
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._entries = []
+        self._entries_by_isbn = {}
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries_by_isbn)
+
+    @staticmethod
+    def _entries_for(isbn, title, author):
+        entries = []
+        title_key = normalize(title)
+        if title_key:
+            entries.append((title_key, ('title', title, isbn)))
+            for form in pinyin_forms(title_key):
+                entries.append((form, ('title', title, isbn)))
+        author_key = normalize(author)
+        if author_key:
+            entries.append((author_key, ('author', author, None)))
+        entries.append((isbn, ('isbn', isbn, isbn)))
+        return entries
+
+    def _insert_locked(self, key, entry):
+        position = bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._entries.insert(position, entry)
+
+    def _delete_locked(self, key, entry):
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._entries[position] == entry:
+                del self._keys[position]
+                del self._entries[position]
+                return
+            position += 1
+
+    def _remove_locked(self, isbn):
+        for key, entry in self._entries_by_isbn.pop(isbn, ()):
+            self._delete_locked(key, entry)
+
+    def load(self, rows):
+        """一次性装载 (isbn, title, author)，排序一次，比逐条插入快得多"""
+        pairs = []
+        with self._lock:
+            for isbn, title, author in rows:
+                entries = self._entries_for(isbn, title, author)
+                self._entries_by_isbn[isbn] = entries
+                pairs.extend(entries)
+            pairs.sort(key=lambda pair: pair[0])
+            self._keys = [key for key, _ in pairs]
+            self._entries = [entry for _, entry in pairs]
+
+    def add(self, isbn, title, author):
+        entries = self._entries_for(isbn, title, author)
+        with self._lock:
+            self._remove_locked(isbn)
+            self._entries_by_isbn[isbn] = entries
+            for key, entry in entries:
+                self._insert_locked(key, entry)
+
+    def remove(self, isbn):
+        with self._lock:
+            self._remove_locked(isbn)
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """返回以 prefix 开头的前 limit 条不重复联想"""
+        prefix = normalize(prefix).strip()
+        if not prefix:
+            return []
+        suggestions = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._keys, prefix)
+            end = min(position + MAX_SCAN, len(self._keys))
+            while position < end and self._keys[position].startswith(prefix):
+                kind, text, isbn = self._entries[position]
+                if (kind, text) not in seen:
+                    seen.add((kind, text))
+                    suggestions.append({'type': kind, 'text': text, 'isbn': isbn})
+                    if len(suggestions) >= limit:
+                        break
+                position += 1
+        return suggestions
+
+
+def build_index():
+    from .models import Book
+
+    index = PrefixIndex()
+    index.load(Book.objects.values_list('isbn', 'title', 'author').iterator(chunk_size=2000))
+    return index
+
+
+_holder = IndexHolder('autocomplete', build_index, 'AUTOCOMPLETE_INDEX_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def get_index():
+    """返回本进程的索引；超过 AUTOCOMPLETE_INDEX_MAX_AGE 秒后在后台重新加载"""
+    return _holder.get()
+
+
+def get_loaded_index():
+    """已加载的索引；尚未加载时返回 None"""
+    return _holder.loaded()
+
+
+def reset_index():
+    _holder.reset()
+
+
+def rebuild_index():
+    _holder.rebuild()
+
+
+def add_book(isbn, title, author):
+    _holder.add(isbn, title, author)
+
+
+def remove_book(isbn):
+    _holder.remove(isbn)
+
+
+def suggest(prefix, limit=DEFAULT_LIMIT):
+    return get_index().suggest(prefix, limit=min(max(limit, 1), MAX_LIMIT))
@@ -0,0 +1,82 @@
+# book_cache.py
+# Book 的读穿透缓存：购物车/结算页面按 ISBN 批量取书时先查缓存，未命中的一次性用 in_bulk 从数据库补齐。
+# 缓存后端由 settings.BOOK_CACHE_ALIAS 指定（默认本地内存，可换成 Redis/Memcached 等共享缓存）。
+# 键里带有“代号”，bump_generation() 可使全部条目一次失效；单本书在保存/删除时由 signals.py 失效。
+# 注意：缓存中的 stock 只用于展示，扣减库存等写操作必须以数据库为准。
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Book
+
+GENERATION_KEY = 'book-cache:generation'
+DEFAULT_TIMEOUT = 300
+
+
+def _cache():
+    return caches[getattr(settings, 'BOOK_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'BOOK_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _new_generation():
+    # 用时间戳而不是从 1 开始：代号键被淘汰后重新生成时，旧条目不会“复活”
+    return time.time_ns()
+
+
+def _generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = _new_generation()
+        cache.add(GENERATION_KEY, generation, timeout=None)
+        generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def _key(generation, isbn):
+    return f'book-cache:{generation}:{isbn}'
+
+
+def get_many(isbns):
+    """返回 {isbn: Book}，不存在的 ISBN 不会出现在结果中"""
+    isbns = list(dict.fromkeys(isbns))
+    if not isbns:
+        return {}
+    cache = _cache()
+    generation = _generation(cache)
+    keys = {_key(generation, isbn): isbn for isbn in isbns}
+
+    books = {keys[key]: book for key, book in cache.get_many(list(keys)).items()}
+    missing = [isbn for isbn in isbns if isbn not in books]
+    if missing:
+        loaded = Book.objects.in_bulk(missing)
+        if loaded:
+            cache.set_many({_key(generation, isbn): book for isbn, book in loaded.items()}, timeout=_timeout())
+        books.update(loaded)
+    return books
+
+
+def get_book(isbn):
+    """单本读取，不存在时与 Book.objects.get 一样抛出 Book.DoesNotExist"""
+    book = get_many([isbn]).get(isbn)
+    if book is None:
+        raise Book.DoesNotExist(f'Book matching ISBN {isbn} does not exist.')
+    return book
+
+
+def invalidate(isbns):
+    isbns = list(isbns)
+    if not isbns:
+        return
+    cache = _cache()
+    generation = _generation(cache)
+    cache.delete_many([_key(generation, isbn) for isbn in isbns])
+
+
+def bump_generation():
+    """让所有缓存条目失效（例如批量导入或绕过 save() 的批量更新之后）"""
+    cache = _cache()
+    cache.set(GENERATION_KEY, _new_generation(), timeout=None)
@@ -0,0 +1,192 @@
+# cart_store.py
+# 访客购物车（{isbn: {'quantity': n}}）的存储后端，由 settings.CART_STORE_BACKEND 选择：
+#   SessionCartStore      —— 存在 request.session 中（数据库 session 时每次修改都会 UPDATE django_session）
+#   SignedCookieCartStore —— 紧凑编码后签名写入 cookie，服务器端不做任何写入
+#   CacheCartStore        —— 存在缓存中（本地内存仅适合单进程，多进程请配置共享缓存），cookie 中只放随机令牌
+# CartStoreMiddleware 为每个请求创建 request.cart_store，并在响应阶段写回 cookie。
+# cookie 的签名绑定 session 中的库存预留令牌（inventory.SESSION_KEY）：登出清空 session 后，
+# 浏览器中残留或被复制到其他 session 的购物车 cookie 都会被忽略，不会合并进下一个登录用户的购物车。
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from . import inventory
+
+DEFAULT_BACKEND = 'catalog.cart_store.SignedCookieCartStore'
+DEFAULT_COOKIE_AGE = 14 * 24 * 3600
+
+
+def _cookie_age():
+    return getattr(settings, 'CART_COOKIE_AGE', DEFAULT_COOKIE_AGE)
+
+
+def _set_cookie(response, name, value):
+    response.set_cookie(
+        name,
+        value,
+        max_age=_cookie_age(),
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+def _session_signer(request, salt, create=False):
+    """以 session 中的预留令牌作为签名 salt 的一部分；session 中没有令牌且 create=False 时返回 None"""
+    holder_key = inventory.get_holder_key(request, create=create)
+    if holder_key is None:
+        return None
+    return signing.Signer(salt=f'{salt}:{holder_key}')
+
+
+def _unsign(request, salt, value):
+    """校验 cookie 值；签名无效或不属于当前 session 时返回 None"""
+    signer = _session_signer(request, salt)
+    if not value or signer is None:
+        return None
+    try:
+        return signer.unsign(value)
+    except signing.BadSignature:
+        return None
+
+
+class BaseCartStore:
+    """子类实现 _read() 和 _write()；load() 返回副本，修改后需调用 save()"""
+
+    def __init__(self, request):
+        self.request = request
+        self._cart = None
+        self.modified = False
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _write(self, cart):
+        raise NotImplementedError
+
+    def load(self):
+        if self._cart is None:
+            self._cart = self._read()
+        return {isbn: dict(item) for isbn, item in self._cart.items()}
+
+    def save(self, cart):
+        self._cart = {isbn: dict(item) for isbn, item in cart.items()}
+        self.modified = True
+        self._write(self._cart)
+
+    def clear(self):
+        self.save({})
+
+    def process_response(self, response):
+        """在响应中写回需要的 cookie；默认什么都不做"""
+        return response
+
+
+class SessionCartStore(BaseCartStore):
+    session_key = 'cart'
+
+    def _read(self):
+        return self.request.session.get(self.session_key, {})
+
+    def _write(self, cart):
+        self.request.session[self.session_key] = cart
+
+
+def encode_cart(cart):
+    """{isbn: {'quantity': n}} → 'isbn-n.isbn-n'"""
+    return '.'.join(f"{isbn}-{item['quantity']}" for isbn, item in cart.items())
+
+
+def decode_cart(value):
+    cart = {}
+    for entry in filter(None, value.split('.')):
+        isbn, _, quantity = entry.rpartition('-')
+        if isbn and quantity.isdigit():
+            cart[isbn] = {'quantity': int(quantity)}
+    return cart
+
+
+class SignedCookieCartStore(BaseCartStore):
+    salt = 'catalog.cart_store'
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+    def _read(self):
+        # 被篡改或属于其他 session 的 cookie 视为空购物车
+        value = _unsign(self.request, self.salt, self.request.COOKIES.get(self.cookie_name))
+        return decode_cart(value) if value is not None else {}
+
+    def _write(self, cart):
+        pass  # 在 process_response 中统一写入 cookie
+
+    def process_response(self, response):
+        if self.modified:
+            if self._cart:
+                signer = _session_signer(self.request, self.salt, create=True)
+                _set_cookie(response, self.cookie_name, signer.sign(encode_cart(self._cart)))
+            else:
+                response.delete_cookie(self.cookie_name, samesite='Lax')
+        return response
+
+
+class CacheCartStore(BaseCartStore):
+    cookie_name = 'cart_token'
+    salt = 'catalog.cart_store.token'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.token = _unsign(request, self.salt, request.COOKIES.get(self.cookie_name))
+        self._new_token = False
+
+    def _cache(self):
+        return caches[getattr(settings, 'CART_STORE_CACHE_ALIAS', 'default')]
+
+    def _key(self):
+        return f'cart-store:{self.token}'
+
+    def _read(self):
+        if not self.token:
+            return {}
+        return self._cache().get(self._key(), {})
+
+    def _write(self, cart):
+        if not self.token:
+            self.token = secrets.token_urlsafe(24)
+            self._new_token = True
+        if cart:
+            self._cache().set(self._key(), cart, timeout=_cookie_age())
+        else:
+            self._cache().delete(self._key())
+
+    def process_response(self, response):
+        if self._new_token:
+            signer = _session_signer(self.request, self.salt, create=True)
+            _set_cookie(response, self.cookie_name, signer.sign(self.token))
+        return response
+
+
+def get_cart_store_class():
+    return import_string(getattr(settings, 'CART_STORE_BACKEND', DEFAULT_BACKEND))
+
+
+def get_cart_store(request):
+    """当前请求的购物车存储；未启用中间件时（例如单元测试直接调用视图）按需创建"""
+    store = getattr(request, 'cart_store', None)
+    if store is None:
+        store = request.cart_store = get_cart_store_class()(request)
+    return store
+
+
+class CartStoreMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        store = get_cart_store(request)
+        response = self.get_response(request)
+        return store.process_response(response)
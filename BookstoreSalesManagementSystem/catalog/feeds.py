@@ -0,0 +1,328 @@
+# feeds.py
+# 书籍源文件的读取与清洗：JSON 数组、JSON Lines、CSV 逐条读取，clean_record 把一条源记录转换为 Book 的字段字典。
+# 本模块不依赖 Django 的模型和数据库，import_books --workers 的子进程只导入它。
+import csv
+import hashlib
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+READ_CHUNK_SIZE = 64 * 1024
+# 多进程清洗时每个任务包含的记录数
+CLEAN_CHUNK_SIZE = 2000
+FEED_FORMATS = ('json', 'jsonl', 'csv')
+HASHED_FIELDS = ('title', 'summary', 'author', 'press', 'price', 'stock')
+PRICE_PLACES = Decimal('0.01')
+MAX_PRICE = Decimal('9999.99')  # Book.price: max_digits=6, decimal_places=2
+# 与 Book 字段的长度和取值范围一致，超出时记录无效，而不是让整批写入失败
+MAX_ISBN_LENGTH = 13
+MAX_TEXT_LENGTH = 100  # title / author / press
+MAX_STOCK = 2147483647  # PositiveIntegerField
+
+# 切分 JSON 数组时只需识别的记号：完整的字符串、括号和逗号；单独的引号表示字符串被块边界截断
+_JSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[][{},"]')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def clean_price(value):
+    """
+    '58.00元'、'54元'、54 等转换为保留两位小数的 Decimal（不经过 float，避免精度误差）。
+    无法解析时为 0；超出 Book.price 的范围时抛出 InvalidRecord。
+    """
+    if value is None:
+        return Decimal('0.00')
+    try:
+        price = Decimal(str(value).replace('元', '').strip())
+    except InvalidOperation:
+        return Decimal('0.00')  # 默认值处理异常价格
+    if not price.is_finite():
+        return Decimal('0.00')
+    # 先排除量级过大的值再 quantize：1e30 这样的值 quantize 时会抛出 InvalidOperation
+    if abs(price) > MAX_PRICE + 1:
+        raise InvalidRecord(f'价格超出范围: {value!r}')
+    price = price.quantize(PRICE_PLACES) + 0  # + 0 把 -0.00 规范为 0.00
+    if not Decimal('0.00') <= price <= MAX_PRICE:
+        raise InvalidRecord(f'价格超出范围: {value!r}')
+    return price
+
+
+def clean_stock(value):
+    """库存：非负整数（允许 '12'、12.0 这样的写法），否则抛出 InvalidRecord"""
+    if isinstance(value, bool):
+        raise InvalidRecord(f'无效的库存: {value!r}')
+    try:
+        stock = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise InvalidRecord(f'无效的库存: {value!r}')
+    if not stock.is_finite() or stock != stock.to_integral_value() or not 0 <= stock <= MAX_STOCK:
+        raise InvalidRecord(f'无效的库存: {value!r}')
+    return int(stock)
+
+
+def _optional_text(data, field, default, max_length):
+    """可选的文本字段：缺失时用默认值，允许 null；不是字符串或超长时抛出 InvalidRecord"""
+    value = data.get(field, default)
+    if value is not None and (not isinstance(value, str) or (max_length and len(value) > max_length)):
+        raise InvalidRecord(f'无效的{field}: {value!r}')
+    return value
+
+
+def clean_record(data):
+    """
+    把源数据中的一条记录转换为 Book 的字段字典；data 为字典，或一行 JSON 文本（JSON Lines）。
+    无法解析、缺少必需字段或字段不符合 Book 的约束（长度、类型、库存范围）时抛出 InvalidRecord。
+    """
+    if isinstance(data, str):
+        try:
+            data = json.loads(data, parse_float=Decimal)
+        except ValueError as e:
+            raise InvalidRecord(f'无法解析的 JSON: {e}')
+    if not isinstance(data, dict):
+        raise InvalidRecord('记录不是 JSON 对象')
+    missing = [field for field in ('isbn', 'title', 'stock') if field not in data]
+    if missing:
+        raise InvalidRecord(f'缺少字段 {", ".join(missing)}')
+
+    isbn = data['isbn']
+    if isinstance(isbn, bool) or not isinstance(isbn, (str, int)):
+        raise InvalidRecord(f'无效的 ISBN: {isbn!r}')
+    isbn = str(isbn).strip()
+    if not isbn or len(isbn) > MAX_ISBN_LENGTH:
+        raise InvalidRecord(f'无效的 ISBN: {isbn!r}')
+
+    title = data['title']
+    if not isinstance(title, str) or not title.strip() or len(title) > MAX_TEXT_LENGTH:
+        raise InvalidRecord(f'无效的书名: {title!r}')
+
+    record = {
+        'isbn': isbn,
+        'title': title,
+        'summary': _optional_text(data, 'summary', '无', None),
+        'author': _optional_text(data, 'author', '佚名', MAX_TEXT_LENGTH),
+        'press': _optional_text(data, 'press', '无名出版社', MAX_TEXT_LENGTH),
+        'price': clean_price(data.get('price', '0')),
+        'stock': clean_stock(data['stock']),
+    }
+    record['import_hash'] = record_hash(record)
+    return record
+
+
+def record_hash(record):
+    """清洗后记录的内容摘要（32 位十六进制），字段相同则摘要相同"""
+    content = json.dumps([record[field] for field in HASHED_FIELDS], default=str, ensure_ascii=False)
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def iter_json_array(file, chunk_size=READ_CHUNK_SIZE):
+    """
+    增量解析顶层 JSON 数组，逐个产出元素；每次只在内存中保留一小段未解析的文本。
+    文件不是 JSON 数组或内容损坏时抛出 ValueError。
+    """
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = not chunk
+
+    def next_char():
+        """跳过空白，返回下一个字符（不消耗），文件结束时返回空串"""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n\ufeff':
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position:position + 1]
+            fill()
+
+    if next_char() != '[':
+        raise ValueError('源文件不是 JSON 数组')
+    position += 1
+    if next_char() == ']':
+        return
+    while True:
+        if not next_char():
+            raise ValueError('JSON 数组不完整')
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError('JSON 数组格式错误')
+            fill()  # 元素跨越了块边界，读入更多内容后重试
+            continue
+        if end == len(buffer) and not eof:
+            fill()  # 元素恰好在块末尾结束时可能被截断（例如数字），读入更多内容后重新解析
+            continue
+        position = end
+        yield item
+
+        separator = next_char()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError('JSON 数组不完整' if not separator else 'JSON 数组格式错误：元素之间缺少逗号')
+        position += 1
+
+
+def iter_json_array_text(file, chunk_size=READ_CHUNK_SIZE):
+    """
+    把顶层 JSON 数组切分为各元素的原始文本而不解析，由 clean_record 在子进程中解析。
+    只识别字符串、括号和逗号，元素内部的格式错误由 clean_record 报告为无效记录；
+    数组本身不完整或元素为空时抛出 ValueError。
+    """
+    buffer = ''
+    eof = False
+    position = 0
+    start = None  # 当前元素在 buffer 中的起点，遇到 '[' 之前为 None
+    depth = 0
+    after_comma = False
+    while True:
+        match = _JSON_TOKEN.search(buffer, position)
+        if match is None or match.group() == '"':
+            if eof:
+                raise ValueError('JSON 数组不完整' if start is not None else '源文件不是 JSON 数组')
+            # 读入更多内容：只保留当前元素的文本，被截断的字符串从开头重新扫描
+            keep = start if start is not None else position
+            position = (match.start() if match else len(buffer)) - keep
+            if start is not None:
+                start = 0
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[keep:] + chunk
+            continue
+        token = match.group()
+        position = match.end()
+        if start is None:
+            if token != '[' or buffer[:match.start()].strip(' \t\r\n\ufeff'):
+                raise ValueError('源文件不是 JSON 数组')
+            start = position
+            depth = 1
+            continue
+        if token in '{[':
+            depth += 1
+        elif token in '}]':
+            depth -= 1
+            if depth == 0:
+                text = buffer[start:match.start()].strip()
+                if text:
+                    yield text
+                elif after_comma:
+                    raise ValueError('JSON 数组格式错误')
+                return
+        elif token == ',' and depth == 1:
+            text = buffer[start:match.start()].strip()
+            if not text:
+                raise ValueError('JSON 数组格式错误')
+            yield text
+            start = position
+            after_comma = True
+
+
+def iter_json_lines(file):
+    """JSON Lines：逐行产出原始文本，由 clean_record 解析（单行损坏只跳过该行）"""
+    for line in file:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def iter_csv(file):
+    """CSV：第一行为表头，逐行产出字典；空单元格视为缺失，使用默认值"""
+    for row in csv.DictReader(file):
+        yield {key: value for key, value in row.items() if key and value not in (None, '')}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return 'json'
+
+
+def iter_feed(file, feed_format, split_only=False):
+    """
+    按格式从已打开的文本文件中逐条产出原始记录（字典或 JSON 文本）。
+    split_only=True 时 JSON 数组只切分不解析，把解析留给 clean_records 的子进程。
+    """
+    if feed_format == 'jsonl':
+        return iter_json_lines(file)
+    if feed_format == 'csv':
+        return iter_csv(file)
+    if split_only:
+        return iter_json_array_text(file)
+    return iter_json_array(file)
+
+
+def _clean_each(raw_records, first_number):
+    for number, data in enumerate(raw_records, first_number):
+        try:
+            yield number, clean_record(data), None
+        except InvalidRecord as e:
+            yield number, None, str(e)
+        except Exception as e:
+            # 单条记录引起的意外错误（例如嵌套过深的 JSON）同样只跳过该记录，不中断导入
+            yield number, None, f'{type(e).__name__}: {e}'
+
+
+def clean_chunk(first_number, raw_records):
+    """清洗一块记录，返回 [(序号, 记录, None) 或 (序号, None, 错误信息)]；在子进程中执行"""
+    return list(_clean_each(raw_records, first_number))
+
+
+def _chunked(iterable, size):
+    """按 size 条分块；读取中途出错时先产出已读取的不完整块，再抛出异常"""
+    chunk = []
+    try:
+        for item in iterable:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    except ValueError:
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+
+def clean_records(raw_records, workers=1, chunk_size=CLEAN_CHUNK_SIZE):
+    """
+    逐条产出 (序号, 记录, 错误信息)，记录无效时记录为 None。
+    workers > 1 时按 chunk_size 条一块分发到进程池清洗，结果按原顺序产出；
+    在途的块最多 workers * 2 个，写入跟不上时暂停读取，内存占用有上限。
+    """
+    if workers <= 1:
+        yield from _clean_each(raw_records, 1)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        number = 1
+        error = None
+        try:
+            for chunk in _chunked(raw_records, chunk_size):
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+                pending.append(executor.submit(clean_chunk, number, chunk))
+                number += len(chunk)
+        except ValueError as e:
+            # 源文件在中途损坏：先产出已读取部分的结果，与单进程导入的行为一致
+            error = e
+        while pending:
+            yield from pending.popleft().result()
+        if error is not None:
+            raise error
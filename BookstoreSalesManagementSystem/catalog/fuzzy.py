@@ -0,0 +1,220 @@
+# fuzzy.py
+# 书名/作者的内存模糊检索：汉字按单字+二元组切分，拉丁字母与数字按三元组切分，
+# 另外把书名和作者转换为全拼与首字母一起建索引，因此可以用拼音、拼音首字母搜索，并容忍个别错字。
+# 每个进程在第一次搜索时从数据库加载索引，之后由 signals.py 在 Book 保存/删除提交后增量更新，
+# 过期后在后台重建（见 memory_index.py）。
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+
+from .memory_index import IndexHolder
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 未安装 pypinyin 时只提供汉字/字母 n-gram 检索
+    lazy_pinyin = None
+
+INDEXED_FIELDS = ('title', 'author')
+
+# 汉字、日文假名视为“表意字符”，其余只保留字母和数字
+_IDEOGRAPH_RUN = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿]+')
+_ALNUM_RUN = re.compile(r'[a-z0-9]+')
+
+DEFAULT_MIN_SIMILARITY = 0.5
+DEFAULT_MAX_AGE = 600
+
+
+def normalize(text):
+    """全角转半角、转小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def _ideograph_grams(run):
+    grams = set(run)
+    grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def _alnum_grams(run):
+    padded = f'^{run}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def text_grams(text):
+    """把一段已规范化的文本切成 n-gram 集合"""
+    grams = set()
+    for run in _IDEOGRAPH_RUN.findall(text):
+        grams |= _ideograph_grams(run)
+    for run in _ALNUM_RUN.findall(text):
+        grams |= _alnum_grams(run)
+    return grams
+
+
+def pinyin_forms(text):
+    """返回 (全拼, 首字母) 两个字符串；没有汉字或未安装 pypinyin 时返回空元组"""
+    if lazy_pinyin is None:
+        return ()
+    hanzi = ''.join(_IDEOGRAPH_RUN.findall(text))
+    if not hanzi:
+        return ()
+    full = ''.join(lazy_pinyin(hanzi, errors='ignore'))
+    initials = ''.join(lazy_pinyin(hanzi, style=Style.FIRST_LETTER, errors='ignore'))
+    return tuple(form for form in (full, initials) if form)
+
+
+def query_gram_sets(query):
+    """
+    查询串对应的若干组 n-gram：原文一组，原文汉字转成拼音后再一组（用于同音错字）。
+    查询只含一个汉字时用单字，否则只用二元组，避免常用单字带来大量候选。
+    """
+    text = normalize(query)
+    direct = set()
+    for run in _IDEOGRAPH_RUN.findall(text):
+        direct |= set(run) if len(run) == 1 else {run[i:i + 2] for i in range(len(run) - 1)}
+    for run in _ALNUM_RUN.findall(text):
+        direct |= _alnum_grams(run)
+
+    gram_sets = [direct] if direct else []
+    for form in pinyin_forms(text)[:1]:
+        gram_sets.append(_alnum_grams(form))
+    return gram_sets
+
+
+class FuzzyIndex:
+    """
+    isbn → n-gram 的倒排索引。
+    倒排表的值是不可变的 frozenset，写入时整体替换，因此检索不需要加锁；锁只用于串行化写入。
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._doc_grams = {}
+        self._doc_text = {}
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._doc_grams)
+
+    def _grams_for(self, values):
+        grams = set()
+        for value in values:
+            text = normalize(value)
+            grams |= text_grams(text)
+            for form in pinyin_forms(text):
+                grams |= _alnum_grams(form)
+        return frozenset(grams)
+
+    def _remove_locked(self, isbn):
+        for gram in self._doc_grams.pop(isbn, ()):
+            postings = self._postings.get(gram, frozenset()) - {isbn}
+            if postings:
+                self._postings[gram] = postings
+            else:
+                self._postings.pop(gram, None)
+        self._doc_text.pop(isbn, None)
+
+    def load(self, rows):
+        """一次性装载 (isbn, title, author)：先用可变集合累积，最后再冻结，避免逐条复制倒排表"""
+        postings = {}
+        with self._lock:
+            for isbn, title, author in rows:
+                grams = self._grams_for((title, author))
+                self._doc_grams[isbn] = grams
+                self._doc_text[isbn] = (normalize(title), normalize(author))
+                for gram in grams:
+                    postings.setdefault(gram, set()).add(isbn)
+            self._postings = {gram: frozenset(isbns) for gram, isbns in postings.items()}
+
+    def add(self, isbn, title, author):
+        grams = self._grams_for((title, author))
+        with self._lock:
+            self._remove_locked(isbn)
+            # 先写文本再写倒排表，检索命中的书籍总能取到文本
+            self._doc_text[isbn] = (normalize(title), normalize(author))
+            self._doc_grams[isbn] = grams
+            for gram in grams:
+                self._postings[gram] = self._postings.get(gram, frozenset()) | {isbn}
+
+    def remove(self, isbn):
+        with self._lock:
+            self._remove_locked(isbn)
+
+    def search(self, query, limit=None, min_similarity=None):
+        """返回按相似度排序的 ISBN 列表"""
+        if limit is None:
+            limit = getattr(settings, 'BOOK_SEARCH_MAX_RESULTS', 200)
+        if min_similarity is None:
+            min_similarity = getattr(settings, 'FUZZY_SEARCH_MIN_SIMILARITY', DEFAULT_MIN_SIMILARITY)
+        gram_sets = query_gram_sets(query)
+        if not gram_sets:
+            return []
+        needle = ''.join(normalize(query).split())
+
+        postings = self._postings
+        scores = {}
+        for grams in gram_sets:
+            counts = Counter()
+            for gram in grams:
+                counts.update(postings.get(gram, ()))
+            for isbn, hits in counts.items():
+                score = hits / len(grams)
+                if score >= min_similarity and score > scores.get(isbn, 0):
+                    scores[isbn] = score
+
+        ranked = []
+        for isbn, score in scores.items():
+            text = self._doc_text.get(isbn)
+            if text is None:  # 检索期间被删除
+                continue
+            title, author = text
+            # 相似度相同时：原文直接包含查询串的优先，书名越短越靠前
+            exact = 2 if needle in title else 1 if needle in (author or '') else 0
+            ranked.append((-score, -exact, len(title), isbn))
+        ranked.sort()
+        return [key[-1] for key in ranked[:limit]]
+
+
+def build_index():
+    from .models import Book
+
+    index = FuzzyIndex()
+    index.load(Book.objects.values_list('isbn', *INDEXED_FIELDS).iterator(chunk_size=2000))
+    return index
+
+
+_holder = IndexHolder('fuzzy', build_index, 'FUZZY_INDEX_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def get_index():
+    """返回本进程的索引；超过 FUZZY_INDEX_MAX_AGE 秒后在后台重新加载（弥补其他进程的写入）"""
+    return _holder.get()
+
+
+def get_loaded_index():
+    """已加载的索引；尚未加载时返回 None"""
+    return _holder.loaded()
+
+
+def reset_index():
+    _holder.reset()
+
+
+def rebuild_index():
+    _holder.rebuild()
+
+
+def add_book(isbn, title, author):
+    _holder.add(isbn, title, author)
+
+
+def remove_book(isbn):
+    _holder.remove(isbn)
+
+
+def search_isbns(query, limit=None):
+    return get_index().search(query, limit=limit)
@@ -0,0 +1,147 @@
+# importer.py
+# 书籍批量导入：把清洗后的记录攒成批，每批在一个事务中用一条
+# INSERT ... ON CONFLICT (isbn) DO UPDATE 写入（bulk_create(update_conflicts=True)）。
+# 全文索引由 catalog_book 上的触发器逐行同步（见 search.py）；批量写入不会触发 Book 的 post_save 信号，
+# 所以导入结束时统一让书籍缓存换代，并重置本进程的模糊检索/联想索引（其他进程在索引过期后自动重新加载）。
+# 增量模式（diff=True）按批比较源记录的摘要与 Book.import_hash，只写入新增和变化的书籍；
+# 可选删除源文件中已不存在的书籍。
+# 源文件的读取与清洗见 feeds.py。
+import time
+
+from django.db import transaction
+
+from . import autocomplete, book_cache, fuzzy, signals
+from .models import Book, CartItem, DailyBookSales, OrderItem, StockReservation
+
+UPDATE_FIELDS = ('title', 'summary', 'author', 'press', 'price', 'stock', 'import_hash')
+DEFAULT_BATCH_SIZE = 1000
+QUERY_CHUNK_SIZE = 500
+
+
+def _chunks(items, size=QUERY_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BookUpsertWriter:
+    """
+    逐条 add() 清洗后的记录，满 batch_size 条时写入一批；用完后调用 close() 写入剩余记录并使缓存失效。
+    on_progress(writer) 在每写入 progress_every 条后调用一次。
+    diff=True 时跳过摘要与数据库一致的记录；track_seen=True 时记录出现过的 ISBN，供 delete_missing() 使用。
+    counts 为各类记录的数量：inserted / updated / unchanged / deleted / retired
+    （增量模式之外 inserted 与 updated 不做区分，都计入 written）。
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, progress_every=None, on_progress=None,
+                 diff=False, track_seen=False):
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.on_progress = on_progress
+        self.diff = diff
+        self.seen = set() if track_seen else None
+        self.pending = {}
+        self.written = 0
+        self.batches = 0
+        self.counts = dict.fromkeys(('inserted', 'updated', 'unchanged', 'deleted', 'retired'), 0)
+        self.started = time.monotonic()
+        self._next_progress = progress_every
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.written / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add(self, record):
+        # 同一批中重复的 ISBN 以最后一条为准（一条 ON CONFLICT 语句不能两次更新同一行）
+        self.pending[record['isbn']] = record
+        if self.seen is not None:
+            self.seen.add(record['isbn'])
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _changed_records(self):
+        """按主键一次查出本批书籍已保存的摘要，返回需要写入的记录并累计各类数量"""
+        stored = {}
+        for chunk in _chunks(self.pending):
+            stored.update(Book.objects.filter(isbn__in=chunk).values_list('isbn', 'import_hash'))
+        records = []
+        for isbn, record in self.pending.items():
+            if isbn not in stored:
+                self.counts['inserted'] += 1
+            elif stored[isbn] != record['import_hash']:
+                self.counts['updated'] += 1
+            else:
+                self.counts['unchanged'] += 1
+                continue
+            records.append(record)
+        return records
+
+    def flush(self):
+        if not self.pending:
+            return
+        try:
+            records = self._changed_records() if self.diff else self.pending.values()
+            books = [Book(**record) for record in records]
+            if books:
+                with transaction.atomic():
+                    Book.objects.bulk_create(
+                        books,
+                        update_conflicts=True,
+                        unique_fields=['isbn'],
+                        update_fields=list(UPDATE_FIELDS),
+                    )
+                self.written += len(books)
+                self.batches += 1
+        finally:
+            # 写入失败的批次不会在 close() 中重试
+            self.pending = {}
+        if self.progress_every and self.on_progress and self.written >= self._next_progress:
+            self.on_progress(self)
+            self._next_progress = (self.written // self.progress_every + 1) * self.progress_every
+
+    def delete_missing(self):
+        """
+        删除源文件中没有出现的书籍（需要 track_seen=True，并在全部记录 add() 之后调用）。
+        被订单项或每日销售汇总引用（on_delete=PROTECT）的书籍不能删除，改为库存清零下架，
+        并清空摘要，源文件中再次出现时会重新写入。两种书籍的购物车项和库存预留都会删除，
+        否则下架书籍的预留过期后会把库存退回、重新上架。返回本次 (删除数, 下架数)，已下架的不重复计数。
+        """
+        self.flush()
+        missing = [isbn for isbn in Book.objects.values_list('isbn', flat=True).iterator() if isbn not in self.seen]
+        deleted = retired = 0
+        for chunk in _chunks(missing):
+            protected = set(OrderItem.objects.filter(book_id__in=chunk).values_list('book_id', flat=True))
+            protected.update(DailyBookSales.objects.filter(book_id__in=chunk).values_list('book_id', flat=True))
+            removable = [isbn for isbn in chunk if isbn not in protected]
+            with transaction.atomic():
+                CartItem.objects.filter(book_id__in=chunk).delete()
+                StockReservation.objects.filter(book_id__in=chunk).delete()
+                if protected:
+                    retired += Book.objects.filter(isbn__in=protected).exclude(stock=0, import_hash='') \
+                        .update(stock=0, import_hash='')
+                if removable:
+                    # 缓存和内存索引在 close() 时整体失效，不逐本处理 post_delete
+                    with signals.book_signals_muted():
+                        _, counts = Book.objects.filter(isbn__in=removable).delete()
+                    deleted += counts.get(Book._meta.label, 0)
+        self.counts['deleted'] += deleted
+        self.counts['retired'] += retired
+        return deleted, retired
+
+    def close(self):
+        """写入剩余记录，然后使缓存和本进程的内存索引失效；写入出错时仍会处理此前已提交的批次"""
+        try:
+            self.flush()
+        finally:
+            self._sync_indexes()
+
+    def _sync_indexes(self):
+        if not (self.written or self.counts['deleted'] or self.counts['retired']):
+            return
+        book_cache.bump_generation()
+        fuzzy.reset_index()
+        autocomplete.reset_index()
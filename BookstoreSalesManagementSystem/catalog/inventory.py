@@ -0,0 +1,169 @@
+# inventory.py
+# 库存预留：加入购物车时用一条带条件的 UPDATE（stock >= n 才扣减）原子地占用库存，
+# 并记录一条有过期时间的 StockReservation；清空购物车或过期时退回，结算时转为销售。
+# 扣减不再是“读出-修改-保存”，并发加购不会超卖，也不会丢失更新。
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.utils import timezone
+
+from . import book_cache
+from .models import Book, StockReservation
+
+SESSION_KEY = 'reservation_key'
+DEFAULT_TTL = 30 * 60
+
+
+class InsufficientStock(Exception):
+    def __init__(self, isbn, requested):
+        super().__init__(f'Insufficient stock for {isbn} (requested {requested})')
+        self.isbn = isbn
+        self.requested = requested
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL))
+
+
+def get_holder_key(request, create=True):
+    """当前访客的预留令牌，保存在 session 中"""
+    key = request.session.get(SESSION_KEY)
+    if key is None and create:
+        key = secrets.token_hex(16)
+        request.session[SESSION_KEY] = key
+    return key
+
+
+def take_stock(isbn, quantity):
+    """单条语句扣减库存：UPDATE ... SET stock = stock - n WHERE isbn = ? AND stock >= n"""
+    updated = Book.objects.filter(isbn=isbn, stock__gte=quantity).update(stock=F('stock') - quantity)
+    if not updated:
+        raise InsufficientStock(isbn, quantity)
+
+
+def _delta_expression(deltas):
+    return Case(
+        *[When(isbn=isbn, then=Value(delta)) for isbn, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+class _StockMismatch(Exception):
+    pass
+
+
+def adjust_stock(deltas):
+    """
+    按 {isbn: 增减量} 调整库存，所有书籍用一条
+    UPDATE ... SET stock = stock + CASE ... WHERE isbn IN (...) AND stock + CASE ... >= 0 完成。
+    有书籍库存不足时整体不生效并抛出 InsufficientStock。
+    """
+    deltas = {isbn: delta for isbn, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    delta = _delta_expression(deltas)
+    guarded = Book.objects.filter(isbn__in=list(deltas), stock__gte=Value(0) - delta)
+    try:
+        with transaction.atomic():
+            if guarded.update(stock=F('stock') + delta) != len(deltas):
+                raise _StockMismatch
+    except _StockMismatch:
+        # 少见路径：找出库存不足的书；若只是要退回库存的书已被删除，则忽略这些书重新执行
+        stocks = dict(Book.objects.filter(isbn__in=list(deltas)).values_list('isbn', 'stock'))
+        for isbn, change in deltas.items():
+            if change < 0 and stocks.get(isbn, 0) < -change:
+                raise InsufficientStock(isbn, -change)
+        adjust_stock({isbn: change for isbn, change in deltas.items() if isbn in stocks})
+
+
+def return_stock(quantities):
+    """按 {isbn: 数量} 退回库存（一条 UPDATE）"""
+    adjust_stock({isbn: quantity for isbn, quantity in quantities.items() if quantity > 0})
+
+
+def reserve(holder_key, isbn, quantity):
+    """为持有者预留 quantity 本书，返回该书的最新库存；库存不足时抛出 InsufficientStock"""
+    expires_at = timezone.now() + reservation_ttl()
+    with transaction.atomic():
+        take_stock(isbn, quantity)
+        reservation = StockReservation.objects.select_for_update().filter(holder_key=holder_key, book_id=isbn).first()
+        if reservation is None:
+            StockReservation.objects.create(
+                holder_key=holder_key, book_id=isbn, quantity=quantity, expires_at=expires_at
+            )
+        else:
+            StockReservation.objects.filter(pk=reservation.pk).update(
+                quantity=F('quantity') + quantity, expires_at=expires_at
+            )
+        new_stock = Book.objects.filter(isbn=isbn).values_list('stock', flat=True).get()
+    transaction.on_commit(lambda: book_cache.invalidate([isbn]))
+    return new_stock
+
+
+def touch(holder_key):
+    """持有者仍在活动：延长其全部预留的有效期"""
+    StockReservation.objects.filter(holder_key=holder_key).update(expires_at=timezone.now() + reservation_ttl())
+
+
+def _release_rows(reservations):
+    """锁定并删除给定的预留行，退回库存，返回 {isbn: 数量}；需在事务中调用"""
+    rows = list(reservations.select_for_update(skip_locked=True).values_list('reservation_id', 'book_id', 'quantity'))
+    quantities = {}
+    for _, isbn, quantity in rows:
+        quantities[isbn] = quantities.get(isbn, 0) + quantity
+    return_stock(quantities)
+    StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return quantities
+
+
+def release(holder_key, isbns=None):
+    """退回持有者的预留（默认全部），返回退回的 {isbn: 数量}"""
+    reservations = StockReservation.objects.filter(holder_key=holder_key)
+    if isbns is not None:
+        reservations = reservations.filter(book_id__in=list(isbns))
+    with transaction.atomic():
+        quantities = _release_rows(reservations)
+    transaction.on_commit(lambda: book_cache.invalidate(quantities.keys()))
+    return quantities
+
+
+def commit(holder_key, lines):
+    """
+    结算：把 {isbn: 数量} 的购物车行转为销售。
+    已预留的部分直接消耗；超出预留（例如预留已过期被退回）的部分在这里补扣，
+    不足时抛出 InsufficientStock，调用方应在同一事务中回滚订单；多余的预留退回库存。
+    需要在调用方的事务中执行。
+    """
+    rows = list(StockReservation.objects.select_for_update().filter(holder_key=holder_key)
+                .values_list('reservation_id', 'book_id', 'quantity'))
+    reserved = {isbn: quantity for _, isbn, quantity in rows}
+
+    # 负数为需要补扣的量，正数为多余预留需要退回的量，一条语句完成
+    deltas = {isbn: reserved.get(isbn, 0) - quantity for isbn, quantity in lines.items()}
+    for isbn, quantity in reserved.items():
+        if isbn not in lines:
+            deltas[isbn] = quantity
+    adjust_stock(deltas)
+    StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    transaction.on_commit(lambda: book_cache.invalidate(set(lines) | set(reserved)))
+
+
+def release_expired(now=None, batch_size=None):
+    """
+    退回已过期的预留，返回退回的 {isbn: 数量}。
+    指定 batch_size 时只处理最早过期的一批，便于调用方分批循环、缩短每个事务的持锁时间。
+    """
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(expires_at__lt=now).order_by('expires_at')
+    if batch_size is not None:
+        expired = StockReservation.objects.filter(
+            pk__in=list(expired.values_list('pk', flat=True)[:batch_size]), expires_at__lt=now
+        )
+    with transaction.atomic():
+        quantities = _release_rows(expired)
+    transaction.on_commit(lambda: book_cache.invalidate(quantities.keys()))
+    return quantities
@@ -1,45 +1,108 @@
 # import_books.py
-import json
-from django.core.management.base import BaseCommand
-from django.utils.translation.trans_real import catalog
+from django.core.management.base import BaseCommand, CommandError
 
-from catalog.models import Book
+from catalog import feeds, importer
+
+MAX_REPORTED_ERRORS = 10
 
 
 class Command(BaseCommand):
-    help = 'Import books from a JSON file into the database'
+    help = 'Import books from a JSON, JSON Lines or CSV file into the database'
 
     def add_arguments(self, parser):
-        parser.add_argument('json_file', type=str, help='Path to the JSON file')
+        parser.add_argument('json_file', type=str, help='Path to the JSON / JSON Lines / CSV file')
+        parser.add_argument(
+            '--format',
+            choices=feeds.FEED_FORMATS,
+            help='源文件格式，省略时按扩展名判断（.jsonl/.ndjson、.csv，其余按 JSON 数组处理）'
+        )
+        parser.add_argument(
+            '--diff',
+            action='store_true',
+            help='增量导入：只写入新增和内容有变化的书籍（与上次导入时的摘要比较）'
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='删除源文件中没有的书籍；有订单记录的书籍不删除，改为库存清零。存在无效记录时不执行删除'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=importer.DEFAULT_BATCH_SIZE,
+            help='每个事务写入的书籍数，默认 %(default)s'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='解析和清洗记录的进程数，大于 1 时由子进程解析，主进程只负责写入数据库，默认 %(default)s'
+        )
+        parser.add_argument(
+            '--progress-every',
+            type=int,
+            default=10000,
+            help='每导入多少条输出一次进度，0 表示不输出，默认 %(default)s'
+        )
+
+    def _report_progress(self, writer):
+        self.stdout.write(f'  已导入 {writer.written} 条（{writer.rate:.0f} 条/秒）')
 
     def handle(self, *args, **kwargs):
         json_file_path = kwargs['json_file']
+        if kwargs['batch_size'] <= 0:
+            raise CommandError('--batch-size 必须为正整数')
+        if kwargs['workers'] <= 0:
+            raise CommandError('--workers 必须为正整数')
 
+        feed_format = kwargs['format'] or feeds.detect_format(json_file_path)
+        writer = importer.BookUpsertWriter(
+            batch_size=kwargs['batch_size'],
+            progress_every=kwargs['progress_every'],
+            on_progress=self._report_progress,
+            diff=kwargs['diff'],
+            track_seen=kwargs['delete_missing'],
+        )
+        skipped = 0
+        # 无论是否出错都要 close()：已提交的批次需要同步到全文索引和书籍缓存
         try:
-            with open(json_file_path, 'r', encoding='utf-8') as file:
-                books_data = json.load(file)
-                for data in books_data:
-                    # 清洗价格字段（移除"元"并转为数字）
-                    price_str = data.get('price', '0').replace('元', '').strip()
-                    try:
-                        price = float(price_str)
-                    except ValueError:
-                        price = 0.0  # 默认值处理异常价格
-
-                    # 创建或更新书籍（根据ISBN唯一性）
-                    Book.objects.update_or_create(
-                        isbn=data['isbn'],  # 用于查找或创建的键
-                        defaults={
-                            'title': data['title'],
-                            'summary': data.get('summary', '无'),
-                            'author': data.get('author', '佚名'),
-                            'press': data.get('press', '无名出版社'),
-                            'price': price,
-                            'stock': data['stock'],
-                        }
-                    )
-                    self.stdout.write(self.style.SUCCESS(f'Successfully imported: {data["title"]}'))
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR('JSON file not found!'))
-        except KeyError as e:
-            self.stdout.write(self.style.ERROR(f'Missing key in JSON data: {e}'))
+            try:
+                # utf-8-sig：兼容 Excel 导出的带 BOM 的 CSV
+                with open(json_file_path, 'r', encoding='utf-8-sig', newline='') as file:
+                    raw_records = feeds.iter_feed(file, feed_format, split_only=kwargs['workers'] > 1)
+                    for number, record, error in feeds.clean_records(raw_records, workers=kwargs['workers']):
+                        if error is None:
+                            writer.add(record)
+                            continue
+                        skipped += 1
+                        if skipped <= MAX_REPORTED_ERRORS:
+                            self.stdout.write(self.style.WARNING(f'  第 {number} 条记录无效，已跳过: {error}'))
+            except FileNotFoundError:
+                self.stdout.write(self.style.ERROR('JSON file not found!'))
+                return
+            except (ValueError, UnicodeDecodeError) as e:
+                # 已写入的批次保留（再次导入同一文件是幂等的）
+                writer.flush()
+                raise CommandError(f'源文件解析失败（已导入 {writer.written} 条）: {e}')
+            if kwargs['delete_missing']:
+                if skipped:
+                    # 无效记录的 ISBN 不可信，无法判断哪些书籍确实已从源文件中移除
+                    self.stdout.write(self.style.WARNING('存在无效记录，未删除源文件中缺失的书籍'))
+                else:
+                    writer.delete_missing()
+        finally:
+            writer.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully imported {writer.written} books in {writer.batches} batches, '
+            f'{writer.elapsed:.2f}s ({writer.rate:.0f} books/s)'
+        ))
+        counts = writer.counts
+        if kwargs['diff']:
+            self.stdout.write(
+                f'  新增 {counts["inserted"]}，更新 {counts["updated"]}，未变化 {counts["unchanged"]}'
+            )
+        if kwargs['delete_missing'] and not skipped:
+            self.stdout.write(f'  删除 {counts["deleted"]}，下架（有订单记录，库存清零） {counts["retired"]}')
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} invalid records'))
@@ -0,0 +1,79 @@
+# reap_carts.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from catalog import inventory
+from catalog.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by expired cart reservations and delete abandoned anonymous carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每个事务处理的预留/购物车数量')
+        parser.add_argument(
+            '--cart-max-age',
+            type=int,
+            default=getattr(settings, 'ANONYMOUS_CART_MAX_AGE', 7 * 24 * 3600),
+            help='匿名购物车超过多少秒没有新增商品即视为废弃'
+        )
+        parser.add_argument('--loop', action='store_true', help='常驻运行，每隔 --interval 秒处理一轮')
+        parser.add_argument('--interval', type=int, default=60, help='常驻模式下两轮之间的间隔秒数')
+
+    def _reap_reservations(self, batch_size):
+        """分批退回过期预留，返回 (涉及书籍种数, 退回册数)"""
+        now = timezone.now()
+        isbns = set()
+        units = 0
+        while True:
+            quantities = inventory.release_expired(now=now, batch_size=batch_size)
+            if not quantities:
+                return len(isbns), units
+            isbns.update(quantities)
+            units += sum(quantities.values())
+
+    def _reap_carts(self, max_age, batch_size):
+        """分批删除长期无新增商品的匿名购物车（购物车行随之级联删除），返回删除的购物车数"""
+        cutoff = timezone.now() - timedelta(seconds=max_age)
+        stale = Cart.objects.filter(customer__isnull=True, updated_at__lt=cutoff) \
+            .exclude(items__added_at__gte=cutoff) \
+            .order_by('cart_id')
+        deleted = 0
+        while True:
+            cart_ids = list(stale.values_list('cart_id', flat=True)[:batch_size])
+            if not cart_ids:
+                return deleted
+            with transaction.atomic():
+                Cart.objects.filter(cart_id__in=cart_ids).delete()
+            deleted += len(cart_ids)
+
+    def _run_once(self, options):
+        started = time.monotonic()
+        books, units = self._reap_reservations(options['batch_size'])
+        carts = self._reap_carts(options['cart_max_age'], options['batch_size'])
+        elapsed = time.monotonic() - started
+        rate = units / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(
+            f'[{timezone.localtime():%Y-%m-%d %H:%M:%S}] 退回过期预留 {units} 册（{books} 种书），'
+            f'删除废弃购物车 {carts} 个，耗时 {elapsed:.2f}s，回收 {rate:.1f} 册/秒'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            self.stdout.write(self.style.ERROR('--batch-size 必须为正整数'))
+            return
+        if not options['loop']:
+            self._run_once(options)
+            return
+        self.stdout.write(self.style.SUCCESS(f'购物车回收进程已启动，每 {options["interval"]} 秒运行一次（Ctrl+C 退出）'))
+        try:
+            while True:
+                self._run_once(options)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('购物车回收进程已停止'))
@@ -0,0 +1,15 @@
+# rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books'
+
+    def handle(self, *args, **options):
+        total = search.rebuild_index()
+        if total is None:
+            self.stdout.write(self.style.ERROR('当前数据库不支持 SQLite FTS5，无法建立全文索引。'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'全文索引重建完成，共 {total} 本书籍。'))
@@ -0,0 +1,31 @@
+# reconcile_customer_stats.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import rollup
+
+
+class Command(BaseCommand):
+    help = '按已支付订单核对顾客的累计消费和已支付订单数（Customer.lifetime_spend / paid_order_count），并修正不一致的值'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只列出不一致的顾客，不写回')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批写回的顾客数，默认 500')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = rollup.customer_stats_mismatches()
+            for customer, spend, orders in mismatches:
+                self.stdout.write(
+                    f'  {customer.name} (ID: {customer.pk}): 累计消费 ¥{customer.lifetime_spend} -> ¥{spend}，'
+                    f'订单数 {customer.paid_order_count} -> {orders}'
+                )
+            if mismatches and not options['dry_run']:
+                rollup.fix_customer_stats(mismatches, batch_size=options['batch_size'])
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('所有顾客的累计值均与订单一致'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} 位顾客的累计值不一致（--dry-run，未修改）'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'已修正 {len(mismatches)} 位顾客的累计值'))
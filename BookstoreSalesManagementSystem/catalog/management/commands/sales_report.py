@@ -1,18 +1,22 @@
 import os
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField
+from django.db import connections
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
 from decimal import Decimal
 from django.conf import settings  # 用于可能的路径配置
 
 # 假设您的模型在 catalog 应用中
-from catalog.models import Order, OrderItem
+from catalog import report_state, report_writers
+from catalog.models import Customer, DailyBookSales
 
 
 # --- 辅助函数：计算日期范围 ---
 def get_previous_full_month_range():
-    today = timezone.now().date()
+    today = timezone.localdate()
     first_day_current_month = today.replace(day=1)
     last_day_previous_month = first_day_current_month - timedelta(days=1)
     first_day_previous_month = last_day_previous_month.replace(day=1)
@@ -20,13 +24,113 @@ def get_previous_full_month_range():
 
 
 def get_last_n_days_range(n_days):
-    today = timezone.now().date()  # 报告截止到今天（含）
+    today = timezone.localdate()  # 报告截止到今天（含）
     start_date = today - timedelta(days=n_days - 1)
     return start_date, today
 
 
+DEFAULT_PERIODS = ['last-month', 'days:7']
+
+
+def _parse_month(value):
+    try:
+        first_day = datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        return None
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    return first_day, next_month - timedelta(days=1)
+
+
+def _parse_range(value):
+    start, sep, end = value.partition('..')
+    try:
+        start_date, end_date = parse_date(start), parse_date(end)
+    except ValueError:
+        return None
+    if not sep or start_date is None or end_date is None or start_date > end_date:
+        return None
+    return start_date, end_date
+
+
+def parse_period(spec):
+    """
+    解析 --period 参数，返回 (周期名称, 开始日期, 结束日期)：
+      last-month          —— 上一个完整月份
+      days:N              —— 过去 N 天（含今天）
+      month:YYYY-MM       —— 指定月份
+      range:YYYY-MM-DD..YYYY-MM-DD —— 指定日期区间（含两端）
+    """
+    if spec == 'last-month':
+        return ("上一个完整月份",) + get_previous_full_month_range()
+    kind, _, value = spec.partition(':')
+    if kind == 'days' and value.isdigit() and int(value) > 0:
+        return (f"过去{int(value)}天",) + get_last_n_days_range(int(value))
+    month_range = _parse_month(value) if kind == 'month' else None
+    if month_range:
+        return (f"{month_range[0].year}年{month_range[0].month}月",) + month_range
+    date_range = _parse_range(value) if kind == 'range' else None
+    if date_range:
+        return ("指定区间",) + date_range
+    raise CommandError(
+        f'无法识别的周期 "{spec}"，可用格式: last-month、days:N、month:YYYY-MM、range:YYYY-MM-DD..YYYY-MM-DD'
+    )
+
+
+def _run_in_own_connection(func, *args):
+    """在工作线程中执行一个报告片段；线程各自持有数据库连接，结束时关闭"""
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def run_sections(sections, workers):
+    """
+    sections 为 (函数, 参数元组) 的列表，各自独立地查询数据库并返回一个报告片段。
+    按 sections 的顺序逐个产出结果；workers > 1 时放入线程池并发执行（每个线程使用单独的数据库连接），
+    前面的片段一完成即可产出，不必等待全部片段。
+    """
+    if workers <= 1 or len(sections) <= 1:
+        for func, args in sections:
+            yield func(*args)
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(sections))) as executor:
+        futures = [executor.submit(_run_in_own_connection, func, *args) for func, args in sections]
+        for future in futures:
+            yield future.result()
+
+
+def money(value):
+    """金额统一保留两位小数（SQLite 上 Sum 的结果可能丢失小数位）"""
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def book_sales_for_period(start_date, end_date, top_n=None):
+    """
+    从每日销售汇总（DailyBookSales）读取周期内的书籍销售，返回 (排行, 汇总)：
+    排行为按书分组的销量和销售额，按销量降序、书名升序排列，排序和 top_n 截取都在数据库中完成；
+    汇总 {'total_quantity', 'total_revenue'} 由同一筛选条件上的一次 aggregate() 得出。
+    扫描的行数与“天数 × 售出书籍数”成正比，与订单项数量无关。
+    """
+    filters = {}
+    if start_date:
+        filters['date__gte'] = start_date
+    if end_date:
+        filters['date__lte'] = end_date
+    rows = DailyBookSales.objects.filter(**filters)
+    totals = rows.aggregate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+    ranking = rows.values('book__title', 'book__isbn') \
+        .annotate(total_quantity_sold=Sum('quantity'), total_revenue=Sum('revenue')) \
+        .filter(total_quantity_sold__gt=0) \
+        .order_by('-total_quantity_sold', 'book__title', 'book__isbn')
+    if top_n is not None:
+        ranking = ranking[:top_n]
+    return list(ranking), totals
+
+
 class Command(BaseCommand):
-    help = '生成销售报告，并将其导出到文本文件。报告包含上个月和过去7天的销售数据，以及历史顾客消费排行。'
+    help = ('生成销售报告，并将其导出到文本文件。报告包含指定周期（默认上个月和过去7天）的销售数据，以及历史顾客消费排行。'
+            '周期数据读取每日销售汇总，首次使用前请运行 backfill_sales_rollup。')
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -41,90 +145,215 @@ class Command(BaseCommand):
             default='sales_report',
             help='指定报告文件名的前缀。默认为 "sales_report"。'
         )
+        parser.add_argument(
+            '--period',
+            action='append',
+            dest='periods',
+            metavar='SPEC',
+            help='要统计的周期，可重复指定：last-month（上一个完整月份）、days:N（过去 N 天）、'
+                 'month:YYYY-MM（指定月份）或 range:YYYY-MM-DD..YYYY-MM-DD（指定区间）。'
+                 '默认为 last-month 和 days:7。'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='并发生成各报告片段的线程数，每个线程使用单独的数据库连接；1 表示顺序执行。默认为 4。'
+        )
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=10,
+            help='每个周期列出的书籍销量排行条数。默认为 10。'
+        )
+        parser.add_argument(
+            '--top-customers',
+            type=int,
+            default=5,
+            help='历史顾客消费排行的条数。默认为 5。'
+        )
+        parser.add_argument(
+            '--analytics-days',
+            type=int,
+            default=0,
+            help='附加最近 N 天的书籍销售分析（ABC 分类、日均销量、7日移动平均、周环比），需要 numpy。默认为 0（不附加）。'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['txt', 'json', 'jsonl', 'csv'],
+            default='txt',
+            help='输出格式：txt（默认，文本报告）、json、jsonl 或 csv（每类记录一个文件）。'
+                 '机器可读格式中书籍排行、周期汇总、顾客排行各有固定字段。'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='增量模式：从状态文件读取上次的水位线和每日已支付订单数、实付金额，只处理之后的新订单，'
+                 '在各周期统计中附加订单数和实付金额；报告写出后保存新的状态。'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help=f'与 --incremental 一起使用：丢弃已保存的状态，从头重新计算'
+                 f'（例如下单超过 {report_state.REVISION_DAYS} 天的订单被修改或删除之后）。'
+        )
+        parser.add_argument(
+            '--state-file',
+            type=str,
+            help='增量模式的状态文件路径。默认为输出目录下的 "<filename_prefix>_state.json"。'
+        )
         parser.add_argument(
             '--quiet',
             action='store_true',  # 如果提供此参数，则为 True
             help='禁止在控制台输出报告内容（仍会输出文件保存路径和错误）。'
         )
 
-    def _generate_lines_for_period_stats(self, start_date, end_date, period_name, top_n_books=10):
-        """生成指定周期销售统计的文本行列表 (无样式)"""
-        lines = []
-        lines.append(f"\n--- {period_name}销售统计 ({start_date} 至 {end_date}) ---")
-        lines.append(f" (书籍销量排行 Top {top_n_books})")
+    def _period_stats(self, period_spec, period_name, start_date, end_date, top_n_books=10, state=None):
+        """查询指定周期的书籍销量排行和总体销售情况；给出增量状态 state 时附加已支付订单数和实付金额"""
+        book_sales, totals = book_sales_for_period(start_date, end_date, top_n_books)
+        paid_orders, paid_amount = report_state.period_orders(state, start_date, end_date) if state else (None, None)
+        ranking = [
+            {
+                'rank': rank,
+                'isbn': item['book__isbn'],
+                'title': item['book__title'],
+                'quantity': item['total_quantity_sold'],
+                'revenue': money(item['total_revenue']),
+            }
+            for rank, item in enumerate(book_sales, 1)
+        ]
+        return {
+            'type': 'period',
+            'period': period_spec,
+            'period_name': period_name,
+            'start_date': start_date,
+            'end_date': end_date,
+            'top_n': top_n_books,
+            'ranking': ranking,
+            'total_revenue': money(totals['total_revenue']),
+            'total_quantity': totals['total_quantity'] or 0,
+            'top_book': ranking[0] if ranking else None,
+            'paid_orders': paid_orders,
+            'paid_amount': None if paid_amount is None else money(paid_amount),
+        }
 
-        datetime_start = timezone.make_aware(datetime.combine(start_date, datetime.min.time())) if start_date else None
-        datetime_end = timezone.make_aware(datetime.combine(end_date, datetime.max.time())) if end_date else None
+    def _top_customer_stats(self, limit=5):
+        """查询历史顾客消费排行"""
+        # 顾客上冗余的累计消费带索引，取前 limit 名无需扫描订单
+        top_customers = Customer.objects.filter(paid_order_count__gt=0).order_by('-lifetime_spend') \
+            .values('name', 'user__username', 'lifetime_spend')[:limit]
+        ranking = [
+            {
+                'rank': rank,
+                'name': row['name'],
+                'username': row['user__username'],
+                'total_spent': money(row['lifetime_spend']),
+            }
+            for rank, row in enumerate(top_customers, 1)
+        ]
+        return {'type': 'customers', 'limit': limit, 'ranking': ranking}
 
-        paid_orders_filter_kwargs = {'order__status': 'P'}
-        if datetime_start: paid_orders_filter_kwargs['order__order_date__gte'] = datetime_start
-        if datetime_end: paid_orders_filter_kwargs['order__order_date__lte'] = datetime_end
+    def _analytics_stats(self, days, top_n):
+        """最近 days 天的书籍销售分析（读取每日销售汇总，用 NumPy 向量化计算）"""
+        from catalog import analytics  # 依赖 numpy，只在需要时导入
 
-        base_query = OrderItem.objects.filter(**paid_orders_filter_kwargs)
+        end_date = timezone.localdate()
+        start_date = end_date - timedelta(days=days - 1)
+        rows = analytics.SalesMatrix.load(start_date, end_date, source='rollup').summary(top_n=top_n)
+        for row in rows:
+            row['revenue'] = money(row['revenue'])
+        return {'type': 'analytics', 'start_date': start_date, 'end_date': end_date, 'top_n': top_n, 'rows': rows}
+
+    def _generate_lines_for_analytics(self, stats):
+        """生成书籍销售分析的文本行列表 (无样式)"""
+        lines = []
+        lines.append(f"\n\n=== 书籍销售分析 ({stats['start_date']} 至 {stats['end_date']}，按销售额 Top {stats['top_n']}) ===")
+        if not stats['rows']:
+            lines.append("  该时间段内无书籍销售记录。")
+        for rank, row in enumerate(stats['rows'], 1):
+            growth = "无" if row['week_over_week'] is None else f"{row['week_over_week']:+.1%}"
+            lines.append(
+                f"  {rank}. [{row['abc_class']}类] 《{row['title']}》(ISBN: {row['isbn']}) - 销售额: ¥{row['revenue']:.2f}，"
+                f"日均销量: {row['velocity']:.2f}，7日移动平均: {row['moving_average']:.2f}，周环比: {growth}")
+        return lines
+
+    def _generate_lines_for_period_stats(self, stats):
+        """生成指定周期销售统计的文本行列表 (无样式)"""
+        period_name = stats['period_name']
+        top_n_books = stats['top_n']
+        lines = []
+        lines.append(f"\n--- {period_name}销售统计 ({stats['start_date']} 至 {stats['end_date']}) ---")
+        lines.append(f" (书籍销量排行 Top {top_n_books})")
 
         # 1. 书籍按销量（数量）排序
         lines.append(f"\n1. {period_name} 书籍销量排行 (Top {top_n_books} 按售出数量):")
-        books_by_sales_quantity = base_query \
-            .values('book__title', 'book__isbn') \
-            .annotate(total_quantity_sold=Sum('count')) \
-            .order_by('-total_quantity_sold', 'book__title')
-
-        if books_by_sales_quantity.exists():
-            for rank, item in enumerate(books_by_sales_quantity[:top_n_books], 1):
+        if stats['ranking']:
+            for item in stats['ranking']:
                 lines.append(
-                    f"  {rank}. 《{item['book__title']}》(ISBN: {item['book__isbn']}) - 销量: {item['total_quantity_sold']}")
+                    f"  {item['rank']}. 《{item['title']}》(ISBN: {item['isbn']}) - 销量: {item['quantity']}")
         else:
             lines.append(f"  在“{period_name}”内无书籍销售记录。")
 
         # 2. 总体销售情况
         lines.append(f"\n2. {period_name} 总体销售情况:")
-        overall_sales_data = base_query \
-            .aggregate(
-            grand_total_revenue=Sum(ExpressionWrapper(F('count') * F('price'), output_field=DecimalField())),
-            grand_total_quantity=Sum('count')
-        )
-        grand_total_revenue = overall_sales_data.get('grand_total_revenue') or Decimal('0.00')
-        grand_total_quantity = overall_sales_data.get('grand_total_quantity') or 0
-
-        lines.append(f"  总销售额: ¥{grand_total_revenue:.2f}")
-        lines.append(f"  总销售数量: {grand_total_quantity} 本")
-
-        if books_by_sales_quantity.exists():
-            top_book_info = books_by_sales_quantity.first()
-            if top_book_info:
-                top_book_isbn = top_book_info['book__isbn']
-                top_book_revenue_data = base_query.filter(book__isbn=top_book_isbn) \
-                    .aggregate(revenue=Sum(ExpressionWrapper(F('count') * F('price'), output_field=DecimalField())))
-                top_book_revenue = top_book_revenue_data.get('revenue') or Decimal('0.00')
-                lines.append(
-                    f"  {period_name}销量冠军书籍 (按数量): 《{top_book_info['book__title']}》, 销量: {top_book_info['total_quantity_sold']}, 其销售额: ¥{top_book_revenue:.2f}")
+        lines.append(f"  总销售额: ¥{stats['total_revenue']:.2f}")
+        lines.append(f"  总销售数量: {stats['total_quantity']} 本")
+        if stats['paid_orders'] is not None:
+            lines.append(f"  已支付订单: {stats['paid_orders']} 个，实付金额: ¥{stats['paid_amount']:.2f}")
+
+        top_book_info = stats['top_book']
+        if top_book_info:
+            lines.append(
+                f"  {period_name}销量冠军书籍 (按数量): 《{top_book_info['title']}》, 销量: {top_book_info['quantity']}, 其销售额: ¥{top_book_info['revenue']:.2f}")
         else:
             lines.append(f"  {period_name}销量冠军书籍: 无销售记录")
         return lines
 
-    def _generate_lines_for_top_customers(self, limit=5):
+    def _generate_lines_for_top_customers(self, stats):
         """生成历史顾客消费排行文本行列表 (无样式)"""
         lines = []
-        lines.append(f"\n\n=== 历史顾客消费总额排行 (Top {limit}) ===")
-        top_customers_query = Order.objects.filter(status='P', customer__isnull=False) \
-            .values('customer__name', 'customer__user__username') \
-            .annotate(total_spent=Sum('final_total_amount')) \
-            .order_by('-total_spent')
-
-        if top_customers_query.exists():
-            for rank, cust_data in enumerate(top_customers_query[:limit], 1):
-                name = cust_data.get('customer__name') or "N/A"
-                username = cust_data.get('customer__user__username') or "N/A"
-                total_spent = cust_data.get('total_spent') or Decimal('0.00')
-                lines.append(f"  {rank}. {name} (用户名: {username}) - 总消费: ¥{total_spent:.2f}")
+        lines.append(f"\n\n=== 历史顾客消费总额排行 (Top {stats['limit']}) ===")
+        if stats['ranking']:
+            for cust_data in stats['ranking']:
+                name = cust_data['name'] or "N/A"
+                username = cust_data['username'] or "N/A"
+                lines.append(f"  {cust_data['rank']}. {name} (用户名: {username}) - 总消费: ¥{cust_data['total_spent']:.2f}")
         else:
             lines.append("  无顾客消费数据（或所有订单均为访客订单）。")
         return lines
 
+    def _save_state(self, state_path, state, is_quiet):
+        """报告写出后保存增量状态（非增量模式时不做任何事）"""
+        if state is None:
+            return
+        report_state.save_state(state_path, state)
+        if not is_quiet:
+            self.stdout.write(f"增量状态已保存到 {state_path}")
+
+    def _write_machine_report(self, export_format, base_path, sections, workers, is_quiet):
+        """json / jsonl / csv：每个片段一生成就转换为记录写出"""
+        writer_class = report_writers.WRITERS[export_format]
+        with writer_class(base_path, timezone.now()) as writer:
+            for stats in run_sections(sections, workers):
+                for section, record in report_writers.section_records(stats):
+                    writer.write(section, record)
+        for path in writer.paths:
+            msg = f"报告已成功保存到: {path}"
+            self.stdout.write(self.style.SUCCESS(msg) if not is_quiet else msg)
+
     def handle(self, *args, **options):
         output_dir_path = options['output_dir']
         filename_prefix = options['filename_prefix']
         is_quiet = options['quiet']
+        top_n = options['top_n']
+        if top_n <= 0 or options['top_customers'] <= 0 or options['workers'] <= 0:
+            raise CommandError('--top-n、--top-customers 和 --workers 必须为正整数')
+        if options['analytics_days'] > 0:
+            try:
+                import numpy  # noqa: F401
+            except ImportError:
+                raise CommandError('--analytics-days 需要 numpy，请先执行 pip install -r requirements.txt')
+        periods = [(spec, parse_period(spec)) for spec in options['periods'] or DEFAULT_PERIODS]
 
         # 确保输出目录存在
         if not os.path.isabs(output_dir_path):  # 如果不是绝对路径，则基于项目根目录
@@ -135,6 +364,36 @@ class Command(BaseCommand):
         timestamp_str = timezone.now().strftime("%Y%m%d_%H%M%S")
         report_filename = f"{filename_prefix}_{timestamp_str}.txt"
         report_filepath = os.path.join(output_dir_path, report_filename)
+        export_format = options['format']
+
+        # 增量模式：合并水位线之后的新订单；新状态在报告写出后才保存，报告失败时下次从旧水位线重来
+        state = state_path = None
+        if options['incremental']:
+            state_path = options['state_file'] or os.path.join(output_dir_path, f"{filename_prefix}_state.json")
+            state = report_state.empty_state() if options['rebuild'] else report_state.load_state(state_path)
+            processed = report_state.advance(state)
+            if not is_quiet:
+                self.stdout.write(
+                    f"增量状态: 新处理 {processed} 个订单，水位线为订单 #{state['last_order_id']}"
+                    f"（{state['last_order_date'] or '无'}）"
+                )
+        elif options['rebuild']:
+            raise CommandError('--rebuild 需要与 --incremental 一起使用')
+
+        # 各周期的销售统计（默认：上一个完整月份、过去7天）和历史顾客消费排行互不依赖，并发生成后按顺序输出
+        sections = [
+            (self._period_stats, (period_spec, period_name, period_start, period_end, top_n, state))
+            for period_spec, (period_name, period_start, period_end) in periods
+        ]
+        sections.append((self._top_customer_stats, (options['top_customers'],)))
+        if options['analytics_days'] > 0:
+            sections.append((self._analytics_stats, (options['analytics_days'], top_n)))
+
+        if export_format != 'txt':
+            base_path = os.path.join(output_dir_path, f"{filename_prefix}_{timestamp_str}")
+            self._write_machine_report(export_format, base_path, sections, options['workers'], is_quiet)
+            self._save_state(state_path, state, is_quiet)
+            return
 
         all_report_lines = []  # 存储所有报告文本行
 
@@ -144,22 +403,13 @@ class Command(BaseCommand):
         all_report_lines.append(f"生成时间: {timezone.now().strftime('%Y-%m-%d %H:%M:%S %Z')}")
         all_report_lines.append("==============================================")
 
-        # 报告1: 上一个完整月份
-        last_month_start, last_month_end = get_previous_full_month_range()
-        all_report_lines.extend(
-            self._generate_lines_for_period_stats(last_month_start, last_month_end, "上一个完整月份", top_n_books=10)
-        )
-
-        # 报告2: 过去7天
-        last_7_days_start, last_7_days_end = get_last_n_days_range(7)
-        all_report_lines.extend(
-            self._generate_lines_for_period_stats(last_7_days_start, last_7_days_end, "过去7天", top_n_books=10)
-        )
-
-        # 报告3: 历史顾客消费排行
-        all_report_lines.extend(
-            self._generate_lines_for_top_customers(limit=5)
-        )
+        for stats in run_sections(sections, options['workers']):
+            if stats['type'] == 'customers':
+                all_report_lines.extend(self._generate_lines_for_top_customers(stats))
+            elif stats['type'] == 'analytics':
+                all_report_lines.extend(self._generate_lines_for_analytics(stats))
+            else:
+                all_report_lines.extend(self._generate_lines_for_period_stats(stats))
         all_report_lines.append("\n==============================================")
         all_report_lines.append("报告结束")
 
@@ -190,4 +440,6 @@ class Command(BaseCommand):
 
         except IOError as e:
             error_msg = f"\n错误：无法将报告写入文件 {report_filepath}: {e}"
-            self.stderr.write(self.style.ERROR(error_msg) if not is_quiet else error_msg)
\ No newline at end of file
+            self.stderr.write(self.style.ERROR(error_msg) if not is_quiet else error_msg)
+            return
+        self._save_state(state_path, state, is_quiet)
\ No newline at end of file
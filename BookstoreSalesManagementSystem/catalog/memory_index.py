@@ -0,0 +1,115 @@
+# memory_index.py
+# 进程内内存索引（模糊检索、搜索联想）的加载与更新：
+# 首次使用时同步加载；超过最大存活时间后在后台线程重建，重建期间请求继续使用旧索引，建好后整体替换引用。
+# Book 的增量更新在事务提交后应用到当前索引，重建期间同时记入日志，替换前在新索引上重放，避免丢失。
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+class IndexHolder:
+    """
+    持有一个索引对象（需要 add(isbn, title, author)、remove(isbn) 和 built_at 属性）。
+    build 为无参函数，返回新建的索引。
+    """
+
+    def __init__(self, name, build, max_age_setting, default_max_age):
+        self.name = name
+        self.build = build
+        self.max_age_setting = max_age_setting
+        self.default_max_age = default_max_age
+        self._index = None
+        # 保护 _index 的替换和重建日志，只在很短的时间内持有
+        self._lock = threading.Lock()
+        # 同一时间只有一次重建
+        self._build_lock = threading.Lock()
+        self._journal = None
+        self._rebuilding = False
+
+    @property
+    def max_age(self):
+        return getattr(settings, self.max_age_setting, self.default_max_age)
+
+    def is_stale(self, index):
+        max_age = self.max_age
+        return max_age is not None and time.monotonic() - index.built_at > max_age
+
+    def get(self):
+        """返回当前索引；尚未加载时同步加载，已过期时安排后台重建并先返回旧索引"""
+        index = self._index
+        if index is None:
+            # 没有可用的旧索引，只能等待加载；并发请求等待同一次加载
+            with self._build_lock:
+                if self._index is None:
+                    self._rebuild_locked()
+                return self._index
+        if self.is_stale(index):
+            self.schedule_rebuild()
+        return index
+
+    def loaded(self):
+        """已加载的索引；尚未加载时返回 None"""
+        return self._index
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+
+    def rebuild(self):
+        """重建并替换索引（在调用线程中完成）"""
+        with self._build_lock:
+            self._rebuild_locked()
+
+    def _rebuild_locked(self):
+        with self._lock:
+            self._journal = []
+        index = None
+        try:
+            index = self.build()
+        finally:
+            with self._lock:
+                journal, self._journal = self._journal, None
+                if index is not None:
+                    for isbn, fields in journal:
+                        self._apply(index, isbn, fields)
+                    self._index = index
+
+    def schedule_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name=f'{self.name}-index-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        finally:
+            # 后台线程有自己的数据库连接，用完关闭
+            connections.close_all()
+            with self._lock:
+                self._rebuilding = False
+
+    @staticmethod
+    def _apply(index, isbn, fields):
+        if fields is None:
+            index.remove(isbn)
+        else:
+            index.add(isbn, *fields)
+
+    def _update(self, isbn, fields):
+        with self._lock:
+            index = self._index
+            if self._journal is not None:
+                self._journal.append((isbn, fields))
+        if index is not None:
+            self._apply(index, isbn, fields)
+
+    def add(self, isbn, title, author):
+        """书籍新增或修改后调用（应在事务提交后）"""
+        self._update(isbn, (title, author))
+
+    def remove(self, isbn):
+        self._update(isbn, None)
@@ -0,0 +1,44 @@
+from django.db import migrations, OperationalError
+
+# 迁移中使用当时的表结构，不依赖 catalog.search 的当前实现（后者已改为外部内容表，见 0009）
+FTS_TABLE = 'catalog_book_fts'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    Book = apps.get_model('catalog', 'Book')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(isbn UNINDEXED, title, author, press, summary, tokenize='trigram')"
+            )
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (isbn, title, author, press, summary) "
+                f"SELECT isbn, title, author, COALESCE(press, ''), COALESCE(summary, '') "
+                f"FROM {Book._meta.db_table}"
+            )
+    except OperationalError:
+        # SQLite 未编译 FTS5 时不建索引，检索回退到 icontains
+        return
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:39
+
+from django.db import migrations, models
+
+
+def backfill_order_summaries(apps, schema_editor):
+    Order = apps.get_model('catalog', 'Order')
+    OrderItem = apps.get_model('catalog', 'OrderItem')
+
+    lines_by_order = {}
+    for order_id, title, count in OrderItem.objects.order_by('order_id', 'order_item_id') \
+            .values_list('order_id', 'book__title', 'count').iterator(chunk_size=2000):
+        lines_by_order.setdefault(order_id, []).append((title, count))
+
+    orders = []
+    for order in Order.objects.filter(order_id__in=list(lines_by_order)).only('order_id'):
+        lines = lines_by_order[order.order_id]
+        summary = '、'.join(f"《{title}》×{count}" for title, count in lines[:3])
+        if len(lines) > 3:
+            summary += f" 等{len(lines)}种"
+        order.item_count = sum(count for _, count in lines)
+        order.line_summary = summary[:255]
+        orders.append(order)
+    Order.objects.bulk_update(orders, ['item_count', 'line_summary'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Item Count'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='line_summary',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Line Summary'),
+        ),
+        migrations.RunPython(backfill_order_summaries, migrations.RunPython.noop),
+    ]
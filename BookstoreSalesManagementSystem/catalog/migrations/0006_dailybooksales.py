@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:42
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def backfill_daily_sales(apps, schema_editor):
+    """按已支付订单的本地日期和书籍汇总，与 rollup.rebuild() 的逻辑一致"""
+    OrderItem = apps.get_model('catalog', 'OrderItem')
+    DailyBookSales = apps.get_model('catalog', 'DailyBookSales')
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    revenue = ExpressionWrapper(F('count') * F('price'), output_field=money)
+    original = ExpressionWrapper(F('count') * Coalesce('original_unit_price', 'price'), output_field=money)
+    grouped = OrderItem.objects.filter(order__status='P') \
+        .annotate(day=TruncDate('order__order_date', tzinfo=timezone.get_current_timezone())) \
+        .values('day', 'book_id') \
+        .annotate(quantity=Sum('count'), revenue=Sum(revenue), original_revenue=Sum(original)) \
+        .order_by()
+
+    rows = []
+    for row in grouped.iterator(chunk_size=2000):
+        rows.append(DailyBookSales(
+            date=row['day'],
+            book_id=row['book_id'],
+            quantity=row['quantity'],
+            revenue=row['revenue'],
+            original_revenue=row['original_revenue'],
+            discount=row['original_revenue'] - row['revenue'],
+        ))
+        if len(rows) >= 2000:
+            DailyBookSales.objects.bulk_create(rows)
+            rows = []
+    DailyBookSales.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_order_read_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Quantity')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Revenue')),
+                ('original_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Original Revenue')),
+                ('discount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Discount')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='daily_sales', to='catalog.book', verbose_name='Book')),
+            ],
+            options={
+                'verbose_name': 'Daily Book Sales',
+                'verbose_name_plural': 'Daily Book Sales',
+                'unique_together': {('date', 'book')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
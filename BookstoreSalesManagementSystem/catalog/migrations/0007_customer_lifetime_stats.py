@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_customer_stats(apps, schema_editor):
+    Customer = apps.get_model('catalog', 'Customer')
+    Order = apps.get_model('catalog', 'Order')
+
+    totals = Order.objects.filter(status='P', customer__isnull=False).values('customer_id') \
+        .annotate(spend=Sum('final_total_amount'), orders=Count('order_id')).order_by()
+    customers = []
+    for row in totals:
+        customers.append(Customer(
+            user_id=row['customer_id'], lifetime_spend=row['spend'] or Decimal('0.00'), paid_order_count=row['orders']
+        ))
+    Customer.objects.bulk_update(customers, ['lifetime_spend', 'paid_order_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_dailybooksales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Lifetime Spend'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='paid_order_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Paid Order Count'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['-lifetime_spend'], name='customer_lifetime_spend_idx'),
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_customer_lifetime_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='import_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Import Hash'),
+        ),
+    ]
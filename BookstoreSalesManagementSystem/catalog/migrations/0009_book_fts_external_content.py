@@ -0,0 +1,76 @@
+from django.db import migrations, OperationalError
+
+# 全文索引改为以 catalog_book 为内容表的 FTS5 外部内容表，按 rowid 对应，由触发器逐行同步：
+# 原先的独立影子表中 isbn 没有索引，删除或覆盖一本书都要扫描整个索引。
+# 迁移中写入当时的 DDL，不依赖 catalog.search 的当前实现。
+FTS_TABLE = 'catalog_book_fts'
+COLUMNS = ('isbn', 'title', 'author', 'press', 'summary')
+TRIGGERS = ('catalog_book_fts_ai', 'catalog_book_fts_ad', 'catalog_book_fts_au')
+
+
+def _trigger_sql(book_table):
+    columns = ', '.join(COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in COLUMNS)
+    changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in COLUMNS)
+    insert_new = f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (new.rowid, {new_values});"
+    delete_old = f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS catalog_book_fts_ai AFTER INSERT ON {book_table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS catalog_book_fts_ad AFTER DELETE ON {book_table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS catalog_book_fts_au AFTER UPDATE OF {columns} ON {book_table} "
+        f"WHEN {changed} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def create_external_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    book_table = apps.get_model('catalog', 'Book')._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(isbn UNINDEXED, title, author, press, summary, "
+                f"content='{book_table}', content_rowid='rowid', tokenize='trigram')"
+            )
+            for sql in _trigger_sql(book_table):
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError:
+        # SQLite 未编译 FTS5 时不建索引，检索回退到 icontains
+        return
+
+
+def restore_shadow_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    book_table = apps.get_model('catalog', 'Book')._meta.db_table
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} "
+                f"USING fts5(isbn UNINDEXED, title, author, press, summary, tokenize='trigram')"
+            )
+        except OperationalError:
+            return
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (isbn, title, author, press, summary) "
+            f"SELECT isbn, title, author, COALESCE(press, ''), COALESCE(summary, '') FROM {book_table}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_book_import_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_external_index, restore_shadow_index),
+    ]
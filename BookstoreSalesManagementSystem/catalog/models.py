@@ -19,10 +19,16 @@ class Book(models.Model):
     price = models.DecimalField(verbose_name='Price', max_digits=6, decimal_places=2)
     stock = models.PositiveIntegerField(verbose_name='Stock', default=0)
     summary = models.TextField(verbose_name='Summary', max_length=1000, blank=True, null=True)
+    # 最近一次由 import_books 写入时源记录的摘要，增量导入（--diff）据此跳过未变化的记录
+    import_hash = models.CharField(verbose_name='Import Hash', max_length=32, blank=True, default='', editable=False)
 
     class Meta:
         verbose_name = 'Book'
         verbose_name_plural = 'Books'
+        indexes = [
+            # 书籍列表按 (title, isbn) 做游标分页
+            models.Index(fields=['title', 'isbn'], name='book_title_isbn_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -39,10 +45,17 @@ class Customer(models.Model):
     name = models.CharField(verbose_name='Name', max_length=100)
     vip_status = models.BooleanField(verbose_name='VIP', default=False)
     phone = models.CharField(verbose_name='Phone', max_length=20)
+    # 已支付订单的累计金额和数量，随订单支付状态在同一事务中增减（见 rollup.record_customer_order）
+    lifetime_spend = models.DecimalField(verbose_name='Lifetime Spend', max_digits=12, decimal_places=2,
+                                         default=Decimal('0.00'))
+    paid_order_count = models.PositiveIntegerField(verbose_name='Paid Order Count', default=0)
 
     class Meta:
         verbose_name = 'Customer'
         verbose_name_plural = 'Customers'
+        indexes = [
+            models.Index(fields=['-lifetime_spend'], name='customer_lifetime_spend_idx'),
+        ]
 
     @property
     def is_vip(self):
@@ -78,6 +91,10 @@ class Order(models.Model):
     ]
     status = models.CharField(verbose_name='Order Status', max_length=1, choices=STATUS_CHOICES, default='U')
 
+    # 冗余的订单项概要，订单列表无需再查询订单项（下单时写入，订单项增删改时由 signals.py 刷新）
+    item_count = models.PositiveIntegerField(verbose_name='Item Count', default=0)
+    line_summary = models.CharField(verbose_name='Line Summary', max_length=255, blank=True, default='')
+
     class Meta:
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
@@ -99,6 +116,30 @@ class Order(models.Model):
         status_display = self.get_status_display_value()
         return f"Order #{self.order_id} - {customer_name} ({status_display})"
 
+    @staticmethod
+    def summarize_lines(lines, max_titles=3):
+        """lines 为 (书名, 数量) 列表，生成如 “《A》×2、《B》×1 等3种” 的概要"""
+        lines = list(lines)
+        summary = '、'.join(f"《{title}》×{count}" for title, count in lines[:max_titles])
+        if len(lines) > max_titles:
+            summary += f" 等{len(lines)}种"
+        return summary[:255]
+
+    def set_line_summary(self, lines):
+        """根据 (书名, 数量) 列表填写 item_count 和 line_summary（不保存）"""
+        lines = list(lines)
+        self.item_count = sum(count for _, count in lines)
+        self.line_summary = self.summarize_lines(lines)
+
+    @classmethod
+    def refresh_line_summary(cls, order_id):
+        """按当前的订单项重新计算并写回订单的 item_count 和 line_summary（不触发 Order 的保存信号）"""
+        order = cls(pk=order_id)
+        order.set_line_summary(
+            OrderItem.objects.filter(order_id=order_id).order_by('order_item_id').values_list('book__title', 'count')
+        )
+        cls.objects.filter(pk=order_id).update(item_count=order.item_count, line_summary=order.line_summary)
+
     @property
     def discount_amount(self):
         if self.original_total_amount is not None and self.final_total_amount is not None and self.vip_discount_applied:
@@ -161,23 +202,36 @@ class Cart(models.Model):
             return f"Anonymous Cart (Session: {self.session_key[:8]}..., ID: {self.cart_id})"
         return f"Cart (ID: {self.cart_id})"
 
+    def get_pricing(self, refresh=False):
+        """
+        一次查询计算整个购物车的价格快照，结果缓存在实例上，下面几个金额属性共用同一个快照；
+        购物车行变化后传 refresh=True 或调用 refresh_from_db() 重新计算。
+        """
+        if refresh or '_pricing' not in self.__dict__:
+            from .pricing import price_cart
+            self._pricing = price_cart(self)
+        return self._pricing
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_pricing', None)
+        super().refresh_from_db(*args, **kwargs)
+
     @property
     def total_amount(self):  # 这将是折扣后的总价
-        return sum(item.subtotal for item in self.items.all())
+        return self.get_pricing().total_effective
 
     @property
     def original_total_amount(self):
-        return sum(item.original_subtotal for item in self.items.all())
+        return self.get_pricing().total_original
 
     @property
     def is_vip_discount_active(self):
         # 检查是否有顾客，顾客是否是VIP，并且实际总价小于原总价
-        return bool(
-            self.customer and self.customer.is_vip and self.items.exists() and self.total_amount < self.original_total_amount)
+        return self.get_pricing().vip_discount_applied
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.get_pricing().total_items
 
 
 class CartItem(models.Model):
@@ -223,3 +277,48 @@ class CartItem(models.Model):
     def original_subtotal(self):
         """计算此商品项的原价小计"""
         return self.price_at_addition * self.quantity
+
+
+class StockReservation(models.Model):
+    """
+    购物车占用的库存。加入购物车时库存已经从 Book.stock 中扣除，
+    过期未结算的预留会被退回库存；结算时预留转为订单销售并删除。
+    """
+    reservation_id = models.AutoField(verbose_name='Reservation ID', primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations', verbose_name='Book')
+    # 存放在 session 中的随机令牌；登录时 session_key 会轮换，令牌不会
+    holder_key = models.CharField(verbose_name='Holder Key', max_length=40, db_index=True)
+    quantity = models.PositiveIntegerField(verbose_name='Quantity')
+    created_at = models.DateTimeField(verbose_name='Created At', auto_now_add=True)
+    expires_at = models.DateTimeField(verbose_name='Expires At', db_index=True)
+
+    class Meta:
+        unique_together = [['holder_key', 'book']]
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+
+    def __str__(self):
+        return f"{self.quantity} x {self.book_id} (Holder {self.holder_key[:8]}..., until {self.expires_at})"
+
+
+class DailyBookSales(models.Model):
+    """
+    按（本地日期, 书籍）汇总的已支付销售，供销售报告使用，无需扫描全部订单项。
+    订单以已支付状态创建或改为已支付时累加，撤销支付或删除已支付订单时扣回；
+    可用 backfill_sales_rollup 命令从订单项重建。
+    """
+    date = models.DateField(verbose_name='Date')
+    book = models.ForeignKey(Book, on_delete=models.PROTECT, related_name='daily_sales', verbose_name='Book')
+    quantity = models.IntegerField(verbose_name='Quantity', default=0)
+    revenue = models.DecimalField(verbose_name='Revenue', max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    original_revenue = models.DecimalField(verbose_name='Original Revenue', max_digits=12, decimal_places=2,
+                                           default=Decimal('0.00'))
+    discount = models.DecimalField(verbose_name='Discount', max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = [['date', 'book']]
+        verbose_name = 'Daily Book Sales'
+        verbose_name_plural = 'Daily Book Sales'
+
+    def __str__(self):
+        return f"{self.date} {self.book_id}: {self.quantity} (¥{self.revenue})"
@@ -0,0 +1,133 @@
+# pagination.py
+# 书籍目录的游标（keyset）分页：按 (title, isbn) 定位下一页，翻到任何深度都只扫描一页的数据，
+# 不像 OFFSET 分页那样越往后越慢。
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(payload):
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(payload, dict):
+        raise InvalidCursor(cursor)
+    return payload
+
+
+class CursorPage:
+    """一页结果及前后页游标；没有对应页时游标为 None"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    按 (title, isbn) 排序的游标分页。
+    游标内容为 {'after': [title, isbn]} 或 {'before': [title, isbn]}。
+    """
+    key_fields = ('title', 'isbn')
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.key_fields]
+
+    def page(self, cursor=None):
+        payload = decode_cursor(cursor) if cursor else {}
+        title_field, isbn_field = self.key_fields
+
+        if 'before' in payload:
+            title, isbn = self._validate_key(payload['before'])
+            queryset = self.queryset.filter(
+                Q(**{f'{title_field}__lt': title}) | Q(**{title_field: title, f'{isbn_field}__lt': isbn})
+            ).order_by(f'-{title_field}', f'-{isbn_field}')
+            rows = list(queryset[:self.per_page + 1])
+            has_more_before = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(
+                rows,
+                next_cursor=encode_cursor({'after': self._key(rows[-1])}) if rows else None,
+                previous_cursor=encode_cursor({'before': self._key(rows[0])}) if has_more_before else None,
+            )
+
+        queryset = self.queryset
+        if 'after' in payload:
+            title, isbn = self._validate_key(payload['after'])
+            queryset = queryset.filter(
+                Q(**{f'{title_field}__gt': title}) | Q(**{title_field: title, f'{isbn_field}__gt': isbn})
+            )
+        rows = list(queryset.order_by(title_field, isbn_field)[:self.per_page + 1])
+        has_more_after = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows,
+            next_cursor=encode_cursor({'after': self._key(rows[-1])}) if has_more_after else None,
+            previous_cursor=encode_cursor({'before': self._key(rows[0])}) if rows and 'after' in payload else None,
+        )
+
+    @staticmethod
+    def _validate_key(key):
+        if not isinstance(key, list) or len(key) != 2 or not all(isinstance(part, str) for part in key):
+            raise InvalidCursor(key)
+        return key
+
+
+class RankedPaginator:
+    """
+    对全文检索已排好序的 ISBN 列表分页（列表长度受 BOOK_SEARCH_MAX_RESULTS 限制），
+    游标内容为 {'rank': 起始位置}，每页只按主键取出当页书籍。
+    """
+
+    def __init__(self, queryset, ranked_isbns, per_page):
+        self.queryset = queryset
+        self.ranked_isbns = ranked_isbns
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        payload = decode_cursor(cursor) if cursor else {}
+        start = payload.get('rank', 0)
+        if not isinstance(start, int) or start < 0:
+            raise InvalidCursor(cursor)
+
+        page_isbns = self.ranked_isbns[start:start + self.per_page]
+        books = self.queryset.in_bulk(page_isbns)
+        rows = [books[isbn] for isbn in page_isbns if isbn in books]
+        end = start + self.per_page
+        return CursorPage(
+            rows,
+            next_cursor=encode_cursor({'rank': end}) if end < len(self.ranked_isbns) else None,
+            previous_cursor=encode_cursor({'rank': max(start - self.per_page, 0)}) if start > 0 else None,
+        )
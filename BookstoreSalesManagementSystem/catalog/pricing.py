@@ -0,0 +1,112 @@
+# pricing.py
+# 购物车计价：一次取出购物车行和书籍，单次遍历算出原价、实付价和优惠，
+# 结果是不可变的快照，view_cart、checkout 和订单创建共用同一份数据，不再重复查询。
+from dataclasses import dataclass
+from decimal import Decimal
+
+from . import book_cache
+from .models import CartItem, VIP_DISCOUNT_RATE
+
+ZERO = Decimal('0.00')
+
+
+def vip_price(price):
+    return (price * VIP_DISCOUNT_RATE).quantize(Decimal('0.01'))
+
+
+@dataclass(frozen=True)
+class PricedLine:
+    book: object
+    quantity: int
+    original_price_each: Decimal
+    effective_price_each: Decimal
+
+    @property
+    def isbn(self):
+        return self.book.isbn
+
+    @property
+    def subtotal_original(self):
+        return self.original_price_each * self.quantity
+
+    @property
+    def subtotal_effective(self):
+        return self.effective_price_each * self.quantity
+
+    @property
+    def item_has_discount(self):
+        return self.effective_price_each < self.original_price_each
+
+
+@dataclass(frozen=True)
+class CartPricing:
+    lines: tuple
+    is_vip: bool
+    total_original: Decimal
+    total_effective: Decimal
+    total_items: int
+
+    @property
+    def is_empty(self):
+        return not self.lines
+
+    @property
+    def vip_discount_applied(self):
+        return self.is_vip and bool(self.lines) and self.total_effective < self.total_original
+
+    @property
+    def discount_amount(self):
+        return self.total_original - self.total_effective if self.vip_discount_applied else ZERO
+
+    def quantities(self):
+        """{isbn: 数量}，用于库存预留的结算"""
+        return {line.isbn: line.quantity for line in self.lines}
+
+
+def price_lines(entries, is_vip):
+    """entries 为 (book, 数量, 原单价) 的可迭代对象，单次遍历生成 CartPricing"""
+    lines = []
+    total_original = ZERO
+    total_effective = ZERO
+    total_items = 0
+    for book, quantity, unit_price in entries:
+        effective = vip_price(unit_price) if is_vip else unit_price
+        line = PricedLine(book, quantity, unit_price, effective)
+        lines.append(line)
+        total_original += line.subtotal_original
+        total_effective += line.subtotal_effective
+        total_items += quantity
+    return CartPricing(tuple(lines), is_vip, total_original, total_effective, total_items)
+
+
+def price_cart(cart):
+    """数据库购物车：一条查询取出购物车行、书籍和顾客，按加入时的价格计价"""
+    items = list(CartItem.objects.filter(cart=cart).select_related('book', 'cart__customer'))
+    customer = items[0].cart.customer if items else None
+    is_vip = bool(customer and customer.is_vip)
+    return price_lines(((item.book, item.quantity, item.price_at_addition) for item in items), is_vip)
+
+
+def price_session_cart(session_cart, is_vip):
+    """
+    session 购物车 {isbn: {'quantity': n}}：按当前书价计价。
+    返回 (CartPricing, {isbn: 原因})，原因为 'missing'（书已不存在）、'invalid'（数量无法解析）或 'empty'（数量不为正）。
+    """
+    books = book_cache.get_many(session_cart.keys())
+    entries = []
+    removed = {}
+    for isbn, item_data in session_cart.items():
+        book = books.get(isbn)
+        if book is None:
+            removed[isbn] = 'missing'
+            continue
+        try:
+            quantity = int(item_data.get('quantity', 0))
+        except (ValueError, TypeError, AttributeError):
+            removed[isbn] = 'invalid'
+            continue
+        if quantity <= 0:
+            removed[isbn] = 'empty'
+            continue
+        entries.append((book, quantity, book.price))
+    return price_lines(entries, is_vip), removed
@@ -0,0 +1,158 @@
+# report_state.py
+# 销售报告的增量状态：保存上次处理到的订单（水位线）和按本地日期累计的已支付订单数与实付金额，
+# 下次运行只读取水位线之后的新订单并合并进来，而不是重新扫描全部历史订单。
+# 每日销售汇总（DailyBookSales）按书籍统计，得不到订单数和订单级的实付金额，由这里补充；
+# 顾客累计消费直接读取 Customer.lifetime_spend，不在状态中重复保存。
+# 下单后 REVISION_DAYS 天内的订单仍可能变化，状态中记录这些订单：
+# 未支付的（pending_order_ids）在支付后计入，已计入的（recent_paid）被改回未支付、删除或改动金额时扣回旧值。
+# 超过该期限仍未支付的订单视为放弃，不再复查；更早的订单被修改时需要用 --rebuild 重新计算。
+import json
+import os
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import Order
+
+STATE_VERSION = 3
+PAID = 'P'
+REVISION_DAYS = 30
+# 按 ID 复查订单时每条查询的 ID 数，不超过 SQLite 的绑定变量上限
+QUERY_CHUNK_SIZE = 500
+
+
+def empty_state():
+    return {
+        'version': STATE_VERSION,
+        'last_order_id': 0,
+        'last_order_date': None,
+        'pending_order_ids': [],
+        # {订单 ID: [计入的日期, 计入的金额]}，仍在复查期内的已计入订单
+        'recent_paid': {},
+        # {本地日期: [已支付订单数, 实付金额]}
+        'daily_orders': {},
+    }
+
+
+def load_state(path):
+    """读取状态文件；文件不存在或版本不符时返回空状态（相当于重建）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return empty_state()
+    if state.get('version') != STATE_VERSION:
+        return empty_state()
+    return state
+
+
+def save_state(path, state):
+    """先写临时文件再替换，中途失败不会留下损坏的状态文件"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _local_day(order_date):
+    return timezone.localdate(order_date).isoformat()
+
+
+def _add_order(daily, day, amount, sign=1):
+    """把一个已支付订单计入（sign=1）或移出（sign=-1）所在日期的订单数和实付金额"""
+    count, total = daily.get(day, (0, '0'))
+    count += sign
+    total = Decimal(total) + sign * Decimal(amount)
+    if count:
+        daily[day] = [count, str(total)]
+    else:
+        daily.pop(day, None)
+
+
+def _tracked_orders(order_ids, chunk_size=QUERY_CHUNK_SIZE):
+    """按块查询仍在复查的订单，返回 {订单 ID: (下单时间, 状态, 金额)}；已删除的订单不在结果中"""
+    order_ids = sorted(order_ids)
+    orders = {}
+    for i in range(0, len(order_ids), chunk_size):
+        rows = Order.objects.filter(order_id__in=order_ids[i:i + chunk_size]) \
+            .values_list('order_id', 'order_date', 'status', 'final_total_amount')
+        orders.update((row[0], row[1:]) for row in rows)
+    return orders
+
+
+def advance(state, chunk_size=2000, now=None):
+    """
+    把水位线之后的订单合并进 state（原地修改），并复查仍在复查期内的订单：
+    未支付的改为已支付后计入，已计入的改回未支付、被删除或日期和金额变化时扣回旧值，超过复查期的不再跟踪。
+    返回新计入或扣回的订单数。
+    """
+    daily = state['daily_orders']
+    pending = set(state['pending_order_ids'])
+    recent_paid = {int(order_id): entry for order_id, entry in state['recent_paid'].items()}
+    cutoff = (now or timezone.now()) - timedelta(days=REVISION_DAYS)
+    processed = 0
+
+    def count_paid(order_id, order_date, amount):
+        day = _local_day(order_date)
+        _add_order(daily, day, amount)
+        if order_date >= cutoff:
+            recent_paid[order_id] = [day, str(amount)]
+
+    # 1. 复查此前记录的订单
+    orders = _tracked_orders(pending | set(recent_paid))
+    for order_id in list(pending):
+        order = orders.get(order_id)
+        if order is None:
+            pending.discard(order_id)  # 已删除
+            continue
+        order_date, status, amount = order
+        if status == PAID:
+            pending.discard(order_id)
+            count_paid(order_id, order_date, amount)
+            processed += 1
+        elif order_date < cutoff:
+            pending.discard(order_id)  # 超过复查期仍未支付，视为放弃
+    for order_id, (day, amount) in list(recent_paid.items()):
+        order = orders.get(order_id)
+        if order is not None and order[1] == PAID and [_local_day(order[0]), str(order[2])] == [day, amount]:
+            if order[0] < cutoff:
+                del recent_paid[order_id]  # 超过复查期，不再变化
+            continue
+        # 已计入的订单被改回未支付、被删除或改动了日期和金额：扣回当初计入的值
+        del recent_paid[order_id]
+        _add_order(daily, day, amount, sign=-1)
+        if order is not None:
+            if order[1] == PAID:
+                count_paid(order_id, order[0], order[2])
+            elif order[0] >= cutoff:
+                pending.add(order_id)
+        processed += 1
+
+    # 2. 水位线之后的新订单
+    new_orders = Order.objects.filter(order_id__gt=state['last_order_id']).order_by('order_id') \
+        .values_list('order_id', 'order_date', 'status', 'final_total_amount')
+    for order_id, order_date, status, amount in new_orders.iterator(chunk_size=chunk_size):
+        if status == PAID:
+            count_paid(order_id, order_date, amount)
+        elif order_date >= cutoff:
+            pending.add(order_id)
+        state['last_order_id'] = order_id
+        state['last_order_date'] = order_date.isoformat()
+        processed += 1
+
+    state['pending_order_ids'] = sorted(pending)
+    state['recent_paid'] = {str(order_id): entry for order_id, entry in sorted(recent_paid.items())}
+    return processed
+
+
+def period_orders(state, start_date, end_date):
+    """从 state 中合计 [start_date, end_date]（含两端，省略表示不限）内的已支付订单数和实付金额"""
+    start = start_date.isoformat() if start_date else None
+    end = end_date.isoformat() if end_date else None
+    count, total = 0, Decimal('0')
+    for day, (day_count, day_total) in state['daily_orders'].items():
+        if (start is None or day >= start) and (end is None or day <= end):
+            count += day_count
+            total += Decimal(day_total)
+    return count, total
@@ -0,0 +1,169 @@
+# report_writers.py
+# 销售报告的机器可读输出（json / jsonl / csv）。每个报告片段被拆成若干条固定字段的记录，
+# 写入器收到一条就写一条，不在内存中拼接整份报告。各类记录的字段见 SECTION_FIELDS。
+# 报告生成中途出错时不保留输出文件，避免把不完整的报告当作完整结果。
+import csv
+import json
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+SECTION_FIELDS = {
+    'book_ranking': (
+        'period', 'period_name', 'start_date', 'end_date', 'rank', 'isbn', 'title', 'quantity', 'revenue',
+    ),
+    'period_totals': (
+        'period', 'period_name', 'start_date', 'end_date', 'total_revenue', 'total_quantity',
+        'top_isbn', 'top_title', 'top_quantity', 'top_revenue', 'paid_orders', 'paid_amount',
+    ),
+    'customer_ranking': (
+        'rank', 'name', 'username', 'total_spent',
+    ),
+    'book_analytics': (
+        'start_date', 'end_date', 'rank', 'isbn', 'title', 'abc_class', 'quantity', 'revenue',
+        'velocity', 'moving_average', 'week_over_week',
+    ),
+}
+
+
+def section_records(stats):
+    """把 sales_report 生成的一个片段（周期统计、顾客排行或书籍销售分析）转换为 (记录类型, 记录) 序列"""
+    if stats['type'] == 'customers':
+        for row in stats['ranking']:
+            yield 'customer_ranking', row
+        return
+    if stats['type'] == 'analytics':
+        for rank, row in enumerate(stats['rows'], 1):
+            yield 'book_analytics', {'start_date': stats['start_date'], 'end_date': stats['end_date'], 'rank': rank, **row}
+        return
+
+    period = {key: stats[key] for key in ('period', 'period_name', 'start_date', 'end_date')}
+    for row in stats['ranking']:
+        yield 'book_ranking', {**period, **row}
+    top_book = stats['top_book'] or {}
+    yield 'period_totals', {
+        **period,
+        'total_revenue': stats['total_revenue'],
+        'total_quantity': stats['total_quantity'],
+        'top_isbn': top_book.get('isbn'),
+        'top_title': top_book.get('title'),
+        'top_quantity': top_book.get('quantity'),
+        'top_revenue': top_book.get('revenue'),
+        # 只有增量模式才有，否则为空
+        'paid_orders': stats['paid_orders'],
+        'paid_amount': stats['paid_amount'],
+    }
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _ordered(section, record):
+    return {field: record.get(field) for field in SECTION_FIELDS[section]}
+
+
+class BaseReportWriter:
+    """
+    base_path 为不含扩展名的输出路径；作为上下文管理器使用。
+    先写入 "<文件名>.tmp"，正常退出时才改名为正式文件；中途出错时删除临时文件，不留下不完整的报告。
+    """
+
+    def __init__(self, base_path, generated_at):
+        self.base_path = base_path
+        self.generated_at = generated_at
+        self.paths = []
+        self._files = []
+
+    def _open(self, path):
+        tmp_path = f'{path}.tmp'
+        f = open(tmp_path, 'w', encoding='utf-8', newline='')
+        self._files.append((f, tmp_path, path))
+        self.paths.append(path)
+        return f
+
+    def open(self):
+        raise NotImplementedError
+
+    def write(self, section, record):
+        raise NotImplementedError
+
+    def finish(self):
+        """全部记录写完后调用，写入文件结尾"""
+
+    def close(self):
+        self.finish()
+        for f, tmp_path, path in self._files:
+            f.close()
+            os.replace(tmp_path, path)
+
+    def abort(self):
+        for f, tmp_path, _ in self._files:
+            f.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.paths = []
+
+    def __enter__(self):
+        try:
+            self.open()
+        except BaseException:
+            self.abort()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class JsonLinesReportWriter(BaseReportWriter):
+    """每行一条记录，带 section 字段；第一行为报告元信息"""
+
+    def open(self):
+        self.file = self._open(f'{self.base_path}.jsonl')
+        self.file.write(_dumps({'section': 'report', 'generated_at': self.generated_at}) + '\n')
+
+    def write(self, section, record):
+        self.file.write(_dumps({'section': section, **_ordered(section, record)}) + '\n')
+
+
+class JsonReportWriter(BaseReportWriter):
+    """单个 JSON 对象：{"generated_at": ..., "records": [{"section": ..., ...}, ...]}，记录逐条追加写入"""
+
+    def open(self):
+        self.file = self._open(f'{self.base_path}.json')
+        self.file.write('{"generated_at": %s, "records": [' % _dumps(self.generated_at))
+        self.count = 0
+
+    def write(self, section, record):
+        self.file.write((',\n' if self.count else '\n') + _dumps({'section': section, **_ordered(section, record)}))
+        self.count += 1
+
+    def finish(self):
+        self.file.write('\n]}\n')
+
+
+class CsvReportWriter(BaseReportWriter):
+    """每类记录一个 CSV 文件（<base>_<section>.csv），表头固定，没有数据时也会生成只有表头的文件"""
+
+    def open(self):
+        self.files = {}
+        self.writers = {}
+        for section, fields in SECTION_FIELDS.items():
+            self.files[section] = self._open(f'{self.base_path}_{section}.csv')
+            self.files[section].write('\ufeff')  # BOM，便于 Excel 正确识别中文
+            self.writers[section] = csv.writer(self.files[section])
+            self.writers[section].writerow(fields)
+
+    def write(self, section, record):
+        self.writers[section].writerow([record.get(field) for field in SECTION_FIELDS[section]])
+
+
+WRITERS = {
+    'json': JsonReportWriter,
+    'jsonl': JsonLinesReportWriter,
+    'csv': CsvReportWriter,
+}
@@ -0,0 +1,178 @@
+# rollup.py
+# 每日销售汇总（DailyBookSales）：订单计入已支付时按（本地日期, 书籍）累加数量和金额，
+# 撤销时扣回。销售报告按日期范围读取汇总行，开销与“天数 × 售出书籍数”成正比，而不是订单项数。
+# 顾客的累计消费和已支付订单数（Customer.lifetime_spend / paid_order_count）在同一时机增减。
+# 已支付订单的订单项、实付金额或顾客被修改时，signals.py 扣回旧值并计入新值。
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum, F, ExpressionWrapper, DecimalField
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Customer, DailyBookSales, Order, OrderItem
+
+PAID = 'P'
+SUM_FIELDS = ('quantity', 'revenue', 'original_revenue', 'discount')
+
+
+def order_day(order):
+    """订单计入的日期：下单时间的本地日期，与报告按本地日期划分周期一致"""
+    return timezone.localdate(order.order_date)
+
+
+def line_totals(items):
+    """items 为 OrderItem 的可迭代对象，返回 {isbn: [数量, 实收, 原价金额, 优惠]}"""
+    totals = {}
+    for item in items:
+        revenue = item.price * item.count
+        original = (item.original_unit_price or item.price) * item.count
+        row = totals.setdefault(item.book_id, [0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')])
+        row[0] += item.count
+        row[1] += revenue
+        row[2] += original
+        row[3] += original - revenue
+    return totals
+
+
+def _apply(day, totals, sign):
+    """把 totals 按 sign（1 累加 / -1 扣回）合并到 day 的汇总行：锁定已有行批量更新，缺少的批量插入"""
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                existing = {
+                    row.book_id: row for row in
+                    DailyBookSales.objects.select_for_update().filter(date=day, book_id__in=list(totals))
+                }
+                new_rows = []
+                for isbn, values in totals.items():
+                    row = existing.get(isbn)
+                    if row is None:
+                        row = DailyBookSales(date=day, book_id=isbn)
+                        new_rows.append(row)
+                    for field, value in zip(SUM_FIELDS, values):
+                        setattr(row, field, getattr(row, field) + sign * value)
+                DailyBookSales.objects.bulk_update(list(existing.values()), SUM_FIELDS)
+                DailyBookSales.objects.bulk_create(new_rows)
+            return
+        except IntegrityError:
+            # 并发的订单刚插入了同一天同一本书的汇总行：重试一次，这次会锁定并更新它
+            if attempt:
+                raise
+
+
+def record_order(order, items=None, sign=1):
+    """
+    把已支付订单计入（sign=1）或移出（sign=-1）每日汇总。
+    items 为该订单的 OrderItem 列表，省略时从数据库读取；需要在调用方的事务中执行。
+    """
+    if items is None:
+        items = OrderItem.objects.filter(order=order).only('book_id', 'count', 'price', 'original_unit_price')
+    totals = line_totals(items)
+    if totals:
+        _apply(order_day(order), totals, sign)
+
+
+def record_customer_order(order, sign=1):
+    """已支付订单计入（sign=1）或移出（sign=-1）顾客的累计消费和订单数，一条 UPDATE ... SET x = x + n"""
+    if order.customer_id is None:
+        return
+    Customer.objects.filter(pk=order.customer_id).update(
+        lifetime_spend=F('lifetime_spend') + sign * order.final_total_amount,
+        paid_order_count=F('paid_order_count') + sign,
+    )
+
+
+def record_paid_order(order, items=None, sign=1):
+    """订单计入或移出已支付销售：同时更新每日销售汇总和顾客累计值；需要在调用方的事务中执行"""
+    record_order(order, items, sign)
+    record_customer_order(order, sign)
+
+
+def record_order_items(order_id, items, sign=1):
+    """
+    单独增删改订单项（例如在后台）时，把这些订单项计入（sign=1）或移出（sign=-1）所属订单的每日汇总；
+    订单未支付时不处理。需要在调用方的事务中执行。
+    """
+    order = Order.objects.filter(pk=order_id, status=PAID).only('order_date').first()
+    if order is not None:
+        record_order(order, items, sign)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def rebuild(start_date=None, end_date=None, batch_size=1000):
+    """
+    从订单项重建 [start_date, end_date]（含两端，省略表示不限）内的每日汇总，返回写入的行数。
+    一条分组查询按本地日期和书籍汇总，在一个事务中替换旧的汇总行。
+    """
+    items = OrderItem.objects.filter(order__status=PAID)
+    rollup = DailyBookSales.objects.all()
+    if start_date:
+        items = items.filter(order__order_date__gte=_day_start(start_date))
+        rollup = rollup.filter(date__gte=start_date)
+    if end_date:
+        items = items.filter(order__order_date__lt=_day_start(end_date + timedelta(days=1)))
+        rollup = rollup.filter(date__lte=end_date)
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    revenue = ExpressionWrapper(F('count') * F('price'), output_field=money)
+    original = ExpressionWrapper(F('count') * Coalesce('original_unit_price', 'price'), output_field=money)
+    grouped = items \
+        .annotate(day=TruncDate('order__order_date', tzinfo=timezone.get_current_timezone())) \
+        .values('day', 'book_id') \
+        .annotate(quantity=Sum('count'), revenue=Sum(revenue), original_revenue=Sum(original)) \
+        .order_by()
+
+    written = 0
+    with transaction.atomic():
+        rollup.delete()
+        # 边读边按批写入，内存中最多保留 batch_size 行
+        rows = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            rows.append(DailyBookSales(
+                date=row['day'],
+                book_id=row['book_id'],
+                quantity=row['quantity'],
+                revenue=row['revenue'],
+                original_revenue=row['original_revenue'],
+                discount=row['original_revenue'] - row['revenue'],
+            ))
+            if len(rows) >= batch_size:
+                DailyBookSales.objects.bulk_create(rows)
+                written += len(rows)
+                rows = []
+        DailyBookSales.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def customer_stats_mismatches():
+    """
+    按已支付订单重新计算每位顾客的累计消费和订单数，与 Customer 上保存的值比较。
+    返回 [(customer, 正确的累计消费, 正确的订单数)]，只包含不一致的顾客。
+    """
+    actual = {
+        row['customer_id']: (Decimal(row['spend'] or 0).quantize(Decimal('0.01')), row['orders'])
+        for row in Order.objects.filter(status=PAID, customer__isnull=False).values('customer_id')
+        .annotate(spend=Sum('final_total_amount'), orders=Count('order_id')).order_by()
+    }
+    mismatches = []
+    for customer in Customer.objects.only('user_id', 'name', 'lifetime_spend', 'paid_order_count').iterator():
+        spend, orders = actual.get(customer.pk, (Decimal('0.00'), 0))
+        if customer.lifetime_spend != spend or customer.paid_order_count != orders:
+            mismatches.append((customer, spend, orders))
+    return mismatches
+
+
+def fix_customer_stats(mismatches, batch_size=500):
+    """把 customer_stats_mismatches() 的结果写回 Customer"""
+    customers = []
+    for customer, spend, orders in mismatches:
+        customer.lifetime_spend = spend
+        customer.paid_order_count = orders
+        customers.append(customer)
+    Customer.objects.bulk_update(customers, ['lifetime_spend', 'paid_order_count'], batch_size=batch_size)
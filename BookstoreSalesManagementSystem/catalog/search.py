@@ -0,0 +1,162 @@
+# search.py
+# 书籍全文检索：基于 SQLite FTS5 的外部内容表 catalog_book_fts，内容直接取自 catalog_book（按 rowid 对应），
+# 由 catalog_book 上的触发器同步：新增、删除和修改检索字段都只更新对应的一行，
+# 批量写入（bulk_create、update、原始 SQL）同样会被同步。rebuild_search_index 命令可整体重建。
+# 修改 Book 表结构的迁移在 SQLite 上会重建表并丢失触发器，post_migrate 时由 ensure_index() 补建并重建索引。
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError, DatabaseError
+
+FTS_TABLE = 'catalog_book_fts'
+BOOK_TABLE = 'catalog_book'
+
+# 参与检索的字段及其 bm25 权重（书名 > 作者 > 出版社 > 概要）
+INDEXED_FIELDS = ('title', 'author', 'press', 'summary')
+FIELD_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# trigram 分词器对中文同样有效，但少于 3 个字符的词无法命中
+MIN_TERM_LENGTH = 3
+
+DEFAULT_MAX_RESULTS = 200
+
+TRIGGERS = {
+    f'{FTS_TABLE}_ai': 'AFTER INSERT ON {book_table} BEGIN {insert_new} END',
+    f'{FTS_TABLE}_ad': 'AFTER DELETE ON {book_table} BEGIN {delete_old} END',
+    f'{FTS_TABLE}_au': (
+        'AFTER UPDATE OF isbn, {columns} ON {book_table} WHEN {changed} BEGIN {delete_old} {insert_new} END'
+    ),
+}
+
+# {(数据库别名, 数据库名): 是否存在全文索引}，避免每次保存和检索都查询 sqlite_master
+_available = {}
+
+
+def _cache_key(connection):
+    return connection.alias, connection.settings_dict['NAME']
+
+
+def _trigger_sql(book_table):
+    columns = ', '.join(INDEXED_FIELDS)
+    all_columns = f'isbn, {columns}'
+    old_values = ', '.join(f'old.{column}' for column in ('isbn',) + INDEXED_FIELDS)
+    new_values = ', '.join(f'new.{column}' for column in ('isbn',) + INDEXED_FIELDS)
+    parts = {
+        'book_table': book_table,
+        'columns': columns,
+        'changed': ' OR '.join(f'old.{column} IS NOT new.{column}' for column in ('isbn',) + INDEXED_FIELDS),
+        'insert_new': f"INSERT INTO {FTS_TABLE} (rowid, {all_columns}) VALUES (new.rowid, {new_values});",
+        'delete_old': (
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {all_columns}) VALUES ('delete', old.rowid, {old_values});"
+        ),
+    }
+    return {name: f"CREATE TRIGGER IF NOT EXISTS {name} {body.format(**parts)}" for name, body in TRIGGERS.items()}
+
+
+def _existing(cursor, object_type, names):
+    placeholders = ', '.join(['%s'] * len(names))
+    cursor.execute(
+        f"SELECT name FROM sqlite_master WHERE type = %s AND name IN ({placeholders})", [object_type, *names]
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def create_index_table(connection, book_table=BOOK_TABLE):
+    """
+    创建 FTS5 外部内容表及同步触发器，返回是否新建了表或触发器（此时需要 rebuild 填充索引）。
+    非 SQLite 或 SQLite 未编译 FTS5 时返回 None。
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    columns = ', '.join(INDEXED_FIELDS)
+    triggers = _trigger_sql(book_table)
+    try:
+        with connection.cursor() as cursor:
+            existing = _existing(cursor, 'table', [FTS_TABLE]) | _existing(cursor, 'trigger', list(triggers))
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(isbn UNINDEXED, {columns}, content='{book_table}', content_rowid='rowid', "
+                f"tokenize='trigram')"
+            )
+            for sql in triggers.values():
+                cursor.execute(sql)
+    except OperationalError:
+        _available[_cache_key(connection)] = False
+        return None
+    _available[_cache_key(connection)] = True
+    return existing != {FTS_TABLE, *triggers}
+
+
+def drop_index_table(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _available.pop(_cache_key(connection), None)
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """当前数据库是否存在全文索引表（结果按数据库缓存）"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    key = _cache_key(connection)
+    if key not in _available:
+        with connection.cursor() as cursor:
+            _available[key] = bool(_existing(cursor, 'table', [FTS_TABLE]))
+    return _available[key]
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    """按 catalog_book 的当前内容重建整个索引，返回书籍数；不支持时返回 None"""
+    connection = connections[using]
+    if create_index_table(connection) is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+        # 合并 b-tree 段，提高后续查询速度
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {BOOK_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def ensure_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate：全文索引表存在但触发器缺失（Book 表被迁移重建）时补建触发器并重建索引"""
+    connection = connections[using]
+    # 迁移可能创建或删除了索引表，重新检查
+    _available.pop(_cache_key(connection), None)
+    if is_available(using) and create_index_table(connection):
+        rebuild_index(using)
+
+
+def build_match_expression(query):
+    """把用户输入转换为 FTS5 MATCH 表达式；有词过短时返回 None（交给调用方回退）"""
+    terms = query.split()
+    if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return None
+    # 每个词作为短语加引号，避免用户输入中的 FTS 语法字符被解释
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_isbns(query, limit=None, using=DEFAULT_DB_ALIAS):
+    """
+    按相关度返回匹配的 ISBN 列表。
+    返回 None 表示无法使用全文索引（表不存在或查询词过短），调用方应回退到 icontains。
+    """
+    match = build_match_expression(query)
+    if match is None or not is_available(using):
+        return None
+    if limit is None:
+        limit = getattr(settings, 'BOOK_SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+
+    weights = ', '.join(['0'] + [str(weight) for weight in FIELD_WEIGHTS])  # 第一个是 isbn 列
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT isbn FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
@@ -0,0 +1,214 @@
+# signals.py
+import copy
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from . import autocomplete, book_cache, fuzzy, inventory, rollup
+from .models import Book, Order, OrderItem
+
+# 当前线程是否在 book_signals_muted() 中
+_muted = threading.local()
+
+
+@contextmanager
+def book_signals_muted():
+    """
+    批量写入或删除书籍的代码（例如导入）结束时会整体失效书籍缓存、重置内存索引，
+    在此期间当前线程中 Book 的保存和删除不再逐本登记缓存和索引的更新。
+    """
+    previous = getattr(_muted, 'books', False)
+    _muted.books = True
+    try:
+        yield
+    finally:
+        _muted.books = previous
+
+
+def _book_signals_muted():
+    return getattr(_muted, 'books', False)
+
+
+@receiver(post_save, sender=Book)
+def sync_book_fuzzy_index(sender, instance, update_fields=None, using=None, **kwargs):
+    """提交后增量更新本进程的模糊检索索引（回滚的修改不会进入索引）"""
+    if _book_signals_muted():
+        return
+    if update_fields is not None and not set(update_fields) & set(fuzzy.INDEXED_FIELDS):
+        return
+    isbn, title, author = instance.isbn, instance.title, instance.author
+    transaction.on_commit(lambda: fuzzy.add_book(isbn, title, author), using=using)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_from_fuzzy_index(sender, instance, using=None, **kwargs):
+    if _book_signals_muted():
+        return
+    isbn = instance.isbn
+    transaction.on_commit(lambda: fuzzy.remove_book(isbn), using=using)
+
+
+@receiver(post_save, sender=Book)
+def sync_book_autocomplete_index(sender, instance, update_fields=None, using=None, **kwargs):
+    """提交后增量更新本进程的搜索联想索引"""
+    if _book_signals_muted():
+        return
+    if update_fields is not None and not set(update_fields) & {'title', 'author'}:
+        return
+    isbn, title, author = instance.isbn, instance.title, instance.author
+    transaction.on_commit(lambda: autocomplete.add_book(isbn, title, author), using=using)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_from_autocomplete_index(sender, instance, using=None, **kwargs):
+    if _book_signals_muted():
+        return
+    isbn = instance.isbn
+    transaction.on_commit(lambda: autocomplete.remove_book(isbn), using=using)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_cache(sender, instance, **kwargs):
+    # 提交后再失效：事务内失效时，并发的读请求可能在提交前把旧行重新写入缓存
+    if _book_signals_muted():
+        return
+    isbn = instance.isbn
+    transaction.on_commit(lambda: book_cache.invalidate([isbn]))
+
+
+# 正在删除的订单：级联删除订单项时，汇总已由订单的 pre_delete 整体扣回，订单项不再逐条处理
+_deleting = threading.local()
+
+
+def _deleting_orders():
+    if not hasattr(_deleting, 'order_ids'):
+        _deleting.order_ids = set()
+    return _deleting.order_ids
+
+
+# 影响已支付销售汇总和顾客累计值的字段
+ORDER_ROLLUP_FIELDS = ('status', 'final_total_amount', 'customer')
+ORDER_ITEM_ROLLUP_FIELDS = ('order', 'book', 'count', 'price', 'original_unit_price')
+
+
+def _stored_values(model, instance, fields, update_fields):
+    """保存前数据库中的相关字段值（{attname: 值}）；新建或 update_fields 不涉及这些字段时返回 None"""
+    if instance._state.adding or (update_fields is not None and not set(update_fields) & set(fields)):
+        return None
+    attnames = [model._meta.get_field(field).attname for field in fields]
+    return model.objects.filter(pk=instance.pk).values(*attnames).first()
+
+
+def _as_stored(instance, values):
+    """instance 的副本，相关字段换成保存前的值"""
+    stored = copy.copy(instance)
+    for attname, value in values.items():
+        setattr(stored, attname, value)
+    return stored
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, update_fields=None, raw=False, **kwargs):
+    """记录保存前的支付状态、实付金额和顾客，供 post_save 调整汇总和顾客累计值"""
+    instance._previous_values = None if raw else _stored_values(Order, instance, ORDER_ROLLUP_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=Order)
+def sync_sales_rollup_on_status_change(sender, instance, created=False, **kwargs):
+    """
+    已有订单改为已支付时计入每日销售汇总和顾客累计值，撤销支付时按保存前的值扣回；
+    已支付订单的实付金额或顾客变化时，顾客累计值扣回旧值、计入新值。
+    新建订单此时还没有订单项，由 checkout 写入订单项后调用 rollup.record_paid_order。
+    """
+    previous = getattr(instance, '_previous_values', None)
+    if created or previous is None:
+        return
+    stored = _as_stored(instance, previous)
+    if instance.status == rollup.PAID and stored.status != rollup.PAID:
+        rollup.record_paid_order(instance)
+    elif stored.status == rollup.PAID and instance.status != rollup.PAID:
+        rollup.record_paid_order(stored, sign=-1)
+    elif instance.status == rollup.PAID and (
+            stored.final_total_amount != instance.final_total_amount or stored.customer_id != instance.customer_id):
+        rollup.record_customer_order(stored, sign=-1)
+        rollup.record_customer_order(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_paid_order_from_rollups(sender, instance, **kwargs):
+    """删除已支付订单时扣回汇总和顾客累计值（订单项此时尚未被级联删除）"""
+    _deleting_orders().add(instance.pk)
+    if instance.status == rollup.PAID:
+        rollup.record_paid_order(instance, sign=-1)
+
+
+@receiver(post_delete, sender=Order)
+def forget_deleted_order(sender, instance, **kwargs):
+    _deleting_orders().discard(instance.pk)
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item(sender, instance, update_fields=None, raw=False, **kwargs):
+    """记录订单项保存前的订单、书籍、数量和价格"""
+    instance._previous_values = None if raw else \
+        _stored_values(OrderItem, instance, ORDER_ITEM_ROLLUP_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=OrderItem)
+def sync_sales_rollup_on_item_change(sender, instance, created=False, raw=False, **kwargs):
+    """已支付订单的订单项新增或修改时，每日汇总扣回旧的订单项、计入新的订单项"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous_values', None)
+    if previous is not None:
+        stored = _as_stored(instance, previous)
+        if all(getattr(instance, attname) == value for attname, value in previous.items()):
+            return
+        rollup.record_order_items(stored.order_id, [stored], sign=-1)
+        if stored.order_id != instance.order_id:
+            Order.refresh_line_summary(stored.order_id)
+    elif not created:
+        return
+    rollup.record_order_items(instance.order_id, [instance])
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_order_item_from_rollup(sender, instance, **kwargs):
+    if instance.order_id not in _deleting_orders():
+        rollup.record_order_items(instance.order_id, [instance], sign=-1)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_line_summary(sender, instance, raw=False, **kwargs):
+    """订单项（例如在后台）新增、修改或删除后刷新订单的冗余概要；checkout 批量写入时自行填写"""
+    if raw or instance.order_id in _deleting_orders():
+        return
+    Order.refresh_line_summary(instance.order_id)
+
+
+@receiver(user_logged_out)
+def detach_visitor_cart(sender, request=None, user=None, **kwargs):
+    """
+    登出（session 随后被清空）前，把访客购物车并入该用户的数据库购物车并清空，
+    同时退回这个 session 的库存预留：session 清空后预留令牌丢失，这些预留再也不会被结算或退回。
+    """
+    if request is None:
+        return
+    from .cart_store import get_cart_store
+    from .views import get_cart
+
+    store = get_cart_store(request)
+    if store.load():
+        if user is not None:
+            get_cart(request)  # 合并到数据库购物车，并清空访客购物车
+        else:
+            store.clear()
+    holder_key = inventory.get_holder_key(request, create=False)
+    if holder_key:
+        inventory.release(holder_key)
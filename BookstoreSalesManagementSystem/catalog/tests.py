@@ -1,3 +1,1525 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from statistics import NormalDist
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import (
+    analytics, autocomplete, book_cache, feeds, fuzzy, inventory, pricing, report_state, report_writers, rollup, search,
+)
+from .management.commands.sales_report import book_sales_for_period, money, parse_period
+from .models import Book, Cart, CartItem, Customer, DailyBookSales, Order, OrderItem, StockReservation
+from .pagination import InvalidCursor, KeysetPaginator, RankedPaginator, encode_cursor
+
+
+class CheckoutQueryCountTests(TestCase):
+    """下单的查询次数不应随订单项数量增长"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create([
+            Book(isbn=f'97800000000{i:02d}', title=f'Book {i}', price=Decimal('10.00'), stock=50)
+            for i in range(20)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def _checkout_queries(self, isbns):
+        """用一个新的匿名访客把 isbns 加入购物车并下单，返回下单请求执行的查询数"""
+        client = self.client_class()
+        for isbn in isbns:
+            response = client.post(reverse('add_to_cart', args=[isbn]), {'quantity': 2})
+            self.assertEqual(response.json()['status'], 'success')
+        client.get(reverse('checkout'))  # 合并 session 购物车，与真实流程一致
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(reverse('checkout'), {'name': '张三', 'phone': '13800000000', 'status': 'P'})
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_query_count_is_independent_of_line_items(self):
+        isbns = list(Book.objects.order_by('isbn').values_list('isbn', flat=True))
+        small = self._checkout_queries(isbns[:2])
+        large = self._checkout_queries(isbns[2:14])
+        self.assertEqual(small, large)
+
+    def test_checkout_consumes_reservations(self):
+        isbns = list(Book.objects.order_by('isbn').values_list('isbn', flat=True)[:3])
+        self._checkout_queries(isbns)
+
+        order = Order.objects.get()
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertEqual(order.final_total_amount, Decimal('60.00'))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(set(Book.objects.filter(isbn__in=isbns).values_list('stock', flat=True)), {48})
+
+
+class CartPricingTests(TestCase):
+    """购物车计价快照：VIP 九折，total_amount 为折后总价，同一实例只查询一次"""
+
+    def setUp(self):
+        cache.clear()
+        self.cheap = Book.objects.create(isbn='9780000000001', title='Cheap', price=Decimal('10.00'), stock=10)
+        self.dear = Book.objects.create(isbn='9780000000002', title='Dear', price=Decimal('25.55'), stock=10)
+
+    def cart_for(self, vip):
+        user = User.objects.create_user(f'reader-{vip}', password='pw')
+        customer = Customer.objects.create(user=user, name='Reader', phone='1', vip_status=vip)
+        cart = Cart.objects.create(customer=customer)
+        CartItem.objects.create(cart=cart, book=self.cheap, quantity=2, price_at_addition=Decimal('10.00'))
+        # 按加入时的价格计价，之后的调价不影响购物车
+        CartItem.objects.create(cart=cart, book=self.dear, quantity=1, price_at_addition=Decimal('25.50'))
+        return Cart.objects.get(pk=cart.pk)
+
+    def test_vip_totals(self):
+        cart = self.cart_for(vip=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.original_total_amount, Decimal('45.50'))
+            # 逐行折后取整：9.00 × 2 + 22.95
+            self.assertEqual(cart.total_amount, Decimal('40.95'))
+            self.assertTrue(cart.is_vip_discount_active)
+            self.assertEqual(cart.total_items, 3)
+            self.assertEqual(cart.get_pricing().discount_amount, Decimal('4.55'))
+
+    def test_non_vip_totals(self):
+        cart = self.cart_for(vip=False)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.original_total_amount, Decimal('45.50'))
+            self.assertEqual(cart.total_amount, Decimal('45.50'))
+            self.assertFalse(cart.is_vip_discount_active)
+            self.assertEqual(cart.get_pricing().discount_amount, Decimal('0.00'))
+
+    def test_snapshot_refresh(self):
+        cart = self.cart_for(vip=False)
+        self.assertEqual(cart.total_items, 3)
+        CartItem.objects.filter(cart=cart, book=self.cheap).update(quantity=5)
+        self.assertEqual(cart.total_items, 3)
+        self.assertEqual(cart.get_pricing(refresh=True).total_items, 6)
+        CartItem.objects.filter(cart=cart, book=self.dear).delete()
+        cart.refresh_from_db()
+        self.assertEqual(cart.total_amount, Decimal('50.00'))
+
+    def test_session_cart_pricing(self):
+        session_cart = {
+            self.cheap.isbn: {'quantity': 2},
+            self.dear.isbn: {'quantity': '1'},
+            '9780000000099': {'quantity': 1},
+            '9780000000003': {'quantity': 'x'},
+        }
+        Book.objects.create(isbn='9780000000003', title='Bad', price=Decimal('1.00'), stock=1)
+        priced, removed = pricing.price_session_cart(session_cart, is_vip=True)
+        self.assertEqual(removed, {'9780000000099': 'missing', '9780000000003': 'invalid'})
+        # session 购物车按当前书价计价
+        self.assertEqual(priced.total_original, Decimal('45.55'))
+        self.assertEqual(priced.total_effective, Decimal('41.00'))
+        self.assertEqual(priced.quantities(), {self.cheap.isbn: 2, self.dear.isbn: 1})
+
+
+class CartStoreTestMixin:
+    """三种访客购物车后端的共同行为；子类指定 backend 和决定购物车内容的 cookie"""
+    backend = None
+    cookie_name = None
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(self.settings(CART_STORE_BACKEND=self.backend))
+        self.book = Book.objects.create(isbn='9780000000001', title='Book', price=Decimal('10.00'), stock=10)
+        self.user = User.objects.create_user('reader', password='pw')
+
+    def add(self, quantity):
+        response = self.client.post(reverse('add_to_cart', args=[self.book.isbn]), {'quantity': quantity})
+        self.assertEqual(response.json()['status'], 'success')
+
+    def cart_lines(self):
+        response = self.client.get(reverse('view_cart'))
+        return {line.isbn: line.quantity for line in response.context['cart_items']}
+
+    def test_round_trip(self):
+        self.assertEqual(self.cart_lines(), {})
+        self.add(2)
+        self.add(1)
+        self.assertEqual(self.cart_lines(), {self.book.isbn: 3})
+        self.client.get(reverse('clear_cart'))
+        self.assertEqual(self.cart_lines(), {})
+        self.assertEqual(Book.objects.get(isbn=self.book.isbn).stock, 10)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.add(2)
+        value = self.client.cookies[self.cookie_name].value
+        self.client.cookies[self.cookie_name] = value.replace('-2', '-9')[:-1] + 'x'
+        self.assertEqual(self.cart_lines(), {})
+
+    def test_cart_is_not_carried_past_logout(self):
+        self.client.login(username='reader', password='pw')
+        self.add(2)
+        stale_cookies = {key: morsel.value for key, morsel in self.client.cookies.items()}
+        self.client.post(reverse('logout'))
+
+        # 登出时访客购物车并入该用户的数据库购物车，库存预留退回
+        cart = Cart.objects.get(customer__user=self.user)
+        self.assertEqual(list(cart.items.values_list('book_id', 'quantity')), [(self.book.isbn, 2)])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Book.objects.get(isbn=self.book.isbn).stock, 10)
+        self.assertEqual(self.cart_lines(), {})
+
+        # 浏览器中残留的旧 cookie 在新的 session 中无效
+        for key, value in stale_cookies.items():
+            if key != settings.SESSION_COOKIE_NAME:
+                self.client.cookies[key] = value
+        self.assertEqual(self.cart_lines(), {})
+        other = User.objects.create_user('other', password='pw')
+        self.client.login(username='other', password='pw')
+        self.client.get(reverse('checkout'))
+        self.assertFalse(CartItem.objects.filter(cart__customer__user=other).exists())
+
+
+class SessionCartStoreTests(CartStoreTestMixin, TestCase):
+    backend = 'catalog.cart_store.SessionCartStore'
+    cookie_name = settings.SESSION_COOKIE_NAME
+
+
+class SignedCookieCartStoreTests(CartStoreTestMixin, TestCase):
+    backend = 'catalog.cart_store.SignedCookieCartStore'
+    cookie_name = 'cart'
+
+
+class CacheCartStoreTests(CartStoreTestMixin, TestCase):
+    backend = 'catalog.cart_store.CacheCartStore'
+    cookie_name = 'cart_token'
+
+
+class OrderReadModelTests(TestCase):
+    """订单的冗余概要随订单项变化刷新；订单列表和详情页的查询次数与订单项数量无关"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pw')
+        self.customer = Customer.objects.create(user=self.user, name='Reader', phone='1')
+        self.books = Book.objects.bulk_create([
+            Book(isbn=f'97800000000{i:02d}', title=f'Book {i}', price=Decimal('10.00'), stock=10) for i in range(6)
+        ])
+
+    def order_with(self, count):
+        order = Order.objects.create(customer=self.customer)
+        for book in self.books[:count]:
+            OrderItem.objects.create(order=order, book=book, count=2, price=book.price)
+        return order
+
+    def test_summary_follows_item_changes(self):
+        order = self.order_with(2)
+        order.refresh_from_db()
+        self.assertEqual((order.item_count, order.line_summary), (4, '《Book 0》×2、《Book 1》×2'))
+
+        item = order.items.get(book=self.books[0])
+        item.count = 5
+        item.save()
+        OrderItem.objects.create(order=order, book=self.books[2], count=1, price=Decimal('10.00'))
+        OrderItem.objects.create(order=order, book=self.books[3], count=1, price=Decimal('10.00'))
+        order.refresh_from_db()
+        self.assertEqual((order.item_count, order.line_summary), (9, '《Book 0》×5、《Book 1》×2、《Book 2》×1 等4种'))
+
+        order.items.filter(book__in=self.books[1:]).delete()
+        order.refresh_from_db()
+        self.assertEqual((order.item_count, order.line_summary), (5, '《Book 0》×5'))
+
+    def test_order_pages_query_count(self):
+        small, large = self.order_with(1), self.order_with(6)
+        self.client.login(username='reader', password='pw')
+        # session、用户、顾客，列表再加分页计数和订单；详情为订单和预取的订单项（含书籍）
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('orders'))
+        self.assertContains(response, '共 12 本')
+        self.assertContains(response, '等6种')
+        for order in (small, large):
+            with self.assertNumQueries(5):
+                response = self.client.get(reverse('order_detail', args=[order.pk]))
+            self.assertEqual(response.status_code, 200)
+
+
+class ExportOrdersTests(TestCase):
+    """员工导出：权限、导出类型、含两端的日期区间、状态筛选、错误参数和输出格式"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        customer = Customer.objects.create(user=User.objects.create_user('reader', password='pw'), name='读者', phone='1')
+        book = Book.objects.create(isbn='9780000000001', title='书名, "带引号"', price=Decimal('10.00'), stock=10)
+        other = Book.objects.create(isbn='9780000000002', title='Other', price=Decimal('5.00'), stock=10)
+        local = timezone.get_current_timezone()
+        self.orders = {}
+        for name, status, moment in (
+            ('before', 'P', datetime(2026, 2, 28, 23, 59)),
+            ('first', 'P', datetime(2026, 3, 1, 0, 0)),
+            ('last', 'U', datetime(2026, 3, 31, 23, 59)),
+            ('after', 'P', datetime(2026, 4, 1, 0, 0)),
+        ):
+            order = Order.objects.create(customer=customer, status=status, final_total_amount=Decimal('25.00'))
+            OrderItem.objects.create(order=order, book=book, count=2, price=Decimal('10.00'))
+            OrderItem.objects.create(order=order, book=other, count=1, price=Decimal('5.00'))
+            Order.objects.filter(pk=order.pk).update(order_date=moment.replace(tzinfo=local))
+            self.orders[name] = order.pk
+
+    def export(self, **params):
+        self.client.login(username='staff', password='pw')
+        return self.client.get(reverse('export_orders'), params)
+
+    @staticmethod
+    def content(response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_staff_only(self):
+        url = reverse('export_orders')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.login(username='reader', password='pw')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.export().status_code, 200)
+
+    def test_items_csv(self):
+        response = self.export(start='2026-03-01', end='2026-03-31')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="items_', response['Content-Disposition'])
+        content = self.content(response)
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(StringIO(content[1:])))
+        self.assertEqual(rows[0][:5], ['order_id', 'order_date', 'status', 'customer_username', 'isbn'])
+        self.assertEqual(
+            [(int(row[0]), row[4], row[5], row[6]) for row in rows[1:]],
+            [(self.orders['first'], '9780000000001', '书名, "带引号"', '2'),
+             (self.orders['first'], '9780000000002', 'Other', '1'),
+             (self.orders['last'], '9780000000001', '书名, "带引号"', '2'),
+             (self.orders['last'], '9780000000002', 'Other', '1')],
+        )
+
+    def test_orders_jsonl_with_status(self):
+        response = self.export(type='orders', format='jsonl', status='P', end='2026-03-31')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        content = self.content(response)
+        self.assertTrue(content.endswith('\n'))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['order_id'] for row in rows], [self.orders['before'], self.orders['first']])
+        self.assertEqual(rows[0]['customer_username'], 'reader')
+        self.assertEqual((rows[0]['item_count'], rows[0]['final_total_amount']), (3, '25.00'))
+
+        rows = self.content(self.export(type='orders', format='jsonl', start='2026-04-01')).splitlines()
+        self.assertEqual([json.loads(line)['order_id'] for line in rows], [self.orders['after']])
+
+    def test_bad_parameters(self):
+        for params in ({'type': 'books'}, {'format': 'xml'}, {'status': 'X'},
+                       {'start': '2026-13-01'}, {'end': '2026-02-30'}, {'start': 'yesterday'}):
+            self.assertEqual(self.export(**params).status_code, 400, params)
+
+
+class CustomerAdminTests(TestCase):
+    """后台修改顾客资料时不能覆盖累计消费"""
+
+    def setUp(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        self.customer = Customer.objects.create(user=User.objects.create_user('reader'), name='张三', phone='1')
+
+    def test_change_view_saves_edited_fields_only(self):
+        # 模拟打开页面之后又有订单支付
+        Customer.objects.filter(pk=self.customer.pk).update(lifetime_spend=Decimal('88.00'), paid_order_count=2)
+        response = self.client.post(
+            reverse('admin:catalog_customer_change', args=[self.customer.pk]),
+            {'user': self.customer.pk, 'name': '李四', 'phone': '1', 'vip_status': 'on'},
+        )
+        self.assertEqual(response.status_code, 302)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.name, '李四')
+        self.assertTrue(self.customer.vip_status)
+        self.assertEqual(self.customer.lifetime_spend, Decimal('88.00'))
+        self.assertEqual(self.customer.paid_order_count, 2)
+
+    def test_change_view_without_changes(self):
+        response = self.client.post(
+            reverse('admin:catalog_customer_change', args=[self.customer.pk]),
+            {'user': self.customer.pk, 'name': '张三', 'phone': '1'},
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class BookCacheInvalidationTests(TestCase):
+    """书籍保存后在事务提交时才使缓存失效"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(isbn='9780000000999', title='Book', price=Decimal('10.00'), stock=5)
+
+    def test_invalidated_on_commit(self):
+        self.assertEqual(book_cache.get_book(self.book.isbn).stock, 5)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book.stock = 3
+            self.book.save()
+            self.assertEqual(book_cache.get_book(self.book.isbn).stock, 5)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(book_cache.get_book(self.book.isbn).stock, 3)
+
+
+class BookSearchTests(TestCase):
+    """全文索引：bm25 排序、触发器同步，以及短查询回退到 icontains"""
+
+    def setUp(self):
+        cache.clear()
+        Book.objects.bulk_create([
+            Book(isbn='9780000000001', title='数据库系统概念', author='Silberschatz', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000002', title='SQL 必知必会', author='Forta', price=Decimal('10.00'), stock=1,
+                 summary='一本讲数据库系统查询的入门书'),
+            Book(isbn='9780000000003', title='算法', author='Sedgewick', price=Decimal('10.00'), stock=1),
+        ])
+
+    def test_title_match_outranks_summary_match(self):
+        self.assertEqual(search.search_isbns('数据库系统'), ['9780000000001', '9780000000002'])
+        self.assertEqual(search.search_isbns('数据库系统', limit=1), ['9780000000001'])
+
+    def test_index_follows_updates_and_deletes(self):
+        book = Book.objects.get(isbn='9780000000001')
+        book.title = '操作系统概念'
+        book.save()
+        self.assertEqual(search.search_isbns('数据库系统'), ['9780000000002'])
+        self.assertEqual(search.search_isbns('操作系统'), ['9780000000001'])
+        Book.objects.filter(isbn='9780000000002').delete()
+        self.assertEqual(search.search_isbns('数据库系统'), [])
+
+    def test_ensure_index_restores_dropped_triggers(self):
+        # 模拟迁移在 SQLite 上重建 Book 表：触发器丢失后写入的书籍不在索引中
+        with connection.cursor() as cursor:
+            for name in search.TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+        Book.objects.create(isbn='9780000000004', title='分布式系统原理', price=Decimal('10.00'), stock=1)
+        self.assertEqual(search.search_isbns('分布式系统'), [])
+        search.ensure_index()
+        self.assertEqual(search.search_isbns('分布式系统'), ['9780000000004'])
+
+    def test_short_query_falls_back_to_icontains(self):
+        self.assertIsNone(search.search_isbns('算法'))
+        with self.settings(FUZZY_SEARCH_ENABLED=False):
+            response = self.client.get(reverse('books'), {'q': '算法'})
+        self.assertEqual([book.isbn for book in response.context['book_list']], ['9780000000003'])
+        self.assertIsNone(response.context['view'].ranked_isbns)
+
+
+class FuzzySearchTests(TestCase):
+    """内存模糊检索：n-gram、拼音、首字母、错字，以及索引的更新与后台重建"""
+
+    def setUp(self):
+        cache.clear()
+        fuzzy.reset_index()
+        self.addCleanup(fuzzy.reset_index)
+        Book.objects.bulk_create([
+            Book(isbn='9780000000001', title='深入理解计算机系统', author='Bryant', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000002', title='算法导论', author='Cormen', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000003', title='计算机网络', author='谢希仁', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000004', title='Python Cookbook', author='Beazley', price=Decimal('10.00'), stock=1),
+        ])
+
+    def test_ngram_and_typo_matches(self):
+        # 相似度相同时书名短的在前
+        self.assertEqual(fuzzy.search_isbns('计算机'), ['9780000000003', '9780000000001'])
+        self.assertEqual(fuzzy.search_isbns('谢希仁'), ['9780000000003'])
+        self.assertEqual(fuzzy.search_isbns('深入理解计算几系统'), ['9780000000001'])
+        self.assertEqual(fuzzy.search_isbns('cookbok'), ['9780000000004'])
+        self.assertEqual(fuzzy.search_isbns('xyz'), [])
+
+    @skipIf(fuzzy.lazy_pinyin is None, '未安装 pypinyin')
+    def test_pinyin_and_initials(self):
+        self.assertEqual(fuzzy.search_isbns('jisuanji'), ['9780000000003', '9780000000001'])
+        self.assertEqual(fuzzy.search_isbns('shenru'), ['9780000000001'])
+        self.assertEqual(fuzzy.search_isbns('srlj'), ['9780000000001'])
+
+    def test_book_changes_apply_on_commit(self):
+        fuzzy.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(isbn='9780000000005', title='编译原理', price=Decimal('10.00'), stock=1)
+            Book.objects.filter(isbn='9780000000002').delete()
+            self.assertEqual(fuzzy.search_isbns('编译原理'), [])
+            self.assertEqual(fuzzy.search_isbns('算法导论'), ['9780000000002'])
+        self.assertEqual(fuzzy.search_isbns('编译原理'), ['9780000000005'])
+        self.assertEqual(fuzzy.search_isbns('算法导论'), [])
+
+    def test_stale_index_is_served_while_rebuilding(self):
+        index = fuzzy.get_index()
+        with self.settings(FUZZY_INDEX_MAX_AGE=0), \
+                mock.patch.object(fuzzy._holder, 'schedule_rebuild') as schedule_rebuild:
+            self.assertIs(fuzzy.get_index(), index)
+        schedule_rebuild.assert_called_once_with()
+
+    def test_changes_during_rebuild_are_replayed(self):
+        old_index = fuzzy.get_index()
+
+        def build():
+            index = fuzzy.build_index()
+            # 重建读完数据库之后才提交的修改
+            fuzzy.add_book('9780000000005', '编译原理', 'Aho')
+            fuzzy.remove_book('9780000000002')
+            return index
+
+        with mock.patch.object(fuzzy._holder, 'build', build):
+            fuzzy.rebuild_index()
+        self.assertIsNot(fuzzy.get_index(), old_index)
+        self.assertEqual(fuzzy.search_isbns('编译原理'), ['9780000000005'])
+        self.assertEqual(fuzzy.search_isbns('算法导论'), [])
+
+    def test_book_list_uses_fuzzy_results(self):
+        response = self.client.get(reverse('books'), {'q': '计算几'})
+        self.assertEqual([book.isbn for book in response.context['book_list']], ['9780000000003', '9780000000001'])
+
+
+class AutocompleteTests(TestCase):
+    """搜索联想：有序数组上的前缀扫描和 books/autocomplete/ 接口"""
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset_index()
+        self.addCleanup(autocomplete.reset_index)
+        Book.objects.bulk_create([
+            Book(isbn='9780000000001', title='算法导论', author='Cormen', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000002', title='算法', author='Sedgewick', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000003', title='计算机网络', author='谢希仁', price=Decimal('10.00'), stock=1),
+            Book(isbn='9780000000004', title='数据结构', author='谢希仁', price=Decimal('10.00'), stock=1),
+        ])
+
+    def suggest(self, prefix, **params):
+        response = self.client.get(reverse('book_autocomplete'), {'q': prefix, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['text'], item['isbn']) for item in response.json()['suggestions']]
+
+    def test_prefix_scan(self):
+        # 键有序，较短的前缀匹配在前
+        self.assertEqual(self.suggest('算法'), [
+            ('title', '算法', '9780000000002'),
+            ('title', '算法导论', '9780000000001'),
+        ])
+        # 同名作者只返回一次
+        self.assertEqual(self.suggest('谢'), [('author', '谢希仁', None)])
+        self.assertEqual(self.suggest('9780000000003'), [('isbn', '9780000000003', '9780000000003')])
+        self.assertEqual(self.suggest('COR'), [('author', 'Cormen', None)])
+        self.assertEqual(self.suggest('不存在'), [])
+        self.assertEqual(self.suggest('  '), [])
+
+    @skipIf(fuzzy.lazy_pinyin is None, '未安装 pypinyin')
+    def test_pinyin_prefix(self):
+        self.assertEqual(self.suggest('suanfa'), [
+            ('title', '算法', '9780000000002'),
+            ('title', '算法导论', '9780000000001'),
+        ])
+        self.assertEqual(self.suggest('jsjw'), [('title', '计算机网络', '9780000000003')])
+
+    def test_limit(self):
+        self.assertEqual(len(self.suggest('978', limit=2)), 2)
+        self.assertEqual(len(self.suggest('978', limit='x')), 4)
+        index = autocomplete.PrefixIndex()
+        index.load((f'978{i:010d}', f'Book {i}', '') for i in range(autocomplete.MAX_SCAN + 10))
+        self.assertEqual(len(index.suggest('book', limit=autocomplete.MAX_SCAN + 10)), autocomplete.MAX_SCAN)
+
+    def test_book_changes_apply_on_commit(self):
+        self.suggest('算法')
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.get(isbn='9780000000002')
+            book.title = '算法（第4版）'
+            book.save()
+            self.assertEqual(self.suggest('算法（'), [])
+        # 全角括号规范化为半角，排在汉字之前
+        self.assertEqual(self.suggest('算法'), [
+            ('title', '算法（第4版）', '9780000000002'),
+            ('title', '算法导论', '9780000000001'),
+        ])
+
+    def test_stale_index_is_served_while_rebuilding(self):
+        index = autocomplete.get_index()
+        with self.settings(AUTOCOMPLETE_INDEX_MAX_AGE=0), \
+                mock.patch.object(autocomplete._holder, 'schedule_rebuild') as schedule_rebuild:
+            self.assertIs(autocomplete.get_index(), index)
+        schedule_rebuild.assert_called_once_with()
+
+
+class BookPaginationTests(TestCase):
+    """书籍列表的游标分页：首页、末页、向前翻页、无效游标"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # 书名有重复，检验 (title, isbn) 的次序
+        Book.objects.bulk_create([
+            Book(isbn=f'97800000000{i:02d}', title=f'Book {i // 2}', price=Decimal('10.00'), stock=1)
+            for i in range(7)
+        ])
+        cls.ordered = list(Book.objects.order_by('title', 'isbn').values_list('isbn', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def isbns(page):
+        return [book.isbn for book in page]
+
+    def test_keyset_pages_forward_and_back(self):
+        paginator = KeysetPaginator(Book.objects.all(), 3)
+        first = paginator.page()
+        self.assertEqual(self.isbns(first), self.ordered[:3])
+        self.assertFalse(first.has_previous())
+
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(self.isbns(second), self.ordered[3:6])
+        last = paginator.page(second.next_cursor)
+        self.assertEqual(self.isbns(last), self.ordered[6:])
+        self.assertFalse(last.has_next())
+
+        self.assertEqual(self.isbns(paginator.page(last.previous_cursor)), self.ordered[3:6])
+        back_to_first = paginator.page(paginator.page(last.previous_cursor).previous_cursor)
+        self.assertEqual(self.isbns(back_to_first), self.ordered[:3])
+        self.assertFalse(back_to_first.has_previous())
+        self.assertEqual(back_to_first.next_cursor, first.next_cursor)
+
+    def test_ranked_pages_follow_rank_order(self):
+        ranked = self.ordered[::-1]
+        paginator = RankedPaginator(Book.objects.all(), ranked, 3)
+        first = paginator.page()
+        self.assertEqual(self.isbns(first), ranked[:3])
+        last = paginator.page(paginator.page(first.next_cursor).next_cursor)
+        self.assertEqual(self.isbns(last), ranked[6:])
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.isbns(paginator.page(last.previous_cursor)), ranked[3:6])
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-base64!', encode_cursor(['after']), encode_cursor({'after': ['Book 1']})):
+            with self.assertRaises(InvalidCursor):
+                KeysetPaginator(Book.objects.all(), 3).page(cursor)
+        with self.assertRaises(InvalidCursor):
+            RankedPaginator(Book.objects.all(), self.ordered, 3).page(encode_cursor({'rank': -3}))
+
+        self.assertEqual(self.client.get(reverse('books'), {'cursor': 'not-base64!'}).status_code, 404)
+        response = self.client.get(reverse('book_list_api'), {'cursor': 'not-base64!'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+
+    def test_api_pages(self):
+        seen = []
+        params = {'page_size': 3}
+        while True:
+            data = self.client.get(reverse('book_list_api'), params).json()
+            seen.extend(row['isbn'] for row in data['results'])
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(seen, self.ordered)
+        data = self.client.get(reverse('book_list_api'), {'page_size': 3, 'cursor': data['previous_cursor']}).json()
+        self.assertEqual([row['isbn'] for row in data['results']], self.ordered[3:6])
+
+    def test_page_links_keep_page_size(self):
+        response = self.client.get(reverse('books'), {'page_size': 3})
+        self.assertEqual(len(response.context['book_list']), 3)
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'href="?page_size=3&cursor={next_cursor}"')
+
+        response = self.client.get(reverse('books'), {'page_size': 3, 'cursor': next_cursor})
+        previous_cursor = response.context['page_obj'].previous_cursor
+        self.assertContains(response, f'href="?page_size=3&cursor={previous_cursor}"')
+
+
+class ReapCartsTests(TestCase):
+    """reap_carts：过期预留分批退回库存且只退一次；只删除长期无新增商品的匿名购物车"""
+
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(isbn='9780000000001', title='Book', price=Decimal('10.00'), stock=100)
+        self.other = Book.objects.create(isbn='9780000000002', title='Other', price=Decimal('10.00'), stock=100)
+
+    def reap(self, **options):
+        out = StringIO()
+        call_command('reap_carts', stdout=out, **options)
+        return out.getvalue()
+
+    def test_expired_reservations_return_stock_once(self):
+        past = timezone.now() - timedelta(minutes=1)
+        for i in range(5):
+            inventory.reserve(f'holder-{i}', self.book.isbn, 2)
+        inventory.reserve('holder-0', self.other.isbn, 3)
+        inventory.reserve('active', self.book.isbn, 4)
+        StockReservation.objects.exclude(holder_key='active').update(expires_at=past)
+        self.assertEqual(Book.objects.get(isbn=self.book.isbn).stock, 86)
+
+        output = self.reap(batch_size=2)
+        self.assertIn('退回过期预留 13 册（2 种书）', output)
+        self.assertEqual(dict(Book.objects.values_list('isbn', 'stock')), {self.book.isbn: 96, self.other.isbn: 100})
+        self.assertEqual(list(StockReservation.objects.values_list('holder_key', flat=True)), ['active'])
+
+        self.assertIn('退回过期预留 0 册', self.reap(batch_size=2))
+        self.assertEqual(Book.objects.get(isbn=self.book.isbn).stock, 96)
+
+    def test_only_stale_anonymous_carts_are_deleted(self):
+        user = User.objects.create_user('reader', password='pw')
+        customer = Customer.objects.create(user=user, name='Reader', phone='1')
+        old = timezone.now() - timedelta(days=30)
+        stale = Cart.objects.create(session_key='stale')
+        CartItem.objects.create(cart=stale, book=self.book, price_at_addition=Decimal('10.00'))
+        empty_stale = Cart.objects.create(session_key='empty')
+        recent_item = Cart.objects.create(session_key='recent-item')
+        CartItem.objects.create(cart=recent_item, book=self.book, price_at_addition=Decimal('10.00'))
+        fresh = Cart.objects.create(session_key='fresh')
+        customer_cart = Cart.objects.create(customer=customer)
+        Cart.objects.exclude(pk=fresh.pk).update(updated_at=old)
+        CartItem.objects.filter(cart=stale).update(added_at=old)
+
+        output = self.reap(batch_size=1, cart_max_age=7 * 24 * 3600)
+        self.assertIn('删除废弃购物车 2 个', output)
+        self.assertEqual(
+            set(Cart.objects.values_list('pk', flat=True)), {recent_item.pk, fresh.pk, customer_cart.pk}
+        )
+        self.assertFalse(CartItem.objects.filter(cart_id=stale.pk).exists())
+        self.assertFalse(Cart.objects.filter(pk=empty_stale.pk).exists())
+
+
+class PeriodBookSalesTests(TestCase):
+    """销售报告的周期排行：数据库中分组、排序和截取，汇总用一次 aggregate()"""
+
+    def setUp(self):
+        books = {
+            title: Book.objects.create(isbn=f'978000000000{i}', title=title, price=Decimal('10.00'), stock=1)
+            for i, title in enumerate(('Beta', 'Alpha', 'Gamma', 'Delta'))
+        }
+        day = date(2026, 3, 10)
+        for title, offset, quantity, revenue in (
+            ('Alpha', 0, 3, '30.00'),
+            ('Alpha', 1, 2, '18.00'),
+            ('Beta', 0, 5, '50.00'),
+            ('Gamma', 1, 1, '9.90'),
+            ('Delta', 0, 0, '0.00'),  # 撤销支付后扣回为 0 的行不进入排行
+            ('Gamma', 5, 9, '90.00'),  # 周期之外
+        ):
+            DailyBookSales.objects.create(date=day + timedelta(days=offset), book=books[title],
+                                          quantity=quantity, revenue=Decimal(revenue))
+        self.start, self.end = day, day + timedelta(days=1)
+
+    def test_grouped_ranking_and_totals(self):
+        with self.assertNumQueries(2):
+            ranking, totals = book_sales_for_period(self.start, self.end)
+        # 销量相同时按书名升序
+        self.assertEqual(
+            [(row['book__title'], row['total_quantity_sold'], row['total_revenue']) for row in ranking],
+            [('Alpha', 5, Decimal('48.00')), ('Beta', 5, Decimal('50.00')), ('Gamma', 1, Decimal('9.90'))],
+        )
+        self.assertEqual(totals['total_quantity'], 11)
+        self.assertEqual(money(totals['total_revenue']), Decimal('107.90'))
+
+    def test_top_n_is_sliced_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            ranking, totals = book_sales_for_period(self.start, self.end, top_n=1)
+        self.assertEqual([row['book__title'] for row in ranking], ['Alpha'])
+        self.assertIn('LIMIT 1', queries.captured_queries[-1]['sql'])
+        # 汇总不受 top_n 影响
+        self.assertEqual(totals['total_quantity'], 11)
+
+    def test_empty_period(self):
+        ranking, totals = book_sales_for_period(date(2020, 1, 1), date(2020, 1, 31))
+        self.assertEqual(ranking, [])
+        self.assertEqual((totals['total_quantity'], money(totals['total_revenue'])), (None, Decimal('0.00')))
+
+
+class ParsePeriodTests(TestCase):
+    """sales_report 的 --period 参数"""
+
+    def parse(self, spec):
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2026, 3, 15)):
+            return parse_period(spec)
+
+    def test_valid_periods(self):
+        self.assertEqual(self.parse('last-month'), ('上一个完整月份', date(2026, 2, 1), date(2026, 2, 28)))
+        self.assertEqual(self.parse('days:7'), ('过去7天', date(2026, 3, 9), date(2026, 3, 15)))
+        self.assertEqual(self.parse('days:1'), ('过去1天', date(2026, 3, 15), date(2026, 3, 15)))
+        self.assertEqual(self.parse('month:2024-02'), ('2024年2月', date(2024, 2, 1), date(2024, 2, 29)))
+        self.assertEqual(self.parse('month:2025-12'), ('2025年12月', date(2025, 12, 1), date(2025, 12, 31)))
+        self.assertEqual(
+            self.parse('range:2026-01-30..2026-02-02'), ('指定区间', date(2026, 1, 30), date(2026, 2, 2)))
+        self.assertEqual(self.parse('range:2026-01-30..2026-01-30'), ('指定区间', date(2026, 1, 30), date(2026, 1, 30)))
+
+    def test_invalid_periods(self):
+        for spec in (
+            'days:0', 'days:-1', 'days:x', 'days:',
+            'month:2026-13', 'month:2026', 'month:',
+            'range:2026-02-02..2026-01-30',  # 开始晚于结束
+            'range:2026-02-30..2026-03-01', 'range:2026-01-01', 'range:2026-01-01..',
+            'week:1', '',
+        ):
+            with self.subTest(spec=spec), self.assertRaises(CommandError):
+                self.parse(spec)
+
+
+class SalesReportWorkersTests(TransactionTestCase):
+    """--workers N 在各自的数据库连接中并发生成报告片段，输出与 --workers 1 相同"""
+
+    def setUp(self):
+        today = timezone.localdate()
+        for i in range(6):
+            book = Book.objects.create(isbn=f'978000000000{i}', title=f'Book {i}', price=Decimal('10.00'), stock=1)
+            for offset in range(0, 40, i + 1):
+                DailyBookSales.objects.create(date=today - timedelta(days=offset), book=book, quantity=i + 1,
+                                              revenue=Decimal(10 * (i + 1)))
+        for i in range(3):
+            Customer.objects.create(user=User.objects.create_user(f'reader{i}'), name=f'读者{i}', phone=str(i),
+                                    lifetime_spend=Decimal(10 * i), paid_order_count=i)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def report(self, workers):
+        prefix = f'workers{workers}'
+        call_command(
+            'sales_report', '--output_dir', self.tmp_dir.name, '--filename_prefix', prefix, '--format', 'json',
+            '--period', 'last-month', '--period', 'days:7', '--period', 'days:30', '--analytics-days', '28',
+            '--top-n', '3', '--workers', str(workers), '--quiet', stdout=StringIO(),
+        )
+        [name] = [name for name in os.listdir(self.tmp_dir.name) if name.startswith(prefix)]
+        with open(os.path.join(self.tmp_dir.name, name), encoding='utf-8') as f:
+            return json.load(f)['records']
+
+    def test_same_output(self):
+        sequential = self.report(1)
+        self.assertEqual(
+            {record['section'] for record in sequential},
+            {'book_ranking', 'period_totals', 'customer_ranking', 'book_analytics'},
+        )
+        self.assertEqual(self.report(4), sequential)
+
+
+class SalesRollupTests(TestCase):
+    """每日销售汇总随已支付订单的状态、订单项和删除保持一致，并与 rebuild() 的结果相同"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(user=User.objects.create_user('reader'), name='张三', phone='1')
+        self.book = Book.objects.create(isbn='9780000000001', title='Book', price=Decimal('10.00'), stock=10)
+        self.other = Book.objects.create(isbn='9780000000002', title='Other', price=Decimal('5.00'), stock=10)
+        self.today = timezone.localdate()
+
+    def paid_order(self):
+        """与 checkout 相同：以已支付状态创建订单，批量写入订单项后调用 record_paid_order"""
+        order = Order.objects.create(customer=self.customer, status='P', final_total_amount=Decimal('23.00'))
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, book=self.book, count=2, price=Decimal('9.00'), original_unit_price=Decimal('10.00')),
+            OrderItem(order=order, book=self.other, count=1, price=Decimal('5.00')),
+        ])
+        rollup.record_paid_order(order, items)
+        return order
+
+    def rows(self):
+        """非零的汇总行 {isbn: (数量, 实收, 优惠)}"""
+        return {
+            row.book_id: (row.quantity, row.revenue, row.discount)
+            for row in DailyBookSales.objects.filter(date=self.today) if row.quantity or row.revenue
+        }
+
+    def assertMatchesRebuild(self):
+        before = self.rows()
+        rollup.rebuild()
+        self.assertEqual(self.rows(), before)
+
+    def test_record_paid_order(self):
+        self.paid_order()
+        self.assertEqual(self.rows(), {
+            self.book.isbn: (2, Decimal('18.00'), Decimal('2.00')),
+            self.other.isbn: (1, Decimal('5.00'), Decimal('0.00')),
+        })
+        self.paid_order()
+        self.assertEqual(self.rows()[self.book.isbn], (4, Decimal('36.00'), Decimal('4.00')))
+        self.assertMatchesRebuild()
+
+    def test_status_flips(self):
+        order = self.paid_order()
+        order.status = 'U'
+        order.save()
+        self.assertEqual(self.rows(), {})
+        order.status = 'P'
+        order.save(update_fields=['status'])
+        self.assertEqual(self.rows()[self.book.isbn], (2, Decimal('18.00'), Decimal('2.00')))
+        # 只改其他字段不重复计入
+        order.guest_name = 'x'
+        order.save()
+        self.assertEqual(self.rows()[self.book.isbn], (2, Decimal('18.00'), Decimal('2.00')))
+        self.assertMatchesRebuild()
+
+    def test_item_edits_on_paid_order(self):
+        order = self.paid_order()
+        item = order.items.get(book=self.book)
+        item.count = 3
+        item.save()
+        self.assertEqual(self.rows()[self.book.isbn], (3, Decimal('27.00'), Decimal('3.00')))
+
+        order.items.get(book=self.other).delete()
+        self.assertNotIn(self.other.isbn, self.rows())
+
+        OrderItem.objects.create(order=order, book=self.other, count=4, price=Decimal('4.00'))
+        self.assertEqual(self.rows()[self.other.isbn], (4, Decimal('16.00'), Decimal('0.00')))
+        self.assertMatchesRebuild()
+
+        # 移到未支付订单的订单项从汇总中扣回
+        unpaid = Order.objects.create(customer=self.customer)
+        item.order = unpaid
+        item.save()
+        self.assertNotIn(self.book.isbn, self.rows())
+        self.assertMatchesRebuild()
+
+    def test_item_edits_on_unpaid_order_are_ignored(self):
+        order = Order.objects.create(customer=self.customer)
+        item = OrderItem.objects.create(order=order, book=self.book, count=2, price=Decimal('10.00'))
+        item.count = 5
+        item.save()
+        item.delete()
+        self.assertEqual(self.rows(), {})
+
+    def test_deleting_paid_order_subtracts_once(self):
+        self.paid_order()
+        order = self.paid_order()
+        order.delete()
+        self.assertEqual(self.rows()[self.book.isbn], (2, Decimal('18.00'), Decimal('2.00')))
+        self.assertMatchesRebuild()
+
+    def test_backfill_command(self):
+        self.paid_order()
+        DailyBookSales.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_sales_rollup', start=str(self.today), end=str(self.today), stdout=out)
+        self.assertIn('2 行', out.getvalue())
+        self.assertEqual(self.rows()[self.book.isbn], (2, Decimal('18.00'), Decimal('2.00')))
+        with self.assertRaises(CommandError):
+            call_command('backfill_sales_rollup', start='2026-02-02', end='2026-02-01', stdout=out)
+
+    def test_concurrent_insert_is_retried(self):
+        # 模拟并发：第一次锁定时看不到另一个事务刚插入的汇总行，插入因唯一约束失败后重试并更新该行
+        DailyBookSales.objects.create(date=self.today, book=self.book, quantity=1, revenue=Decimal('10.00'))
+        select_for_update = DailyBookSales.objects.select_for_update
+        calls = []
+
+        def flaky_select_for_update():
+            calls.append(1)
+            queryset = select_for_update()
+            return queryset.none() if len(calls) == 1 else queryset
+
+        with mock.patch.object(DailyBookSales.objects, 'select_for_update', flaky_select_for_update):
+            self.paid_order()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.rows()[self.book.isbn], (3, Decimal('28.00'), Decimal('2.00')))
+
+
+class CustomerStatsTests(TestCase):
+    """Customer.lifetime_spend / paid_order_count 随已支付订单变化，customer_stats_api 和 reconcile_customer_stats"""
+
+    def setUp(self):
+        self.alice = Customer.objects.create(user=User.objects.create_user('alice'), name='Alice', phone='1')
+        self.bob = Customer.objects.create(
+            user=User.objects.create_user('bob'), name='Bob', phone='2', vip_status=True)
+
+    def paid_order(self, customer, amount):
+        order = Order.objects.create(customer=customer, final_total_amount=Decimal(amount))
+        order.status = 'P'
+        order.save()
+        return order
+
+    def stats(self, customer):
+        customer.refresh_from_db()
+        return customer.lifetime_spend, customer.paid_order_count
+
+    def test_paid_order_changes(self):
+        order = self.paid_order(self.alice, '30.00')
+        self.paid_order(self.alice, '20.00')
+        self.assertEqual(self.stats(self.alice), (Decimal('50.00'), 2))
+
+        order.final_total_amount = Decimal('35.00')
+        order.save()
+        self.assertEqual(self.stats(self.alice), (Decimal('55.00'), 2))
+
+        order.customer = self.bob
+        order.save(update_fields=['customer'])
+        self.assertEqual(self.stats(self.alice), (Decimal('20.00'), 1))
+        self.assertEqual(self.stats(self.bob), (Decimal('35.00'), 1))
+
+        order.status = 'U'
+        order.save()
+        self.assertEqual(self.stats(self.bob), (Decimal('0.00'), 0))
+        # 未支付订单改金额不影响累计值
+        order.final_total_amount = Decimal('99.00')
+        order.save()
+        self.assertEqual(self.stats(self.bob), (Decimal('0.00'), 0))
+
+        self.paid_order(self.bob, '10.00').delete()
+        self.assertEqual(self.stats(self.bob), (Decimal('0.00'), 0))
+        self.assertEqual(rollup.customer_stats_mismatches(), [])
+
+    def test_customer_stats_api(self):
+        self.paid_order(self.alice, '30.00')
+        self.paid_order(self.bob, '50.00')
+        self.paid_order(self.bob, '5.00')
+        url = reverse('customer_stats_api')
+
+        self.client.force_login(self.alice.user)
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        results = self.client.get(url).json()['results']
+        self.assertEqual(results, [
+            {'username': 'bob', 'name': 'Bob', 'is_vip': True, 'lifetime_spend': '55.00', 'paid_order_count': 2},
+            {'username': 'alice', 'name': 'Alice', 'is_vip': False, 'lifetime_spend': '30.00',
+             'paid_order_count': 1},
+        ])
+        self.assertEqual([row['username'] for row in self.client.get(url, {'limit': 1}).json()['results']], ['bob'])
+        self.assertEqual(
+            [row['username'] for row in self.client.get(url, {'min_orders': 2}).json()['results']], ['bob'])
+        # 默认不列出没有已支付订单的顾客
+        Customer.objects.create(user=staff, name='Staff', phone='3')
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+        self.assertEqual(len(self.client.get(url, {'min_orders': 0}).json()['results']), 3)
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, 400)
+
+    def test_reconcile_customer_stats(self):
+        self.paid_order(self.alice, '30.00')
+        self.paid_order(self.bob, '50.00')
+        out = StringIO()
+        call_command('reconcile_customer_stats', stdout=out)
+        self.assertIn('所有顾客的累计值均与订单一致', out.getvalue())
+
+        # 绕过信号写入的订单和被改坏的累计值
+        Order.objects.bulk_create([Order(customer=self.alice, status='P', final_total_amount=Decimal('7.00'))])
+        Customer.objects.filter(pk=self.bob.pk).update(lifetime_spend=Decimal('1.00'), paid_order_count=9)
+
+        out = StringIO()
+        call_command('reconcile_customer_stats', dry_run=True, stdout=out)
+        self.assertIn('2 位顾客的累计值不一致（--dry-run，未修改）', out.getvalue())
+        self.assertIn('¥30.00 -> ¥37.00', out.getvalue())
+        self.assertEqual(self.stats(self.alice), (Decimal('30.00'), 1))
+        self.assertEqual(self.stats(self.bob), (Decimal('1.00'), 9))
+
+        out = StringIO()
+        call_command('reconcile_customer_stats', batch_size=1, stdout=out)
+        self.assertIn('已修正 2 位顾客的累计值', out.getvalue())
+        self.assertEqual(self.stats(self.alice), (Decimal('37.00'), 2))
+        self.assertEqual(self.stats(self.bob), (Decimal('50.00'), 1))
+        self.assertEqual(rollup.customer_stats_mismatches(), [])
+
+
+def sales_matrix(quantity, revenue=None, start_date=date(2026, 3, 1)):
+    quantity = np.array(quantity, dtype=np.int64)
+    revenue = np.array(revenue, dtype=np.float64) if revenue is not None else quantity * 10.0
+    isbns = np.array([f'97800000000{i:02d}' for i in range(len(quantity))], dtype=object)
+    return analytics.SalesMatrix(isbns, start_date, quantity, revenue)
+
+
+class SalesAnalyticsTests(TestCase):
+    """SalesMatrix 的各项指标，以及 NumPy 与 ORM 两种实现的结果一致"""
+
+    def setUp(self):
+        # 两周：第一本书 1/天 → 2/天，第二本只在最后一天卖出，第三本 2/天 → 1/天，第四本没有销量
+        self.matrix = sales_matrix([
+            [1] * 7 + [2] * 7,
+            [0] * 13 + [3],
+            [2] * 7 + [1] * 7,
+            [0] * 14,
+        ])
+
+    def test_velocity(self):
+        np.testing.assert_allclose(self.matrix.velocity(), [1.5, 3 / 14, 1.5, 0])
+        np.testing.assert_allclose(self.matrix.velocity(7), [2, 3 / 7, 1, 0])
+        # 超过区间长度时按整个区间计算
+        np.testing.assert_allclose(self.matrix.velocity(30), self.matrix.velocity())
+
+    def test_moving_average(self):
+        average = self.matrix.moving_average(7)
+        self.assertEqual(average.shape, (4, 14))
+        # 前几天按已有天数平均
+        np.testing.assert_allclose(average[2, :3], [2, 2, 2])
+        np.testing.assert_allclose(average[0, [0, 6, 7, 13]], [1, 1, 8 / 7, 2])
+        np.testing.assert_allclose(average[1, -1], 3 / 7)
+        # 窗口不短于区间时等于累计平均
+        np.testing.assert_allclose(self.matrix.moving_average(30)[0], np.cumsum(self.matrix.quantity[0]) / np.arange(1, 15))
+
+    def test_week_over_week(self):
+        growth = self.matrix.week_over_week()
+        np.testing.assert_allclose(growth[[0, 2]], [1.0, -0.5])
+        # 前一周没有销量时为 NaN
+        self.assertTrue(np.isnan(growth[1]) and np.isnan(growth[3]))
+
+    def test_abc_cut_offs(self):
+        # 累计占比恰好达到阈值的书籍归入下一类
+        matrix = sales_matrix([[1]] * 4, [[80], [15], [5], [0]])
+        self.assertEqual(list(matrix.abc_classes()), ['A', 'B', 'C', 'C'])
+        matrix = sales_matrix([[1]] * 4, [[5], [16], [79], [0]])
+        self.assertEqual(list(matrix.abc_classes()), ['C', 'A', 'A', 'C'])
+        self.assertEqual(list(sales_matrix([[0], [0]]).abc_classes()), ['C', 'C'])
+
+    def test_summary(self):
+        rows = self.matrix.summary(top_n=2)
+        self.assertEqual([row['isbn'] for row in rows], ['9780000000000', '9780000000002'])
+        self.assertEqual(rows[0], {
+            'isbn': '9780000000000', 'title': None, 'abc_class': 'A', 'quantity': 21, 'revenue': 210.0,
+            'velocity': 1.5, 'moving_average': 2.0, 'week_over_week': 1.0,
+        })
+
+
+class SalesAnalyticsParityTests(TestCase):
+    """同一批订单：订单项和每日汇总两个数据源的 SalesMatrix.summary 与 summarize_with_orm 结果相同"""
+
+    def setUp(self):
+        customer = Customer.objects.create(user=User.objects.create_user('reader'), name='张三', phone='1')
+        books = [
+            Book.objects.create(isbn=f'978000000000{i}', title=f'Book {i}', price=Decimal('10.00'), stock=1)
+            for i in range(4)
+        ]
+        self.end = date(2026, 3, 20)
+        self.start = self.end - timedelta(days=19)
+        tz = timezone.get_current_timezone()
+        for offset in range(20):
+            day = self.start + timedelta(days=offset)
+            for i, book in enumerate(books[:3]):
+                if (offset + i) % (i + 2):
+                    continue
+                status = 'U' if offset == 19 and i == 0 else 'P'  # 未支付订单不计入
+                order = Order.objects.create(customer=customer, status=status, final_total_amount=Decimal('0'))
+                # 本地时间接近午夜，确认按本地日期归入
+                order_date = datetime.combine(day, datetime.min.time(), tzinfo=tz) + timedelta(hours=23, minutes=30)
+                Order.objects.filter(pk=order.pk).update(order_date=order_date)
+                OrderItem.objects.create(order=order, book=book, count=offset % 4 + 1,
+                                         price=Decimal('9.90') + i, original_unit_price=Decimal('12.00'))
+        rollup.rebuild()
+
+    def test_sources_agree(self):
+        for top_n in (None, 2):
+            with self.subTest(top_n=top_n):
+                expected = analytics.summarize_with_orm(self.start, self.end, top_n=top_n)
+                self.assertEqual(len(expected), 3 if top_n is None else 2)
+                for source in analytics.SOURCES:
+                    matrix = analytics.SalesMatrix.load(self.start, self.end, source=source, chunk_size=7)
+                    self.assertEqual(matrix.summary(top_n=top_n), expected)
+
+    def test_unpaid_orders_are_excluded(self):
+        matrix = analytics.SalesMatrix.load(self.end, self.end)
+        self.assertNotIn('9780000000000', list(matrix.isbns))
+        self.assertEqual(analytics.SalesMatrix.load(date(2020, 1, 1), date(2020, 1, 7)).summary(), [])
+
+
+class ReplenishmentTests(TestCase):
+    """需求预测（指数平滑）、安全库存、补货点、补货目标和按剩余可售天数排序的补货清单"""
+
+    def test_exponential_smoothing(self):
+        forecast, std = analytics.exponential_smoothing(np.array([[4, 4, 4, 4], [0, 10, 0, 10]]), alpha=0.5)
+        # 第二行：初始值 5，误差 -5 → 2.5，+7.5 → 6.25，-6.25 → 3.125，+6.875 → 6.5625
+        np.testing.assert_allclose(forecast, [4, 6.5625])
+        np.testing.assert_allclose(std, [0, np.sqrt((25 + 7.5 ** 2 + 6.25 ** 2 + 6.875 ** 2) / 4)])
+        forecast, std = analytics.exponential_smoothing(np.zeros((2, 0)))
+        np.testing.assert_allclose(forecast, [0, 0])
+
+    def test_replenishment_plan(self):
+        # 9780000000000：稳定 2/天；…01：稳定 1/天且库存充足；…02：波动；…03：无销量；…09：已不在目录中
+        matrix = sales_matrix([[2] * 14, [1] * 14, [0, 6] * 7, [0] * 14, [5] * 14])
+        matrix.isbns[-1] = '9780000000009'
+        catalog_isbns = np.array(['9780000000000', '9780000000001', '9780000000002', '9780000000003'])
+        stock = np.array([5, 100, 0, 3])
+        plan = analytics.replenishment_plan(
+            matrix, catalog_isbns, stock, alpha=0.3, lead_time=4, review_days=10, service_level=0.95)
+
+        forecast, std = analytics.exponential_smoothing(matrix.quantity[2:3], alpha=0.3)
+        z = NormalDist().inv_cdf(0.95)
+        np.testing.assert_allclose(plan['forecast'], [2, 1, forecast[0], 0])
+        np.testing.assert_allclose(plan['safety_stock'], [0, 0, z * std[0] * 2, 0])
+        np.testing.assert_allclose(plan['reorder_point'], [8, 4, forecast[0] * 4 + z * std[0] * 2, 0])
+        np.testing.assert_allclose(plan['order_up_to'], [28, 14, forecast[0] * 14 + z * std[0] * 2, 0])
+        self.assertEqual(list(plan['suggested']), [23, 0, int(np.ceil(plan['order_up_to'][2])), 0])
+        np.testing.assert_allclose(plan['days_of_cover'], [2.5, 100, 0, np.inf])
+
+    def test_command_writes_sorted_plan(self):
+        today = timezone.localdate()
+        for i, (stock, daily) in enumerate(((6, 2), (4, 1), (4, 2), (100, 1), (7, 0))):
+            book = Book.objects.create(isbn=f'978000000000{i}', title=f'Book {i}', price=Decimal('10.00'), stock=stock)
+            for offset in range(14):
+                if daily:
+                    DailyBookSales.objects.create(date=today - timedelta(days=offset), book=book, quantity=daily,
+                                                  revenue=Decimal(10 * daily))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'plan.csv')
+            out = StringIO()
+            call_command('forecast_replenishment', '--days', '14', '--lead-time', '4', '--review-days', '10',
+                         '--output', output, stdout=out)
+            with open(output, encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+        self.assertIn('需要补货 3 本，共 56 册', out.getvalue())
+        # 按剩余可售天数升序；库存充足（高于补货点）和无销量的书不在清单中。库存恰好等于补货点时也要补货
+        self.assertEqual(
+            [(row['isbn'], row['title'], row['reorder_point'], row['order_up_to'], row['suggested_order'],
+              row['days_of_cover']) for row in rows],
+            [
+                ('9780000000002', 'Book 2', '8.0', '28.0', '24', '2.0'),
+                ('9780000000000', 'Book 0', '8.0', '28.0', '22', '3.0'),
+                ('9780000000001', 'Book 1', '4.0', '14.0', '10', '4.0'),
+            ],
+        )
+
+    def test_invalid_options(self):
+        for args in (('--days', '0'), ('--alpha', '0'), ('--service-level', '1'), ('--review-days', '-1')):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command('forecast_replenishment', *args, stdout=StringIO())
+
+
+class ReportStateTests(TestCase):
+    """增量报告状态：复查期内的订单状态和金额变化会被计入或扣回，过期和已删除的订单不再跟踪"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(user=User.objects.create_user('reader'), name='张三', phone='1')
+        self.state = report_state.empty_state()
+
+    def _order(self, status, amount, days_ago=0):
+        order = Order.objects.create(customer=self.customer, status='U', final_total_amount=Decimal(amount))
+        if status == 'P':
+            # 新建的已支付订单由 checkout 计入累计值，这里走“改为已支付”的路径
+            order.status = 'P'
+            order.save()
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(order_date=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def _totals(self):
+        return report_state.period_orders(self.state, None, None)
+
+    def test_status_changes_within_revision_window(self):
+        order = self._order('U', '30.00')
+        report_state.advance(self.state)
+        self.assertEqual(self.state['pending_order_ids'], [order.pk])
+        self.assertEqual(self._totals(), (0, 0))
+
+        order.status = 'P'
+        order.save()
+        report_state.advance(self.state)
+        self.assertEqual(self.state['pending_order_ids'], [])
+        self.assertEqual(self._totals(), (1, Decimal('30.00')))
+
+        order.final_total_amount = Decimal('25.00')
+        order.save()
+        report_state.advance(self.state)
+        self.assertEqual(self._totals(), (1, Decimal('25.00')))
+
+        order.status = 'U'
+        order.save()
+        report_state.advance(self.state)
+        self.assertEqual(self.state['pending_order_ids'], [order.pk])
+        self.assertEqual(self._totals(), (0, 0))
+        self.assertEqual(self.state['daily_orders'], {})
+
+        order.delete()
+        report_state.advance(self.state)
+        self.assertEqual(self.state['pending_order_ids'], [])
+        self.assertEqual(self.state['recent_paid'], {})
+
+    def test_deleted_paid_order_is_subtracted(self):
+        order = self._order('P', '12.50')
+        self._order('P', '7.50')
+        report_state.advance(self.state)
+        self.assertEqual(self._totals(), (2, Decimal('20.00')))
+        order.delete()
+        report_state.advance(self.state)
+        self.assertEqual(self._totals(), (1, Decimal('7.50')))
+
+    def test_old_orders_are_not_tracked(self):
+        self._order('U', '10.00', days_ago=report_state.REVISION_DAYS + 1)
+        self._order('P', '20.00', days_ago=report_state.REVISION_DAYS + 1)
+        report_state.advance(self.state)
+        self.assertEqual(self.state['pending_order_ids'], [])
+        self.assertEqual(self.state['recent_paid'], {})
+        self.assertEqual(self._totals(), (1, Decimal('20.00')))
+
+    def test_period_orders_by_local_day(self):
+        self._order('P', '10.00', days_ago=3)
+        self._order('P', '20.00')
+        report_state.advance(self.state)
+        today = timezone.localdate()
+        self.assertEqual(report_state.period_orders(self.state, today, today), (1, Decimal('20.00')))
+        self.assertEqual(
+            report_state.period_orders(self.state, today - timedelta(days=3), today - timedelta(days=1)),
+            (1, Decimal('10.00')))
+
+
+class IncrementalSalesReportTests(TestCase):
+    """sales_report --incremental：周期统计附加订单数和实付金额，顾客排行读取累计值，状态在报告写出后才保存"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(user=User.objects.create_user('reader'), name='张三', phone='1')
+        order = Order.objects.create(customer=self.customer, final_total_amount=Decimal('30.00'))
+        order.status = 'P'
+        order.save()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.state_path = os.path.join(self.tmp_dir.name, 'state.json')
+
+    def report(self, *args):
+        call_command(
+            'sales_report', '--incremental', '--state-file', self.state_path, '--output_dir', self.tmp_dir.name,
+            '--period', 'days:7', '--workers', '1', '--quiet', *args, stdout=StringIO(),
+        )
+
+    def test_report_and_state(self):
+        self.report('--format', 'json')
+        [report_path] = [name for name in os.listdir(self.tmp_dir.name) if name.startswith('sales_report_')]
+        with open(os.path.join(self.tmp_dir.name, report_path), encoding='utf-8') as f:
+            records = json.load(f)['records']
+        totals = next(record for record in records if record['section'] == 'period_totals')
+        self.assertEqual((totals['paid_orders'], totals['paid_amount']), (1, '30.00'))
+        customers = [record for record in records if record['section'] == 'customer_ranking']
+        self.assertEqual([(record['username'], record['total_spent']) for record in customers], [('reader', '30.00')])
+        self.assertEqual(report_state.load_state(self.state_path)['last_order_id'], Order.objects.get().pk)
+
+    def test_failed_report_does_not_save_state(self):
+        with mock.patch('catalog.management.commands.sales_report.book_sales_for_period', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.report('--format', 'json')
+        self.assertFalse(os.path.exists(self.state_path))
+
+
+class ReportWriterTests(TestCase):
+    """机器可读报告：正常结束时生成完整文件，中途出错时不留下文件"""
+
+    record = {'rank': 1, 'name': '张三', 'username': 'reader', 'total_spent': Decimal('10.00')}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.base_path = os.path.join(self.tmp_dir.name, 'report')
+
+    def test_complete_report(self):
+        with report_writers.JsonReportWriter(self.base_path, timezone.now()) as writer:
+            writer.write('customer_ranking', self.record)
+        with open(writer.paths[0], encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['records'][0]['name'], '张三')
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['report.json'])
+
+    def test_failed_report_leaves_no_files(self):
+        for writer_class in report_writers.WRITERS.values():
+            with self.assertRaises(RuntimeError):
+                with writer_class(self.base_path, timezone.now()) as writer:
+                    writer.write('customer_ranking', self.record)
+                    raise RuntimeError('查询失败')
+            self.assertEqual(writer.paths, [])
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+
+def feed_record(isbn, title, stock=10, price='58.00元', **fields):
+    return {'isbn': isbn, 'title': title, 'stock': stock, 'price': price, **fields}
+
+
+class ImportBooksTestMixin:
+    """把记录写成源文件并运行 import_books，返回命令输出"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def write_feed(self, records, name='books.json'):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+        return path
+
+    def import_books(self, path, *args):
+        out = StringIO()
+        call_command('import_books', path, *args, '--progress-every', '0', stdout=out)
+        return out.getvalue()
+
+
+class ImportBooksTests(ImportBooksTestMixin, TestCase):
+
+    def test_upsert_keeps_search_index_in_sync(self):
+        self.import_books(self.write_feed([
+            feed_record('9780000000001', '深入理解计算机系统'),
+            feed_record('9780000000002', '算法导论'),
+        ]))
+        self.assertEqual(search.search_isbns('计算机系统'), ['9780000000001'])
+
+        self.import_books(self.write_feed([
+            feed_record('9780000000001', '计算机程序的构造和解释', stock=3),
+            feed_record('9780000000003', '编译原理'),
+        ]))
+        self.assertEqual(Book.objects.count(), 3)
+        book = Book.objects.get(isbn='9780000000001')
+        self.assertEqual((book.title, book.stock), ('计算机程序的构造和解释', 3))
+        self.assertEqual(search.search_isbns('计算机系统'), [])
+        self.assertEqual(search.search_isbns('程序的构造'), ['9780000000001'])
+        self.assertEqual(search.search_isbns('编译原理'), ['9780000000003'])
+
+    def test_invalid_records_are_skipped(self):
+        output = self.import_books(self.write_feed([
+            feed_record('9780000000001', '有效记录'),
+            feed_record('9780000000002', '负库存', stock=-1),
+            feed_record('9780000000003', None),
+            feed_record('9780000000004', '库存溢出', stock=1e30),
+            feed_record('97800000000050', 'ISBN 过长'),
+            feed_record('9780000000006', '作者不是字符串', author=['张三']),
+            feed_record('9780000000007', '书名过长' * 30),
+            {'isbn': '9780000000008', 'title': '缺少库存'},
+            feed_record('9780000000009', '另一条有效记录', stock='5'),
+        ]))
+        self.assertIn('Skipped 7 invalid records', output)
+        self.assertEqual(
+            dict(Book.objects.values_list('isbn', 'stock')),
+            {'9780000000001': 10, '9780000000009': 5},
+        )
+
+
+class ImportFeedFormatTests(ImportBooksTestMixin, TestCase):
+    """JSON 数组、JSON Lines、CSV 导入结果一致，价格按 Decimal 解析"""
+
+    records = [
+        feed_record('9780000000001', '深入理解计算机系统', price='58.00元', author='Randal E. Bryant', summary='概要'),
+        feed_record('9780000000002', '算法导论', price='54元', press='机械工业出版社'),
+        feed_record('9780000000003', '编译原理', price='0.1', stock=0),
+    ]
+
+    def _books(self):
+        return list(Book.objects.order_by('isbn').values())
+
+    def test_price_is_parsed_as_decimal(self):
+        self.assertEqual(feeds.clean_price('58.00元'), Decimal('58.00'))
+        self.assertEqual(feeds.clean_price(' 54元 '), Decimal('54.00'))
+        self.assertEqual(feeds.clean_price(Decimal('19.9')), Decimal('19.90'))
+        self.assertEqual(feeds.clean_price('价格面议'), Decimal('0.00'))
+        self.assertEqual(feeds.clean_record('{"isbn": "1", "title": "t", "stock": 1, "price": 0.1}')['price'],
+                         Decimal('0.10'))
+
+    def test_formats_produce_the_same_books(self):
+        self.import_books(self.write_feed(self.records))
+        expected = self._books()
+        self.assertEqual(expected[0]['price'], Decimal('58.00'))
+
+        jsonl_path = os.path.join(self.tmp_dir.name, 'books.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            for record in self.records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        csv_path = os.path.join(self.tmp_dir.name, 'books.csv')
+        with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, ['isbn', 'title', 'summary', 'author', 'press', 'price', 'stock'])
+            writer.writeheader()
+            writer.writerows(self.records)
+
+        for path in (jsonl_path, csv_path):
+            Book.objects.all().delete()
+            self.import_books(path)
+            self.assertEqual(self._books(), expected, path)
+
+    def test_array_split_across_read_chunks(self):
+        text = json.dumps(self.records, ensure_ascii=False)
+        for chunk_size in (1, 7, 64):
+            self.assertEqual(list(feeds.iter_json_array(StringIO(text), chunk_size)), self.records)
+
+
+class ImportDiffTests(ImportBooksTestMixin, TestCase):
+    """增量导入只写入新增和变化的书籍，--delete-missing 删除或下架源文件中已没有的书籍"""
+
+    def setUp(self):
+        super().setUp()
+        self.import_books(self.write_feed([
+            feed_record('9780000000001', '深入理解计算机系统'),
+            feed_record('9780000000002', '算法导论'),
+            feed_record('9780000000003', '编译原理'),
+        ]))
+
+    def test_diff_counts(self):
+        output = self.import_books(self.write_feed([
+            feed_record('9780000000001', '深入理解计算机系统'),
+            feed_record('9780000000002', '算法导论', stock=7),
+            feed_record('9780000000003', '编译原理'),
+            feed_record('9780000000004', '计算机网络'),
+        ]), '--diff', '--batch-size', '2')
+        self.assertIn('Successfully imported 2 books', output)
+        self.assertIn('新增 1，更新 1，未变化 2', output)
+        self.assertEqual(Book.objects.get(isbn='9780000000002').stock, 7)
+        self.assertEqual(search.search_isbns('计算机网络'), ['9780000000004'])
+
+    def test_diff_keeps_local_changes_until_the_record_changes(self):
+        Book.objects.filter(isbn='9780000000001').update(stock=4)  # 售出后的库存
+        output = self.import_books(self.write_feed([
+            feed_record('9780000000001', '深入理解计算机系统'),
+        ]), '--diff')
+        self.assertIn('新增 0，更新 0，未变化 1', output)
+        self.assertEqual(Book.objects.get(isbn='9780000000001').stock, 4)
+
+    def test_delete_missing(self):
+        order = Order.objects.create(status='U', final_total_amount=Decimal('58.00'))
+        OrderItem.objects.create(order=order, book_id='9780000000001', count=1, price=Decimal('58.00'))
+        cart = Cart.objects.create(session_key='session')
+        expires_at = timezone.now() + timedelta(minutes=30)
+        for isbn in ('9780000000001', '9780000000002', '9780000000003'):
+            CartItem.objects.create(cart=cart, book_id=isbn, price_at_addition=Decimal('58.00'))
+            StockReservation.objects.create(book_id=isbn, holder_key='holder', quantity=1, expires_at=expires_at)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            output = self.import_books(self.write_feed([
+                feed_record('9780000000003', '编译原理'),
+            ]), '--diff', '--delete-missing')
+        self.assertIn('删除 1，下架（有订单记录，库存清零） 1', output)
+        # 被删除的书籍不逐本登记缓存和内存索引的更新
+        self.assertEqual(callbacks, [])
+
+        retired = Book.objects.get(isbn='9780000000001')
+        self.assertEqual((retired.stock, retired.import_hash), (0, ''))
+        self.assertFalse(Book.objects.filter(isbn='9780000000002').exists())
+        # 下架书籍的购物车项和预留也被删除，预留过期时不会把库存退回
+        self.assertEqual(list(CartItem.objects.values_list('book_id', flat=True)), ['9780000000003'])
+        self.assertEqual(list(StockReservation.objects.values_list('book_id', flat=True)), ['9780000000003'])
+        inventory.release_expired(now=expires_at + timedelta(minutes=1))
+        self.assertEqual(Book.objects.get(isbn='9780000000001').stock, 0)
+        self.assertEqual(search.search_isbns('算法导论'), [])
+        self.assertEqual(search.search_isbns('深入理解计算机系统'), ['9780000000001'])
+
+    def test_delete_missing_is_skipped_after_invalid_records(self):
+        output = self.import_books(self.write_feed([
+            feed_record('9780000000003', '编译原理'),
+            feed_record('9780000000004', '负库存', stock=-1),
+        ]), '--diff', '--delete-missing')
+        self.assertIn('未删除源文件中缺失的书籍', output)
+        self.assertEqual(Book.objects.count(), 3)
+
+
+class ImportWorkersTests(ImportBooksTestMixin, TestCase):
+    """--workers N 由子进程解析和清洗，结果与单进程一致"""
+
+    def _feed(self):
+        records = [feed_record(f'97800000000{i:02d}', f'书名{i}', stock=i, price=f'{i}.50元') for i in range(30)]
+        records[3]['price'] = 1e30
+        records[7]['stock'] = -1
+        records[11]['title'] = None
+        return records
+
+    def test_array_elements_split_across_read_chunks(self):
+        records = self._feed()
+        text = json.dumps(records, ensure_ascii=False)
+        for chunk_size in (1, 7, 64):
+            items = list(feeds.iter_json_array_text(StringIO(text), chunk_size))
+            self.assertEqual([json.loads(item) for item in items], records)
+
+    def test_clean_records_in_order(self):
+        raw = [json.dumps(record, ensure_ascii=False) for record in self._feed()] + ['{broken', '[' * 100000]
+        sequential = list(feeds.clean_records(raw, workers=1))
+        parallel = list(feeds.clean_records(raw, workers=2, chunk_size=4))
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([number for number, record, error in sequential if error], [4, 8, 12, 31, 32])
+
+    def test_workers_produce_the_same_books(self):
+        path = self.write_feed(self._feed())
+        output = self.import_books(path, '--workers', '1')
+        self.assertIn('Skipped 3 invalid records', output)
+        expected = list(Book.objects.order_by('isbn').values())
+
+        Book.objects.all().delete()
+        output = self.import_books(path, '--workers', '2')
+        self.assertIn('Skipped 3 invalid records', output)
+        self.assertEqual(list(Book.objects.order_by('isbn').values()), expected)
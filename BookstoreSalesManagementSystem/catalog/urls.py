@@ -5,6 +5,8 @@ from django.contrib.auth import views as auth_views
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
+    path('books/autocomplete/', views.book_autocomplete, name='book_autocomplete'),
+    path('books/api/', views.BookListJsonView.as_view(), name='book_list_api'),
     path('books/<str:pk>/', views.BookDetailView.as_view(), name='book_detail'),
     path('orders/', views.OrderListView.as_view(), name='orders'),
     path('order/<int:pk>/', views.OrderDetailView.as_view(), name='order_detail'),
@@ -13,6 +15,8 @@ urlpatterns = [
     path('cart/clear/', views.clear_cart, name='clear_cart'),
     path('cart/', views.view_cart, name='view_cart'),
     path('checkout/', views.checkout, name='checkout'),
+    path('export/orders/', views.export_orders, name='export_orders'),
+    path('staff/customers/', views.customer_stats_api, name='customer_stats_api'),
 
     path('auth/login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('auth/logout/', auth_views.LogoutView.as_view(), name='logout'),
@@ -1,18 +1,22 @@
-from decimal import Decimal
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import transaction
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import Q, Prefetch
+from django.http import JsonResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from .forms import *
-from .models import Book, Order, OrderItem, Customer, Cart
+from . import autocomplete, book_cache, exports, fuzzy, inventory, pricing, rollup, search
+from .cart_store import get_cart_store
+from .pagination import KeysetPaginator, RankedPaginator, InvalidCursor
+from .models import Book, Order, OrderItem, Customer, Cart, CartItem
 from django.views import generic
 
-VIP_DISCOUNT_RATE = Decimal('0.9')
-
 
 def index(request):
     '''
@@ -32,24 +36,92 @@ class BookListView(generic.ListView):
     model = Book
     template_name = 'catalog/book_list.html'
     context_object_name = 'book_list'
+    paginate_by = 20
+    max_paginate_by = 100
+    # 列表页只需要这些列，避免把 summary 等大字段读出来
+    list_fields = ('isbn', 'title', 'author', 'price', 'stock')
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = Book.objects.only(*self.list_fields)
         query = self.request.GET.get('q')
+        self.ranked_isbns = None
 
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) | Q(author__icontains=query)
-            ).distinct()
+            ranked_isbns = search.search_isbns(query)
+            if not ranked_isbns and getattr(settings, 'FUZZY_SEARCH_ENABLED', True):
+                # 全文索引无结果（查询词过短、拼音、错字等）时使用内存中的模糊/拼音索引
+                ranked_isbns = fuzzy.search_isbns(query)
+            if ranked_isbns is not None:
+                # 排序与分页交给 RankedPaginator 按相关度完成
+                self.ranked_isbns = ranked_isbns
+            else:
+                # 两种索引都不可用时回退到模糊匹配
+                queryset = queryset.filter(
+                    Q(title__icontains=query) | Q(author__icontains=query)
+                )
 
         return queryset
 
+    def get_paginate_by(self, queryset):
+        try:
+            page_size = int(self.request.GET.get('page_size', self.paginate_by))
+        except ValueError:
+            page_size = self.paginate_by
+        return min(max(page_size, 1), self.max_paginate_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        """用游标分页代替 OFFSET 分页，返回值与 MultipleObjectMixin 约定一致"""
+        if self.ranked_isbns is not None:
+            paginator = RankedPaginator(queryset, self.ranked_isbns, page_size)
+        else:
+            paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('无效的分页游标')
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        # 用户指定了每页数量时，翻页链接需要带上（取校正后的值）
+        context['page_size'] = self.get_paginate_by(None) if 'page_size' in self.request.GET else None
         return context
 
 
+class BookListJsonView(BookListView):
+    """与 BookListView 相同的检索和游标分页，以 JSON 形式提供给前端客户端"""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({'status': 'error', 'msg': '无效的分页游标'}, status=400)
+
+    def render_to_response(self, context, **response_kwargs):
+        page = context['page_obj']
+        return JsonResponse({
+            'status': 'success',
+            'results': [{field: getattr(book, field) for field in self.list_fields} for book in page],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        })
+
+
+def book_autocomplete(request):
+    """搜索框联想：返回以 q 开头的书名、作者和 ISBN"""
+    query = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', autocomplete.DEFAULT_LIMIT))
+    except ValueError:
+        limit = autocomplete.DEFAULT_LIMIT
+    return JsonResponse({
+        'status': 'success',
+        'query': query,
+        'suggestions': autocomplete.suggest(query, limit=limit),
+    })
+
+
 class BookDetailView(generic.DetailView):
     model = Book
 
@@ -68,7 +140,9 @@ class OrderListView(LoginRequiredMixin, generic.ListView):  # 3. 继承 LoginReq
 
         try:
             customer_profile = user.customer
-            queryset = Order.objects.filter(customer=customer_profile).order_by('-order_date')
+            # 列表只用到订单自身的冗余字段（item_count、line_summary），无需查询订单项
+            queryset = Order.objects.filter(customer=customer_profile).select_related('customer') \
+                .order_by('-order_date')
         except Customer.DoesNotExist:
             queryset = Order.objects.none()
         except AttributeError:
@@ -89,46 +163,118 @@ class OrderDetailView(LoginRequiredMixin, generic.DetailView):
 
     def get_queryset(self):
         user = self.request.user
+        # 顾客和订单项（含书籍）一次取出，查询次数与订单大小无关
+        queryset = Order.objects.select_related('customer').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('book').order_by('order_item_id'))
+        )
         if user.is_staff:
-            return Order.objects.all().order_by('-order_date')  # 管理员查看所有，加排序
+            return queryset.order_by('-order_date')  # 管理员查看所有，加排序
         try:
             customer = user.customer
-            return Order.objects.filter(customer=customer).order_by('-order_date')  # 用户查看自己的，加排序
+            return queryset.filter(customer=customer).order_by('-order_date')  # 用户查看自己的，加排序
         except (Customer.DoesNotExist, AttributeError):
             return Order.objects.none()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        order = self.get_object()  # self.object 也一样
+        order = self.object  # DetailView.get 已经取出订单，不再调用 get_object() 重复查询
         context['page_title'] = f"订单详情 #{order.order_id}"
         # 所有需要的数据都可以通过 {{ order }} 对象及其关联对象在模板中获取
         return context
 
 
+def _parse_date_param(request, name):
+    """读取 YYYY-MM-DD 格式的查询参数，缺省返回 None，格式错误抛出 ValueError"""
+    value = request.GET.get(name)
+    if not value:
+        return None
+    day = parse_date(value)  # 日期不存在（如 2月30日）时同样抛出 ValueError
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+@staff_member_required
+def export_orders(request):
+    """
+    员工导出订单（type=orders）或订单项（type=items，默认），format=csv|jsonl，
+    可按 start / end（YYYY-MM-DD，含两端）和 status（P/U）筛选，以流式响应逐块发送。
+    """
+    export_type = request.GET.get('type', 'items')
+    export_format = request.GET.get('format', 'csv')
+    status = request.GET.get('status') or None
+    if export_type not in exports.EXPORT_TYPES or export_format not in exports.EXPORT_FORMATS:
+        return HttpResponseBadRequest('无效的导出类型或格式')
+    if status and status not in dict(Order.STATUS_CHOICES):
+        return HttpResponseBadRequest('无效的订单状态')
+    try:
+        start_date = _parse_date_param(request, 'start')
+        end_date = _parse_date_param(request, 'end')
+    except ValueError:
+        return HttpResponseBadRequest('日期格式应为 YYYY-MM-DD')
+
+    header, rows = exports.export_rows(export_type, start_date, end_date, status)
+    content_type = 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(exports.iter_export(export_format, header, rows), content_type=content_type)
+    filename = f"{export_type}_{timezone.localtime():%Y%m%d_%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def customer_stats_api(request):
+    """
+    员工用：按累计消费排序的顾客列表（JSON）。读取 Customer 上冗余的累计值（带索引），不扫描订单。
+    参数 limit（默认 20，最多 100），min_orders（只列出已支付订单数不少于该值的顾客，默认 1）。
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        min_orders = max(int(request.GET.get('min_orders', 1)), 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'msg': '无效的参数'}, status=400)
+
+    customers = Customer.objects.filter(paid_order_count__gte=min_orders).order_by('-lifetime_spend') \
+        .values('user__username', 'name', 'vip_status', 'lifetime_spend', 'paid_order_count')[:limit]
+    return JsonResponse({
+        'status': 'success',
+        'results': [
+            {
+                'username': row['user__username'],
+                'name': row['name'],
+                'is_vip': row['vip_status'],
+                'lifetime_spend': f"{row['lifetime_spend']:.2f}",
+                'paid_order_count': row['paid_order_count'],
+            }
+            for row in customers
+        ],
+    })
+
+
 def add_to_cart(request, isbn):
     if request.method == 'POST':  # 确保是 POST 请求
         try:
-            book = Book.objects.get(isbn=isbn)
+            book = book_cache.get_book(isbn)
             quantity = int(request.POST.get('quantity', 1))
+            if quantity <= 0:
+                raise ValueError(quantity)
 
-            # 直接扣减总库存
-            with transaction.atomic():
-                if book.stock >= quantity:
-                    book.stock -= quantity
-                    book.save()  # 保存更新后的库存
+            # 原子地扣减库存并记录预留，过期未结算的预留会退回库存
+            try:
+                new_stock = inventory.reserve(inventory.get_holder_key(request), book.isbn, quantity)
+            except inventory.InsufficientStock:
+                return JsonResponse({'status': 'error', 'msg': '库存不足'})
 
-                    cart = request.session.get('cart', {})
-                    cart_item = cart.get(book.isbn, {'quantity': 0})
-                    cart_item['quantity'] += quantity
+            cart_store = get_cart_store(request)
+            cart = cart_store.load()
+            cart_item = cart.get(book.isbn, {'quantity': 0})
+            cart_item['quantity'] += quantity
 
-                    cart[book.isbn] = cart_item
-                    request.session['cart'] = cart
+            cart[book.isbn] = cart_item
+            cart_store.save(cart)
 
-                    # 在成功的响应中返回新的库存数量
-                    return JsonResponse({'status': 'success', 'new_stock': book.stock,
-                                         'cart_total_items': sum(item['quantity'] for item in cart.values())})
-                else:
-                    return JsonResponse({'status': 'error', 'msg': '库存不足'})
+            # 在成功的响应中返回新的库存数量
+            return JsonResponse({'status': 'success', 'new_stock': new_stock,
+                                 'cart_total_items': sum(item['quantity'] for item in cart.values())})
         except Book.DoesNotExist:
             return JsonResponse({'status': 'error', 'msg': '书籍不存在'})
         except ValueError:  # 处理 quantity 不是有效数字的情况
@@ -139,11 +285,11 @@ def add_to_cart(request, isbn):
 
 
 def view_cart(request):
-    session_cart_dict = request.session.get('cart', {})
-    cart_items_for_template = []
-
-    grand_total_original = Decimal('0.00')
-    grand_total_effective = Decimal('0.00')
+    cart_store = get_cart_store(request)
+    session_cart_dict = cart_store.load()
+    holder_key = inventory.get_holder_key(request, create=False)
+    if holder_key and session_cart_dict:
+        inventory.touch(holder_key)  # 访客仍在浏览购物车，延长库存预留
 
     is_current_user_vip = False
     if request.user.is_authenticated:
@@ -155,83 +301,36 @@ def view_cart(request):
         except AttributeError:
             pass
 
-    valid_cart_items_exist = False
-    items_to_remove_from_session = []
+    # 一次取出所有书籍并单次遍历计价
+    cart_pricing, removed = pricing.price_session_cart(session_cart_dict, is_current_user_vip)
 
-    for isbn, item_data in list(session_cart_dict.items()):
-        try:
-            book = Book.objects.get(isbn=isbn)
-            quantity = int(item_data.get('quantity', 0))
-
-            if quantity <= 0:
-                items_to_remove_from_session.append(isbn)
-                continue
-
-            valid_cart_items_exist = True
-            original_price_each = book.price
-            effective_price_each = original_price_each
-            item_has_discount = False
-
-            if is_current_user_vip:
-                effective_price_each = (original_price_each * VIP_DISCOUNT_RATE).quantize(Decimal('0.01'))
-                item_has_discount = True
-
-            subtotal_original_for_item = original_price_each * quantity
-            subtotal_effective_for_item = effective_price_each * quantity
-
-            grand_total_original += subtotal_original_for_item
-            grand_total_effective += subtotal_effective_for_item
-
-            cart_items_for_template.append({
-                'book': book,
-                'quantity': quantity,
-                'original_price_each': original_price_each,
-                'effective_price_each': effective_price_each,
-                'subtotal_effective': subtotal_effective_for_item,
-                'item_has_discount': item_has_discount,
-            })
-        except Book.DoesNotExist:
-            messages.warning(request, f"购物车中的书籍 (ISBN: {isbn}) 已不存在，已将其移除。")
-            items_to_remove_from_session.append(isbn)
-            continue
-        except (ValueError, TypeError):
-            messages.error(request, f"购物车中书籍 ISBN {isbn} 的数量信息有误，已移除。")
-            items_to_remove_from_session.append(isbn)
-            continue
-
-    if items_to_remove_from_session:
-        cart_modified = False
-        current_session_cart = request.session.get('cart', {})
-        for isbn_to_remove in items_to_remove_from_session:
-            if isbn_to_remove in current_session_cart:
-                del current_session_cart[isbn_to_remove]
-                cart_modified = True
-        if cart_modified:
-            request.session['cart'] = current_session_cart
-            request.session.modified = True
-
-    vip_discount_applied_on_cart = is_current_user_vip and valid_cart_items_exist and (
-            grand_total_effective < grand_total_original)
-
-    discount_amount_for_cart = Decimal('0.00')
-    if vip_discount_applied_on_cart:
-        discount_amount_for_cart = grand_total_original - grand_total_effective  # <--- 计算优惠金额
+    if removed:
+        for isbn, reason in removed.items():
+            if reason == 'missing':
+                messages.warning(request, f"购物车中的书籍 (ISBN: {isbn}) 已不存在，已将其移除。")
+            elif reason == 'invalid':
+                messages.error(request, f"购物车中书籍 ISBN {isbn} 的数量信息有误，已移除。")
+        for isbn_to_remove in removed:
+            session_cart_dict.pop(isbn_to_remove, None)
+        cart_store.save(session_cart_dict)
 
     context = {
-        'cart_items': cart_items_for_template,
-        'total_original': grand_total_original,
-        'total_effective': grand_total_effective,
+        'cart_items': cart_pricing.lines,
+        'total_original': cart_pricing.total_original,
+        'total_effective': cart_pricing.total_effective,
         'is_vip_user': is_current_user_vip,
-        'vip_discount_applied_on_cart': vip_discount_applied_on_cart,  # 标记整个购物车是否应用了折扣
-        'discount_amount_cart': discount_amount_for_cart,  # <--- 将计算出的优惠金额传递给模板
+        'vip_discount_applied_on_cart': cart_pricing.vip_discount_applied,  # 标记整个购物车是否应用了折扣
+        'discount_amount_cart': cart_pricing.discount_amount,
     }
     return render(request, 'catalog/session_cart.html', context)
 
 
 def checkout(request):
     cart = get_cart(request)
+    # 一次取出购物车行、书籍和顾客并计价，页面展示和订单创建共用这份快照
+    cart_pricing = pricing.price_cart(cart) if cart is not None else None
 
-    if cart is None or not cart.items.exists():  # 或者你的购物车判空逻辑
+    if cart_pricing is None or cart_pricing.is_empty:
         messages.info(request, "您的购物车是空的。")
         return redirect('view_cart')  # 假设 'view_cart' 是你的购物车页面URL名称
 
@@ -253,7 +352,7 @@ def checkout(request):
                     if order_customer.name != name or order_customer.phone != phone:
                         order_customer.name = name
                         order_customer.phone = phone
-                        order_customer.save()
+                        order_customer.save(update_fields=['name', 'phone'])  # 不覆盖累计消费等由订单维护的字段
                 except Customer.DoesNotExist:
                     # 如果认证用户没有 Customer 对象，则为他们创建一个
                     order_customer = Customer.objects.create(user=request.user, name=name, phone=phone)
@@ -271,12 +370,13 @@ def checkout(request):
             # 如果之前的 form.add_error() 仅用于账户创建，那么这里的 form.errors 检查也可以简化
             # 但保留它以防 CheckoutForm 本身有其他验证可能添加错误
             if form.errors:
-                return render(request, 'catalog/checkout.html', {'form': form, 'cart': cart})
+                return render(request, 'catalog/checkout.html',
+                              {'form': form, 'cart': cart, 'cart_pricing': cart_pricing})
 
             # ---- 创建订单 Order 和订单项 OrderItem ----
-            order_original_total = cart.original_total_amount  # 确保 cart 对象有这些属性
-            order_final_total = cart.total_amount
-            vip_discount_was_applied = cart.is_vip_discount_active
+            order_original_total = cart_pricing.total_original
+            order_final_total = cart_pricing.total_effective
+            vip_discount_was_applied = cart_pricing.vip_discount_applied
 
             try:
                 with transaction.atomic():
@@ -286,6 +386,7 @@ def checkout(request):
                         status=order_status_from_form,  # 例如 'U'
                         vip_discount_applied=vip_discount_was_applied
                     )
+                    new_order.set_line_summary((line.book.title, line.quantity) for line in cart_pricing.lines)
 
                     if order_customer:  # 如果用户已登录且 Customer 对象存在
                         new_order.customer = order_customer
@@ -299,14 +400,22 @@ def checkout(request):
 
                     new_order.save()
 
-                    for cart_item_db in cart.items.all():  # 假设 cart.items.all() 返回 CartItem 实例
-                        OrderItem.objects.create(
+                    # 一条（分批的）INSERT 写入所有订单项
+                    order_items = OrderItem.objects.bulk_create([
+                        OrderItem(
                             order=new_order,
-                            book=cart_item_db.book,
-                            count=cart_item_db.quantity,
-                            price=cart_item_db.effective_price_each,  # 确保 CartItem 有这些字段
-                            original_unit_price=cart_item_db.price_at_addition
+                            book=line.book,
+                            count=line.quantity,
+                            price=line.effective_price_each,
+                            original_unit_price=line.original_price_each
                         )
+                        for line in cart_pricing.lines
+                    ])
+                    if new_order.status == rollup.PAID:
+                        rollup.record_paid_order(new_order, order_items)  # 计入每日销售汇总和顾客累计消费
+
+                    # 预留转为销售：已预留的直接消耗，未预留的部分在此补扣，所有书籍一条 UPDATE
+                    inventory.commit(inventory.get_holder_key(request, create=False), cart_pricing.quantities())
 
                     # 订单成功创建后清空购物车
                     # 具体实现方式取决于你的购物车是如何工作的
@@ -320,6 +429,8 @@ def checkout(request):
 
                 messages.success(request, f"订单 #{new_order.order_id} 已成功提交！")  # 假设 Order 有 order_id
                 return redirect('order_detail', pk=new_order.order_id)  # 假设 'order_detail' 是订单详情页的URL名
+            except inventory.InsufficientStock as e:
+                form.add_error(None, f"书籍 (ISBN: {e.isbn}) 库存不足，请修改购物车后重试。")
             except Exception as e:
                 messages.error(request, f"创建订单过程中发生系统错误: {e}")
                 # 记录错误 e
@@ -347,14 +458,55 @@ def checkout(request):
     context = {
         'form': form,
         'cart': cart,
+        'cart_pricing': cart_pricing,
     }
     return render(request, 'catalog/checkout.html', context)  # 你的结账页面模板
 
 
+def merge_session_cart(db_cart, session_cart_data):
+    """
+    把 session 购物车合并到数据库购物车：一次批量取书、一次取出已有的购物车行，
+    再用 bulk_create / bulk_update 写入，查询次数与商品数量无关。
+    """
+    quantities = {}
+    for isbn, item_details in session_cart_data.items():
+        try:
+            quantity = int(item_details.get('quantity', 0))
+        except (ValueError, TypeError, AttributeError):  # 数量信息有误的条目直接丢弃
+            continue
+        if quantity > 0:
+            quantities[isbn] = quantity
+
+    books = book_cache.get_many(quantities.keys())
+    quantities = {isbn: quantity for isbn, quantity in quantities.items() if isbn in books}  # 已不存在的书籍丢弃
+    if not quantities:
+        return
+
+    with transaction.atomic():  # 使用数据库事务确保数据一致性
+        existing_items = {
+            item.book_id: item
+            for item in CartItem.objects.select_for_update().filter(cart=db_cart, book_id__in=list(quantities))
+        }
+        items_to_create = []
+        items_to_update = []
+        for isbn, quantity in quantities.items():
+            price = books[isbn].price  # 记录/更新为当前价格，以防变动
+            item = existing_items.get(isbn)
+            if item is None:
+                items_to_create.append(CartItem(cart=db_cart, book_id=isbn, quantity=quantity, price_at_addition=price))
+            else:
+                item.quantity += quantity  # 累加，与 add_to_cart 字典行为一致
+                item.price_at_addition = price
+                items_to_update.append(item)
+        CartItem.objects.bulk_create(items_to_create)
+        CartItem.objects.bulk_update(items_to_update, ['quantity', 'price_at_addition'])
+
+
 def get_cart(request):
     user = request.user
     db_cart = None  # 这将是我们要返回的数据库 Cart 对象
-    session_cart_data = request.session.get('cart', {})  # 这是 add_to_cart 等视图操作的 session 字典
+    cart_store = get_cart_store(request)
+    session_cart_data = cart_store.load()  # 这是 add_to_cart 等视图操作的访客购物车字典
 
     if user.is_authenticated:
         try:
@@ -373,84 +525,40 @@ def get_cart(request):
         db_cart, cart_created = Cart.objects.get_or_create(session_key=session_key, customer__isnull=True)
 
     if session_cart_data and db_cart:  # 确保 db_cart 已成功获取或创建
-        items_were_merged = False
-        with transaction.atomic():  # 使用数据库事务确保数据一致性
-            for isbn, item_details in list(session_cart_data.items()):  # 用 list() 复制，以便在循环中删除
-                try:
-                    book = Book.objects.get(isbn=isbn)
-                    quantity_from_session = int(item_details.get('quantity', 0))
-
-                    if quantity_from_session <= 0:
-                        # 如果 session 中的数量无效，可以从 session 字典中移除
-                        del request.session['cart'][isbn]
-                        items_were_merged = True  # 标记 session 有变动
-                        continue
-
-                    # 获取或创建数据库 CartItem
-                    cart_item_db, item_db_created = db_cart.items.get_or_create(
-                        book=book,
-                        defaults={
-                            'quantity': quantity_from_session,
-                            'price_at_addition': book.price  # 记录添加时的价格
-                        }
-                    )
-
-                    if not item_db_created:
-                        cart_item_db.quantity += quantity_from_session  # 改为累加，与 add_to_cart 字典行为一致
-                        cart_item_db.price_at_addition = book.price  # 更新价格，以防变动
-                        cart_item_db.save()
-
-                    items_were_merged = True
-
-                except Book.DoesNotExist:
-                    if isbn in request.session['cart']:
-                        del request.session['cart'][isbn]
-                    items_were_merged = True  # 标记 session 有变动
-                    continue
-                except ValueError:  # quantity 转换 int 失败
-                    if isbn in request.session['cart']:
-                        del request.session['cart'][isbn]
-                    items_were_merged = True  # 标记 session 有变动
-                    continue
-
-        if items_were_merged:
-            # 如果发生了合并或清理，清空原始的 session 字典购物车部分，并标记 session 已修改
-            # 实际上，在循环中逐个删除后，这里可以直接设为空字典
-            request.session['cart'] = {}  # 清空，因为所有内容都已尝试合并到数据库
-            request.session.modified = True
+        merge_session_cart(db_cart, session_cart_data)
+        # 所有内容都已尝试合并到数据库（无效或已下架的条目直接丢弃），清空访客购物车
+        cart_store.clear()
 
     return db_cart
 
 
 def update_cart(request):
-    cart = request.session.get('cart', {})
+    cart_store = get_cart_store(request)
+    cart = cart_store.load()
     for key in request.POST:
         if key.startswith('quantity_'):
             isbn = key.split('_', 1)[1]
             try:
                 qty = int(request.POST[key])
                 if qty > 0:
-                    cart[isbn] = qty
+                    cart[isbn] = {'quantity': qty}
             except ValueError:
                 continue
-    request.session['cart'] = cart
+    cart_store.save(cart)
     return JsonResponse({'status': 'success'})
 
 
 def clear_cart(request):
-    cart = request.session.get('cart', {})
+    cart_store = get_cart_store(request)
+    cart = cart_store.load()
 
-    # 恢复库存
-    for isbn, item in cart.items():
-        try:
-            book = Book.objects.get(isbn=isbn)
-            book.stock += item['quantity']
-            book.save()
-        except Book.DoesNotExist:
-            pass
+    # 退回本访客预留的库存
+    holder_key = inventory.get_holder_key(request, create=False)
+    if holder_key:
+        inventory.release(holder_key, isbns=cart.keys())
 
-    # 清空session中的购物车
-    request.session['cart'] = {}
+    # 清空访客购物车
+    cart_store.clear()
     return redirect('view_cart')
 
 
@@ -502,7 +610,8 @@ def edit_profile_view(request):
     if request.method == 'POST':
         form = CustomerProfileForm(request.POST, instance=customer_instance)
         if form.is_valid():
-            form.save()
+            # 只写回表单中的字段，不覆盖累计消费等由订单维护的字段
+            form.save(commit=False).save(update_fields=list(form.fields))
             messages.success(request, '您的个人资料已成功更新！')
             return redirect('profile_edit')  # 或其他成功后跳转的页面
     else: